@@ -0,0 +1,204 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+from ledger import NUMERIC_COLUMNS, RESULT_COLUMNS, SHARE_COLUMNS, TEXT_COLUMNS, Ledger, TradeSums, format_number, parse_date, parse_number
+from lots import LOT_METHODS
+from rollups import STATISTICS, RollupSummary
+
+
+TRADE_COLUMNS = ("open_date", "ticker", "long_short", "fills") + RESULT_COLUMNS
+SUMMARY_COLUMNS = ("ticker",) + STATISTICS + ("win_rate",)
+CENT_COLUMNS = ("total_cost", "cost_basis", "profit_loss", "net_percentage", "fees") # Integers in hundredths
+ALL_TICKERS = "ALL" # Ticker of the summary row over every trade
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+class TradeStream:
+    """Trade totals of a stream of fills, accumulated with the TradeSums of Ledger.calculate but without keeping the
+    fills.
+
+    Every trade group keeps running sums only. With sorted_input, fills must come in open date order and the trades of
+    a day are finished as soon as a later day starts, so memory is bounded by one day of trades. Otherwise trades are
+    finished when the stream ends.
+
+    With a lot_method, closes are matched to opens across trades like the GUI does, which needs every fill: they are
+    collected in a Ledger and calculated by it once the stream ends.
+    """
+
+    def __init__(self, sorted_input: bool=False, lot_method: str=None):
+        """Create a stream without trades."""
+        if sorted_input and lot_method:
+            raise ValueError("Lot matching needs every fill, it cannot finish trades as days end")
+
+        self.sorted_input = sorted_input
+        self.lot_method = lot_method
+        self.groups = {} # {(open_date, ticker, long_short): TradeSums}
+        self.day = None # Ordinal of the open date being streamed, with sorted input
+        self.statistics = {} # {ticker: [trades, wins, profit_loss, volume, fees]} of the finished trades
+
+    def trades(self, rows):
+        """Yield (key, fills, TradeTotals) of every trade of rows, {column_name: value} dicts, as trades finish."""
+        if self.lot_method:
+            yield from self.matched_trades(rows)
+            return
+
+        groups = self.groups
+
+        for row in rows:
+            key = tuple(str(row.get(column) or "") for column in TEXT_COLUMNS[:3])
+
+            if self.sorted_input:
+                date = parse_date(key[0])
+                if date is not None:
+                    day = date.toordinal()
+                    if self.day is not None and day < self.day:
+                        raise ValueError(f"Fill opened on {key[0]} after later fills, the input is not in open date order")
+                    if day != self.day:
+                        yield from self.finish()
+                        self.day = day
+
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = TradeSums()
+
+            group.add(*(parse_number(row.get(column), column in SHARE_COLUMNS) for column in NUMERIC_COLUMNS))
+
+        yield from self.finish()
+
+    def finish(self):
+        """Yield the trades held so far and add them to the statistics."""
+        for key, sums in self.groups.items():
+            yield self.finish_trade(key, sums, sums.totals())
+
+        self.groups.clear()
+
+    def matched_trades(self, rows):
+        """Yield the trades of rows with the profit/loss of lot matching, once every row is read."""
+        ledger = Ledger()
+        ledger.lot_method = self.lot_method
+        for row in rows:
+            ledger.append(row)
+
+        ledger.calculate()
+        for group, anchor in enumerate(ledger.anchors):
+            if anchor >= 0:
+                yield self.finish_trade(ledger.group_keys[group], ledger.group_sums(group), ledger.totals[anchor])
+
+    def finish_trade(self, key: tuple, sums: TradeSums, totals) -> tuple:
+        """Add a trade to the statistics and return its (key, fills, TradeTotals)."""
+        contribution = sums.statistics(totals.profit_loss)
+        for ticker in (key[1], ALL_TICKERS):
+            statistics = self.statistics.setdefault(ticker, [0] * len(STATISTICS))
+            for index, statistic in enumerate(STATISTICS):
+                statistics[index] += contribution[statistic]
+
+        return key, sums.fills, totals
+
+    def summaries(self) -> dict[str, RollupSummary]:
+        """Return {ticker: RollupSummary} of the finished trades sorted by ticker, then ALL_TICKERS summing every ticker."""
+        tickers = sorted(self.statistics, key=lambda ticker: (ticker == ALL_TICKERS, ticker))
+        return {ticker: RollupSummary(*self.statistics[ticker]) for ticker in tickers}
+
+
+def read_ledger_rows(paths: list[str]):
+    """Yield the fills of trade stores, snapshots and CSV files in any known broker layout, file by file."""
+    import broker_import
+    import exporter
+
+    for path in paths:
+        with open(path, "rb") as file:
+            is_store = file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+        if is_store:
+            from trade_store import TradeStore
+            store = TradeStore(path)
+            try:
+                yield from store.load()
+            finally:
+                store.close()
+        elif exporter.is_snapshot(path):
+            yield from exporter.iter_rows(exporter.read_snapshot(path))
+        else:
+            yield from broker_import.read_fills(path)
+
+
+def trade_records(stream: TradeStream, rows):
+    """Yield a {column: value} record per trade of rows, money in cents."""
+    for (open_date, ticker, long_short), fills, totals in stream.trades(rows):
+        yield {"open_date": open_date, "ticker": ticker, "long_short": long_short, "fills": fills, **totals._asdict()}
+
+
+def summary_records(stream: TradeStream, rows):
+    """Consume rows and yield a {column: value} record per ticker and one over every ticker, money in cents."""
+    for _ in stream.trades(rows):
+        pass
+
+    for ticker, summary in stream.summaries().items():
+        yield {"ticker": ticker, **summary._asdict(), "win_rate": round(summary.win_rate, 4)}
+
+
+def write_csv(records, columns: tuple[str, ...], file):
+    """Write records as CSV rows, one at a time."""
+    writer = csv.writer(file)
+    writer.writerow(columns)
+
+    for record in records:
+        writer.writerow([format_number(record[column]) if column in CENT_COLUMNS else record[column] for column in columns])
+
+
+def write_json(records, columns: tuple[str, ...], file):
+    """Write records as a JSON array of objects, one at a time."""
+    file.write("[")
+
+    for index, record in enumerate(records):
+        values = {column: record[column] / 100 if column in CENT_COLUMNS else record[column] for column in columns}
+        file.write(("," if index else "") + "\n" + json.dumps(values))
+
+    file.write("\n]\n")
+
+
+WRITERS = {"csv": write_csv, "json": write_json}
+
+
+def main(argv: list[str]=None) -> int:
+    """Calculate the trades of ledgers and write a per-trade or summary report. Returns the exit status."""
+    parser = argparse.ArgumentParser(prog="python -m tradetracker", description="Calculate the trades of ledgers without the GUI. Without arguments, or with only --virtual or --startup-profile, the GUI starts.")
+    parser.add_argument("paths", nargs="+", help="CSV files in any known broker layout, trade stores or snapshots, read in order as one ledger.")
+    parser.add_argument("--report", choices=("trades", "summary"), default="trades", help="One row per trade, or per ticker plus an ALL row.")
+    parser.add_argument("--format", choices=tuple(WRITERS), help="Output format, by default from the output file extension, else CSV.")
+    parser.add_argument("--output", default="-", help="Output file, '-' for stdout.")
+    parser.add_argument("--sorted", action="store_true", help="Fills are in open date order: write each day's trades as it ends, in bounded memory.")
+    parser.add_argument("--lots", choices=LOT_METHODS, help="Profit/loss of lot matching, like the GUI's Lots menu, instead of summing each trade. Reads every fill before writing.")
+    args = parser.parse_args(argv)
+
+    if args.sorted and args.lots:
+        parser.error("--lots cannot be combined with --sorted")
+
+    output_format = args.format or ("json" if os.path.splitext(args.output)[1].lower() == ".json" else "csv")
+    stream = TradeStream(sorted_input=args.sorted, lot_method=args.lots)
+    rows = read_ledger_rows(args.paths)
+
+    if args.report == "trades":
+        records, columns = trade_records(stream, rows), TRADE_COLUMNS
+    else:
+        records, columns = summary_records(stream, rows), SUMMARY_COLUMNS
+
+    try:
+        if args.output == "-":
+            WRITERS[output_format](records, columns, sys.stdout)
+        else:
+            with open(args.output, "w", newline="") as file:
+                WRITERS[output_format](records, columns, file)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import broker_import
+import exporter
+import lots
+
+from ledger import FILL_COLUMNS, Ledger
+
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+GENERATOR_VERSION = 2 # Part of the names of cached ledgers, bump it when generate_ledger writes something else
+TRADING_YEARS = 5 # Span of every synthetic ledger, larger ones have more trades per day
+TICKERS = ("SQQQ", "TQQQ", "SPY", "QQQ", "AAPL", "TSLA", "NVDA", "AMD", "SOXL", "SOXS", "IWM", "MSFT")
+
+
+def generate_ledger(path: str, fills: int, seed: int=0):
+    """Write a synthetic ledger of about `fills` fills in the test_tradetracker.csv layout.
+
+    Trades have 1 to 3 opening fills. Most are closed in full on the trade's first fill, the way the 09/06 SQQQ
+    trade of test_tradetracker.csv is, some are closed partially and some stay open. Trades are spread evenly over
+    the weekdays of TRADING_YEARS years in date order, so larger ledgers have more trades per day rather than more
+    days. Dates have 4-digit years.
+    """
+    rng = random.Random(seed)
+    first_day = datetime.date(2020, 1, 2)
+    days = [day for day in (first_day + datetime.timedelta(days=offset) for offset in range(round(TRADING_YEARS * 365.25))) if day.weekday() < 5]
+    written = 0
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(FILL_COLUMNS)
+
+        while written < fills:
+            open_date = days[written * len(days) // fills].strftime("%m/%d/%Y")
+            ticker, long_short = rng.choice(TICKERS), rng.choice(("Long", "Long", "Short"))
+            price = rng.uniform(5, 500)
+
+            opens = []
+            for _ in range(min(rng.choice((1, 1, 2, 3)), fills - written)):
+                shares = rng.randint(1, 200)
+                open_price = round(price * rng.uniform(0.99, 1.01), 2)
+                opens.append((shares, open_price))
+
+            total_shares = sum(shares for shares, open_price in opens)
+            outcome = rng.random()
+            close_shares = total_shares if outcome < 0.8 else (rng.randint(1, total_shares) if outcome < 0.9 else 0)
+            close_price = round(price * rng.uniform(0.95, 1.05), 2)
+
+            for number, (shares, open_price) in enumerate(opens):
+                row = [open_date, ticker, long_short, shares, open_price, round(shares * open_price, 2), "", "", "", ""]
+                if number == 0 and close_shares:
+                    row[6:] = [open_date, close_shares, close_price, round(close_shares * close_price, 2)]
+                writer.writerow(row)
+
+            written += len(opens)
+
+
+def measure(function, repeat: int) -> float:
+    """Return the best wall time of `repeat` calls to function, in seconds."""
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def run_size(path: str, repeat: int, gui: bool) -> dict:
+    """Run every benchmark on the ledger at path and return {benchmark name: seconds}."""
+    results = {}
+
+    def import_csv():
+        ledger = Ledger()
+        for row in broker_import.read_fills(path):
+            ledger.append(row)
+        return ledger
+
+    results["csv_import"] = measure(import_csv, repeat)
+
+    ledger = import_csv()
+    results["recalculate_all"] = measure(ledger.calculate, repeat)
+    results["lot_matching_fifo"] = measure(lambda: lots.match_lots(ledger, "fifo"), repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        columns = ledger.snapshot_columns()
+        results["csv_export"] = measure(lambda: exporter.export_columns(columns, os.path.join(directory, "export.csv")), repeat)
+        results["snapshot_export"] = measure(lambda: exporter.export_columns(columns, os.path.join(directory, "export.tts")), repeat)
+        results["snapshot_load"] = measure(lambda: Ledger().extend(exporter.read_snapshot(os.path.join(directory, "export.tts"))), repeat)
+
+    rng = random.Random(1)
+
+    def edit_cell():
+        ledger.update(rng.randrange(len(ledger)), "cost", f"{rng.uniform(1, 1000):.2f}")
+        ledger.recalculate_dirty()
+
+    results["cell_edit_refresh"] = measure(edit_cell, max(repeat, 100))
+
+    if gui:
+        results.update(run_gui(path, repeat))
+
+    return results
+
+
+def run_gui(path: str, repeat: int) -> dict:
+    """Time Treeview insertion of the ledger at path. Returns {} without a display."""
+    import tkinter as tk
+    from edit_treeview import EditTreeview
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return {}
+
+    rows = [tuple(row.values()) for row in broker_import.read_fills(path)]
+
+    def insert_rows():
+        treeview = EditTreeview(master=root, columns=FILL_COLUMNS, show="headings")
+        for values in rows:
+            treeview.insert(parent="", index=0, values=values)
+        treeview.destroy()
+
+    try:
+        return {"treeview_insert": measure(insert_rows, repeat)}
+    finally:
+        root.destroy()
+
+
+def git_commit() -> str:
+    """Return the current commit hash, or "" outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv: list[str]=None):
+    """Generate synthetic ledgers, run the benchmarks and write the results as JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark the trade tracker hot paths on synthetic ledgers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Ledger sizes in fills.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best time is kept.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic ledgers.")
+    parser.add_argument("--gui", action="store_true", help="Also time Treeview insertion, needs a display.")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "tradetracker_benchmark"), help="Where generated ledgers are cached.")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file, '-' for stdout.")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "results": {},
+    }
+
+    for size in args.sizes:
+        path = os.path.join(args.data_dir, f"ledger_{size}_{args.seed}_v{GENERATOR_VERSION}.csv")
+        if not os.path.exists(path):
+            generate_ledger(path, size, args.seed)
+
+        report["results"][str(size)] = run_size(path, args.repeat, args.gui)
+        print(f"{size} fills: " + ", ".join(f"{name} {seconds * 1000:.2f} ms" for name, seconds in report["results"][str(size)].items()), file=sys.stderr)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
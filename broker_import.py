@@ -0,0 +1,323 @@
+import csv
+import hashlib
+import heapq
+import io
+import multiprocessing
+import operator
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from ledger import FILL_COLUMNS, NUMERIC_COLUMNS, SHARE_COLUMNS, format_number, normalize_date, parse_date, parse_number
+
+
+HEADER_SEARCH_LINES = 20 # Lines scanned for a known header, to skip broker preambles
+
+# {schema name: {source column (case and whitespace insensitive): fill column}}
+SCHEMAS = {
+    "tradetracker": {column: column for column in FILL_COLUMNS},
+    "legacy": {
+        "symbol": "ticker",
+        "long/short": "long_short",
+        "date": "open_date",
+        "+shares": "open_shares",
+        "entry price": "open_price",
+        "net cost": "cost",
+        "exit date": "close_date",
+        "-shares": "close_shares",
+        "exit price": "close_price",
+        "net proceeds": "proceeds",
+    },
+}
+
+# Columns taken from the previous fill when a continuation row leaves them blank
+FORWARD_FILL_COLUMNS = ("ticker",)
+
+FOLLOW_READ_BYTES = 1 << 22 # Most bytes parsed per FileFollower.read, so a large file is taken in steps
+
+
+def detect_schema(header: list[str]) -> str | None:
+    """Return the name of the schema whose source columns all appear in header, or None."""
+    names = {name.strip().lower() for name in header}
+
+    for schema, mapping in SCHEMAS.items():
+        if names.issuperset(mapping):
+            return schema
+
+    return None
+
+
+def read_fills(*paths: str):
+    """Yield the fills of broker CSV files in any known schema as {column_name: value} dicts, in a single pass.
+
+    Separator rows (every cell empty or 0) are dropped, and blank tickers of continuation rows are filled from the
+    previous fill of the same file.
+    """
+    for path in paths:
+        with open(path, "r", newline="", encoding="utf-8-sig") as file:
+            yield from normalize_rows(csv.reader(file), path)
+
+
+def normalize_rows(records, source: str=""):
+    """Yield fills from csv.reader records, detecting the header among the first lines. source names the file in errors."""
+    header, schema = None, None
+    for line_number, header in enumerate(records):
+        schema = detect_schema(header)
+        if schema or line_number >= HEADER_SEARCH_LINES:
+            break
+
+    if schema is None:
+        if header is None:
+            return # Empty file
+        raise ValueError(f"Unknown CSV layout: {source}")
+
+    yield from RowNormalizer(header, schema).rows(records)
+
+
+class RowNormalizer:
+    """Converts the records following a header of a known schema to fills.
+
+    The previous fill is remembered between calls to rows, so a file can be normalized a few records at a time.
+    """
+
+    def __init__(self, header: list[str], schema: str):
+        """Create a normalizer for records laid out like header, which matches schema."""
+        self.header, self.schema = header, schema # To recreate the normalizer, see import_cache
+
+        # Position of every fill column in the source records, None if the schema lacks it
+        mapping = SCHEMAS[schema]
+        names = [name.strip().lower() for name in header]
+        self.positions = [None] * len(FILL_COLUMNS)
+        for position, name in enumerate(names):
+            if name in mapping:
+                self.positions[FILL_COLUMNS.index(mapping[name])] = position
+
+        self.previous = {} # Last fill, for forward fills
+
+    def rows(self, records):
+        """Yield the fills of csv.reader records."""
+        positions = self.positions
+
+        # Fast path: pick every column with one itemgetter call when the record is complete
+        complete = None not in positions
+        pick = operator.itemgetter(*positions) if complete else None
+        width = max((position for position in positions if position is not None), default=-1) + 1
+
+        previous = self.previous
+        for record in records:
+            if complete and len(record) >= width:
+                row = dict(zip(FILL_COLUMNS, pick(record)))
+            else:
+                row = {column: record[position] if position is not None and position < len(record) else ""
+                       for column, position in zip(FILL_COLUMNS, positions)}
+
+            # Drop separator rows
+            if not (row["ticker"] or row["open_date"] or row["open_shares"]):
+                if all(value.strip() in ("", "0") for value in record):
+                    previous = self.previous = {}
+                    continue
+
+            for column in FORWARD_FILL_COLUMNS:
+                if not row[column]:
+                    row[column] = previous.get(column, "")
+
+            # Brokers write 0 proceeds for fills that are still open
+            if not row["close_date"] and row["proceeds"] in ("0", "0.0", "0.00"):
+                row["proceeds"] = ""
+
+            previous = self.previous = row
+            yield row
+
+
+class FileFollower:
+    """Reads the fills appended to a growing broker CSV file, parsing every line only once.
+
+    Remembers the byte offset of the first unread line and the detected schema, and leaves a partly written last line
+    for the next read. If the file shrinks, is replaced, or the last line read changed, reading starts over from the
+    top and restarted is set.
+    """
+
+    def __init__(self, path: str):
+        """Follow the file at path, from its first line."""
+        self.path = path
+        self.offset = 0 # Of the first unread byte, always at the start of a line
+        self.normalizer = None # Once the header is found
+        self.restarted = False # The last read started over from the top of a shrunk or replaced file
+        self.inode = None
+        self.seam = b"" # Last line read, checked to still end at offset
+
+    def pending(self) -> bool:
+        """Return True if the file has bytes past the offset, or was replaced or shrunk, with a single stat call."""
+        stat = os.stat(self.path)
+        return stat.st_size != self.offset or stat.st_ino != self.inode
+
+    def read(self, max_bytes: int=FOLLOW_READ_BYTES, final: bool=False) -> list[dict]:
+        """Return the fills of the complete lines appended since the last read, at most max_bytes of them.
+
+        final: The file is no longer written, also read a last line without a line break.
+        """
+        stat = os.stat(self.path)
+
+        with open(self.path, "rb") as file:
+            if self.inode is not None and self.offset:
+                file.seek(self.offset - len(self.seam))
+                self.restarted = stat.st_ino != self.inode or stat.st_size < self.offset or file.read(len(self.seam)) != self.seam
+                if self.restarted:
+                    self.offset, self.normalizer = 0, None
+            else:
+                self.restarted = False
+            self.inode = stat.st_ino
+
+            file.seek(self.offset)
+            data = file.read(max_bytes)
+
+        start = 3 if self.offset == 0 and data.startswith(b"\xef\xbb\xbf") else 0 # UTF-8 byte order mark
+        end = len(data) if final and len(data) < max_bytes else record_end(data, start) # Past the last complete line
+        if end <= start:
+            return []
+
+        if self.normalizer is None: # Look for the header among the first lines
+            for line_number, line in enumerate(data[start:end].splitlines(keepends=True)):
+                header = next(csv.reader([line.decode("utf-8")]), [])
+                start += len(line)
+                schema = detect_schema(header)
+                if schema:
+                    self.normalizer = RowNormalizer(header, schema)
+                    break
+                if line_number >= HEADER_SEARCH_LINES:
+                    raise ValueError(f"Unknown CSV layout: {self.path}")
+            else:
+                if final:
+                    raise ValueError(f"Unknown CSV layout: {self.path}")
+                return [] # No header yet, read the first lines again once more are written
+
+        fills = list(self.normalizer.rows(csv.reader(io.StringIO(data[start:end].decode("utf-8"), newline=""))))
+        self.offset += end
+        self.seam = data[data.rfind(b"\n", 0, end - 1) + 1:end]
+        return fills
+
+
+def record_end(data: bytes, start: int) -> int:
+    """Return the offset past the last line break of data that ends a CSV record, not one inside a quoted field.
+
+    data[start:] starts at a record. Returns start if no record of it is complete.
+    """
+    end = data.rfind(b"\n") + 1
+    if data.count(b'"', start, end) % 2 == 0: # Every quoted field is closed by end, the common case
+        return max(end, start)
+
+    while (next_end := next_record_end(data, start)) != -1:
+        start = next_end
+
+    return start
+
+
+def next_record_end(data, start: int) -> int:
+    """Return the offset past the line break that ends the CSV record starting at start, or -1 if data ends first.
+
+    data is bytes or an mmap. A line break ends the record if an even number of quotes precede it, escaped quotes come
+    in pairs and keep the count even. Shared by FileFollower and lazy_csv.LazyCsvReader.
+    """
+    quotes = 0
+    position = start
+
+    while (end := data.find(b"\n", position)) != -1:
+        end += 1
+        quotes += data[position:end].count(b'"')
+        if quotes % 2 == 0:
+            return end
+        position = end
+
+    return -1
+
+
+def parse_file(path: str) -> list[tuple[int, bytes, tuple]]:
+    """Return the fills of one file as (open date ordinal, content hash, values in FILL_COLUMNS order), sorted by date.
+
+    Runs in the worker processes of read_fills_parallel, so it returns plain tuples, which are cheap to pickle. The
+    sort is stable, fills of the same day keep their file order.
+    """
+    fills = []
+    ordinals = {} # {date text: ordinal}, dates repeat a lot
+    for row in read_fills(path):
+        text = row["open_date"]
+        ordinal = ordinals.get(text)
+        if ordinal is None:
+            date = parse_date(text)
+            ordinal = ordinals[text] = date.toordinal() if date else 0
+        fills.append((ordinal, fill_hash(row), tuple(row[column] for column in FILL_COLUMNS)))
+
+    fills.sort(key=operator.itemgetter(0))
+    return fills
+
+
+def fill_hash(row: dict) -> bytes:
+    """Return a hash of the content of a fill that ignores how brokers format it, e.g. 95.3 or 95.30, 1/7/15 or 2015-01-07."""
+    canonical = []
+    for column in FILL_COLUMNS:
+        value = row[column].strip()
+        if column in NUMERIC_COLUMNS:
+            try:
+                value = format_number(parse_number(value, column in SHARE_COLUMNS), column in SHARE_COLUMNS)
+            except ValueError:
+                pass
+        elif column in ("open_date", "close_date"):
+            value = normalize_date(value)
+        canonical.append(value)
+
+    return hashlib.blake2b("\x1f".join(canonical).encode(), digest_size=16).digest()
+
+
+def read_fills_parallel(paths: list[str], processes: int=None, stats: dict=None):
+    """Yield the fills of many broker CSV files as {column_name: value} dicts, merged into one stream by open date.
+
+    Files are parsed in parallel by a process pool of processes workers (default: one per core), then combined with a
+    k-way merge of the per-file sorted fills. A fill whose content already came from another file is skipped, while
+    repeats within one file are kept, since a broker can report two identical fills. stats, if given, receives the
+    counts of files, fills and duplicates.
+    """
+    paths = list(paths)
+    stats = {} if stats is None else stats
+    stats.update(files=len(paths), fills=0, duplicates=0)
+
+    workers = min(processes or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        results = [parse_file(path) for path in paths]
+    else:
+        # Spawned rather than forked workers, forking a process that runs threads (e.g. Tk) can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = list(executor.map(parse_file, paths))
+
+    # Ties are merged in file order, so all fills of a day from earlier files come before those of later files
+    streams = [zip(map(operator.itemgetter(0), fills), repeat(number), map(operator.itemgetter(1), fills), map(operator.itemgetter(2), fills))
+               for number, fills in enumerate(results)]
+    day, counts = None, {} # {hash: [most copies in an earlier file, current file, copies in it]} of the current day
+
+    for ordinal, number, digest, values in heapq.merge(*streams, key=operator.itemgetter(0)):
+        if ordinal != day: # Identical fills share their open date, so only one day needs remembering
+            day, counts = ordinal, {}
+
+        count = counts.get(digest)
+        if count is None:
+            count = counts[digest] = [0, number, 0]
+        elif count[1] != number:
+            count[0], count[1], count[2] = max(count[0], count[2]), number, 0
+        count[2] += 1
+
+        if count[2] <= count[0]:
+            stats["duplicates"] += 1
+            continue
+
+        stats["fills"] += 1
+        yield dict(zip(FILL_COLUMNS, values))
+
+
+if __name__ == "__main__":
+
+    # Normalize broker exports into one CSV file on stdout: python broker_import.py export1.csv export2.csv > fills.csv
+    writer = csv.DictWriter(sys.stdout, fieldnames=FILL_COLUMNS)
+    writer.writeheader()
+    writer.writerows(read_fills(*sys.argv[1:]))
@@ -1,26 +1,49 @@
 import tkinter as tk
 from tkinter import ttk
 from typing import Callable
+from ledger import MISSING, format_number, parse_number
 from validated_entry import ValidatedEntry
 
 
 class EditTreeview(ttk.Treeview):
     """Editable ttk Treeview widget that displays a hierarchical collection of items."""
 
-    def __init__(self, master, column_validation: dict[str, str]=None, callback: Callable[[], None]=None, **kw):
+    def __init__(self, master, column_validation: dict[str, str]=None, callback: Callable[[str, str], None]=None, row_store=None, overscan: int=50, editable: bool=True, **kw):
         """Initialize the EditTreeview with the parent master and optional keyword arguments.
 
         Parameters:
         master: The parent widget.
         column_validation: {column_name: validation_type (integer, price, alpha)}
+        callback: Called with (item_iid, column_name) after a cell is edited. The tree column is "#0".
+        row_store: Enables virtual mode, where only the rows in the viewport exist as Tk items. Any object with
+            __len__ and __getitem__(index) -> values, optionally iid(index) -> item iid and __setitem__(index, values).
+        overscan: Virtual mode only. Rows fetched beyond each edge of the viewport so small scrolls skip the row store.
+        editable: Open a cell editor on double click. False for read-only views.
         **kw: Additional keyword arguments passed to the ttk.Treeview constructor.
         """
+        self.row_store = row_store
+
+        # In virtual mode the scrollbar follows the row store, not the Tk items
+        self.yscroll_callback = kw.pop("yscrollcommand", None) if row_store is not None else None
+
         super().__init__(master, **kw)
 
         self.column_validation = column_validation
         self.callback = callback
 
-        self.bind("<Double-1>", self.on_double_click)
+        if editable:
+            self.bind("<Double-1>", self.on_double_click)
+
+        if row_store is not None:
+            self.overscan = overscan
+            self.first_row = 0
+            self.row_cache = {} # {index: (iid, values)} for the viewport and overscan
+            self.visible_rows = {} # {iid: index} of the items currently in the widget
+
+            self.bind("<Configure>", lambda event: self.refresh())
+            self.bind("<MouseWheel>", self.on_mouse_wheel)
+            self.bind("<Button-4>", self.on_mouse_wheel)
+            self.bind("<Button-5>", self.on_mouse_wheel)
 
     def on_double_click(self, event):
         """Instantiate Entry widget on top of a Treeview cell for editing."""
@@ -111,23 +134,112 @@ class EditTreeview(ttk.Treeview):
 
         # Update the Treeview item based on whether it's a tree column or a regular column
         if column_index == -1: # If it's the tree column
+            column_name = "#0"
             self.item(selected_iid, text=new_text)
         else: # If it's a regular column
+            column_name = self["columns"][column_index]
             current_values = self.item(selected_iid).get("values")
             current_values[column_index] = new_text
             self.item(selected_iid, values=current_values)
 
+            # Write the edited row back to the row store in virtual mode
+            if self.row_store is not None and hasattr(self.row_store, "__setitem__"):
+                self.row_store[self.visible_rows[selected_iid]] = current_values
+
         event.widget.destroy()
 
-        self.callback() if self.callback else None
+        self.callback(selected_iid, column_name) if self.callback else None
+
+        if self.row_store is not None:
+            self.refresh(reload=True)
 
     def format_price(self, value: str) -> str:
         """Helper function to format price or signed price fields."""
         try:
-            # Convert to float and ensure formatting to 2 decimal places
-            return f"{float(value) + 0:.2f}"
+            # Convert to cents the way imports do, so 2.675 is 2.68 and not the nearest binary float
+            cents = parse_number(value)
         except ValueError:
-            return "0.00"  # Default to 0.00 on invalid input
+            cents = MISSING
+        return format_number(cents if cents != MISSING else 0)  # Default to 0.00 on invalid input
+
+    def yview(self, *args):
+        """Query or change the vertical position. In virtual mode the position is over the row store, not the Tk items."""
+        if self.row_store is None:
+            return super().yview(*args)
+
+        if not args:
+            return self.scroll_fractions()
+
+        if args[0] == "moveto":
+            self.scroll_to(round(float(args[1]) * len(self.row_store)))
+        elif args[0] == "scroll":
+            step = self.viewport_size() if args[2] == "pages" else 1
+            self.scroll_to(self.first_row + int(args[1]) * step)
+
+    def on_mouse_wheel(self, event):
+        """Virtual mode: scroll the viewport with the mouse wheel."""
+        step = -3 if event.num == 4 or event.delta > 0 else 3
+        self.scroll_to(self.first_row + step)
+        return "break"
+
+    def scroll_to(self, index: int):
+        """Virtual mode: show the rows starting at index."""
+        if index != self.first_row:
+            self.first_row = index
+            self.refresh()
+
+    def scroll_fractions(self) -> tuple[float, float]:
+        """Virtual mode: return the (first, last) fractions of the row store inside the viewport."""
+        total = len(self.row_store)
+        if not total:
+            return 0.0, 1.0
+
+        return self.first_row / total, min(1.0, (self.first_row + self.viewport_size()) / total)
+
+    def viewport_size(self) -> int:
+        """Virtual mode: return the number of rows that fit in the widget, minus the heading row."""
+        row_height = int(ttk.Style(self).lookup("Treeview", "rowheight") or 20)
+        return max(int(self["height"]), self.winfo_height() // row_height - 1)
+
+    def refresh(self, reload: bool=False):
+        """Virtual mode: display the rows of the viewport, fetching the ones not cached from the row store.
+
+        reload: Drop the cached rows, after the row store changed.
+        """
+        total = len(self.row_store)
+        size = self.viewport_size()
+        self.first_row = max(0, min(self.first_row, total - size))
+        last_row = min(total, self.first_row + size)
+
+        if reload:
+            self.row_cache = {}
+
+        # Fetch the viewport plus overscan, dropping cached rows that fell out of range
+        if any(index not in self.row_cache for index in range(self.first_row, last_row)):
+            low, high = max(0, self.first_row - self.overscan), min(total, last_row + self.overscan)
+            self.row_cache = {index: self.row_cache.get(index) or self.fetch_row(index) for index in range(low, high)}
+
+        selection, focus = self.selection(), self.focus()
+
+        self.delete(*self.get_children())
+        self.visible_rows = {}
+        for index in range(self.first_row, last_row):
+            iid, values = self.row_cache[index]
+            self.insert(parent="", index=tk.END, iid=iid, values=values)
+            self.visible_rows[iid] = index
+
+        # Keep the selection on rows that are still visible
+        self.selection_set([iid for iid in selection if iid in self.visible_rows])
+        if focus in self.visible_rows:
+            self.focus(focus)
+
+        if self.yscroll_callback:
+            self.yscroll_callback(*self.scroll_fractions())
+
+    def fetch_row(self, index: int) -> tuple[str, tuple]:
+        """Virtual mode: return (iid, values) of a row from the row store."""
+        iid = self.row_store.iid(index) if hasattr(self.row_store, "iid") else str(index)
+        return iid, tuple(self.row_store[index])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+import bisect
+import operator
+
+from array import array
+from itertools import accumulate, islice
+
+from ledger import NO_DATE, Ledger
+from rollups import Rollups
+
+
+BLOCK_SIZE = 64 # Values summarized by one min/max block
+
+
+class MinMaxBlocks:
+    """Minimum and maximum of every block of BLOCK_SIZE values of a series, and their positions, so a long series can
+    be downsampled from its blocks instead of its values."""
+
+    def __init__(self):
+        """Create blocks of an empty series."""
+        self.mins = array("q")
+        self.maxs = array("q")
+        self.min_positions = array("q")
+        self.max_positions = array("q")
+
+    def update(self, values: array, start: int):
+        """Recompute the blocks of values from position start on, after values changed there."""
+        first = start // BLOCK_SIZE
+        for blocks in (self.mins, self.maxs, self.min_positions, self.max_positions):
+            del blocks[first:]
+
+        for position in range(first * BLOCK_SIZE, len(values), BLOCK_SIZE):
+            block = values[position:position + BLOCK_SIZE]
+            low, high = min(block), max(block)
+            self.mins.append(low)
+            self.maxs.append(high)
+            self.min_positions.append(position + block.index(low))
+            self.max_positions.append(position + block.index(high))
+
+
+class EquityCurve:
+    """Cumulative realized profit/loss of closed trades in trade day order, with its drawdown from the running peak.
+
+    Trades come from Rollups contributions, so a trade is on the curve when the summary counts it as closed. Updates
+    only recompute the series from the first changed trade on, which is the end of it when trades are added.
+    """
+
+    def __init__(self):
+        """Create an empty curve."""
+        self.clear()
+
+    def clear(self):
+        """Forget every trade."""
+        self.keys = [] # (day ordinal, group) of every closed trade, ascending
+        self.profit_loss = array("q") # Of every trade, in cents
+        self.equity = array("q") # Running sum of profit_loss
+        self.peaks = array("q") # Running maximum of equity, starting from 0
+        self.drawdowns = array("q") # peaks - equity
+        self.position_of_group = {}
+        self.equity_blocks = MinMaxBlocks()
+        self.drawdown_blocks = MinMaxBlocks()
+        self.version = 0 # Incremented on every change, for redraws
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def rebuild(self, ledger: Ledger, rollups: Rollups):
+        """Recompute the curve from every trade of freshly rebuilt rollups."""
+        self.clear()
+        self.update(ledger, rollups, list(rollups.contributions))
+
+    def update(self, ledger: Ledger, rollups: Rollups, groups):
+        """Apply the trade groups whose rollups contribution was just updated, see Rollups.update."""
+        first_change = len(self.keys)
+        inserted = [] # (key, profit/loss) of trades new on the curve
+        removed = set() # Positions of trades no longer on the curve
+
+        for group in groups:
+            contribution = rollups.contributions.get(group, {})
+            position = self.position_of_group.get(group)
+
+            if not contribution.get("trades"):
+                if position is not None:
+                    removed.add(position)
+                    first_change = min(first_change, position)
+            elif position is not None:
+                self.profit_loss[position] = contribution["profit_loss"]
+                first_change = min(first_change, position)
+            else:
+                first_row = ledger.group_first[group]
+                day = ledger.open_date.ordinal(first_row) if first_row >= 0 else NO_DATE
+                inserted.append(((day, group), contribution["profit_loss"]))
+
+        if inserted or removed:
+            inserted.sort()
+            if inserted:
+                first_change = min(first_change, bisect.bisect_left(self.keys, inserted[0][0]))
+
+            # Merge the new trades into the changed part of the curve. Both runs are sorted, so sorting them is linear
+            tail = [(key, profit_loss) for position, (key, profit_loss) in enumerate(zip(self.keys[first_change:], self.profit_loss[first_change:]), first_change)
+                    if position not in removed]
+            tail = sorted(tail + inserted) if inserted and tail and inserted[0][0] < tail[-1][0] else tail + inserted
+
+            for position in removed:
+                del self.position_of_group[self.keys[position][1]]
+
+            del self.keys[first_change:]
+            del self.profit_loss[first_change:]
+            self.keys.extend(key for key, profit_loss in tail)
+            self.profit_loss.extend(profit_loss for key, profit_loss in tail)
+
+            for position in range(first_change, len(self.keys)):
+                self.position_of_group[self.keys[position][1]] = position
+
+        if first_change < len(self.equity) or len(self.equity) < len(self.keys):
+            self.recompute(first_change)
+
+    def recompute(self, start: int):
+        """Recompute equity, peaks and drawdowns from position start on, with running sums and maximums."""
+        equity_before = self.equity[start - 1] if start else 0
+        peak_before = self.peaks[start - 1] if start else 0
+
+        del self.equity[start:]
+        del self.peaks[start:]
+        del self.drawdowns[start:]
+        self.equity.extend(islice(accumulate(self.profit_loss[start:], initial=equity_before), 1, None))
+        self.peaks.extend(islice(accumulate(self.equity[start:], max, initial=peak_before), 1, None))
+        self.drawdowns.extend(map(operator.sub, self.peaks[start:], self.equity[start:]))
+
+        self.equity_blocks.update(self.equity, start)
+        self.drawdown_blocks.update(self.drawdowns, start)
+        self.version += 1
+
+    @property
+    def max_drawdown(self) -> int:
+        """Return the largest drop of equity from a previous peak, in cents."""
+        return max(self.drawdown_blocks.maxs, default=0)
+
+
+def downsample(values: array, blocks: MinMaxBlocks, buckets: int) -> list[tuple[int, int]]:
+    """Return (position, value) points of values keeping the minimum and maximum of each of buckets equal ranges.
+
+    A chart drawn through the points looks like one through every value at a width of buckets pixels. Once every range
+    spans a block, ranges are taken from the blocks, so the cost depends on the width, not on the length of values.
+    """
+    if len(values) <= 2 * buckets:
+        return list(enumerate(values))
+
+    if len(blocks.mins) >= buckets: # Every bucket spans a block or more
+        mins, maxs, min_positions, max_positions = blocks.mins, blocks.maxs, blocks.min_positions, blocks.max_positions
+    else:
+        mins = maxs = values
+        min_positions = max_positions = range(len(values))
+
+    count = len(mins)
+    points = []
+    for bucket in range(buckets):
+        start, end = bucket * count // buckets, (bucket + 1) * count // buckets
+        if start == end:
+            continue
+
+        lows, highs = mins[start:end], maxs[start:end]
+        low, high = start + lows.index(min(lows)), start + highs.index(max(highs))
+        low_point, high_point = (min_positions[low], mins[low]), (max_positions[high], maxs[high])
+        points.extend(sorted((low_point, high_point)) if low_point != high_point else (low_point,))
+
+    return points
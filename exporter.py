@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+import struct
+import sys
+
+from array import array
+from typing import Callable
+
+from ledger import FILL_COLUMNS, SHARE_COLUMNS, TEXT_COLUMNS, format_number
+
+
+CHUNK_ROWS = 10_000 # Rows formatted and written per step, progress is reported after each one
+BUFFER_SIZE = 1 << 20
+SNAPSHOT_MAGIC = b"TTSNAP1\n"
+
+
+def export_columns(columns: dict, path: str, progress: Callable[[int, int], None]=None):
+    """Write fill columns, as returned by Ledger.snapshot_columns, in the format registered for the extension of path.
+
+    progress: Called with (rows_written, total_rows) after every chunk. Runs on the calling thread.
+    """
+    writer = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), write_csv)
+    writer(columns, path, progress)
+
+
+def write_csv(columns: dict, path: str, progress: Callable[[int, int], None]=None):
+    """Write fill columns to a CSV file with the open_date,ticker,... header, formatting one chunk of rows at a time."""
+    row_count = len(columns["open_date"])
+
+    with open(path, "w", newline="", buffering=BUFFER_SIZE) as file:
+        writer = csv.writer(file)
+        writer.writerow(FILL_COLUMNS)
+
+        for start in range(0, row_count, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, row_count)
+
+            chunk = []
+            for column in FILL_COLUMNS:
+                values = columns[column][start:end]
+                chunk.append(values if column in TEXT_COLUMNS else [format_number(value, column in SHARE_COLUMNS) for value in values])
+
+            writer.writerows(zip(*chunk))
+
+            if progress:
+                progress(end, row_count)
+
+
+def write_snapshot(columns: dict, path: str, progress: Callable[[int, int], None]=None):
+    """Write fill columns to a binary snapshot.
+
+    Layout: SNAPSHOT_MAGIC, the length of a JSON header as uint64, the header {rows, byteorder, strings}, then every
+    column in FILL_COLUMNS order as raw machine values: text columns as int32 codes into the strings table, numeric
+    columns as the ledger's int64 shares and cents. Reading it back is a few bulk array copies instead of parsing text.
+    """
+    row_count = len(columns["open_date"])
+    strings = {}
+
+    codes = {column: array("i", [strings.setdefault(value, len(strings)) for value in columns[column]]) for column in TEXT_COLUMNS}
+    header = json.dumps({"rows": row_count, "byteorder": sys.byteorder, "strings": list(strings)}).encode()
+
+    with open(path, "wb", buffering=BUFFER_SIZE) as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(struct.pack("<Q", len(header)))
+        file.write(header)
+
+        for written, column in enumerate(FILL_COLUMNS, start=1):
+            values = codes[column] if column in TEXT_COLUMNS else columns[column]
+            values.tofile(file)
+
+            if progress:
+                progress(row_count * written // len(FILL_COLUMNS), row_count)
+
+
+def read_snapshot(path: str) -> dict:
+    """Read a binary snapshot written by write_snapshot and return its fill columns."""
+    with open(path, "rb") as file:
+        if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a trade snapshot: {path}")
+
+        header_length, = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(header_length))
+        row_count, strings = header["rows"], header["strings"]
+
+        columns = {}
+        for column in FILL_COLUMNS:
+            values = array("i" if column in TEXT_COLUMNS else "q")
+            values.frombytes(file.read(row_count * values.itemsize))
+
+            if header["byteorder"] != sys.byteorder:
+                values.byteswap()
+
+            columns[column] = [strings[code] for code in values] if column in TEXT_COLUMNS else values
+
+    return columns
+
+
+def iter_rows(columns: dict):
+    """Yield the fills of fill columns as {column_name: display string} dicts."""
+    formatted = [columns[column] if column in TEXT_COLUMNS else [format_number(value, column in SHARE_COLUMNS) for value in columns[column]]
+                 for column in FILL_COLUMNS]
+
+    for values in zip(*formatted):
+        yield dict(zip(FILL_COLUMNS, values))
+
+
+def is_snapshot(path: str) -> bool:
+    """Return True if path is a binary snapshot."""
+    with open(path, "rb") as file:
+        return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+# {file extension: writer(columns, path, progress)}
+EXPORT_FORMATS = {
+    ".csv": write_csv,
+    ".tts": write_snapshot,
+}
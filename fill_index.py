@@ -0,0 +1,129 @@
+import bisect
+import datetime
+import operator
+
+from array import array
+from itertools import chain, compress, repeat
+
+from ledger import NO_DATE, Ledger
+
+
+class FillIndex:
+    """In-memory indexes over the rows of a ledger for filtering: ticker and long/short to rows, and rows sorted by
+    open date.
+
+    Rows appended to the ledger are indexed on the next query. Edits of tickers, long/short or open dates need
+    invalidate().
+    """
+
+    def __init__(self, ledger: Ledger):
+        """Create an index over ledger."""
+        self.ledger = ledger
+        self.invalidate()
+
+    def invalidate(self):
+        """Rebuild the indexes on next query, after tickers or dates were edited or the ledger was cleared."""
+        self.rows_of_ticker = {} # {ticker in upper case: rows in ascending order}
+        self.rows_of_side = {} # {long_short: rows in ascending order}
+        self.dates = array("q") # Open date ordinals in ascending order
+        self.date_rows = array("q") # Row of every entry of dates
+        self.ordinals = array("q") # Open date ordinal of every row
+        self.indexed_rows = 0
+
+    def update(self):
+        """Index the rows appended to the ledger since the last update."""
+        ledger = self.ledger
+        if self.indexed_rows > len(ledger):
+            self.invalidate()
+        if self.indexed_rows == len(ledger):
+            return
+
+        entries = [] # (ordinal, row) of the new rows
+        ordinal = ledger.open_date.ordinal
+        for row in range(self.indexed_rows, len(ledger)):
+            ticker = ledger.ticker[row].upper()
+            rows = self.rows_of_ticker.get(ticker)
+            if rows is None:
+                rows = self.rows_of_ticker[ticker] = array("q")
+            rows.append(row)
+
+            side = ledger.long_short[row]
+            rows = self.rows_of_side.get(side)
+            if rows is None:
+                rows = self.rows_of_side[side] = array("q")
+            rows.append(row)
+
+            self.ordinals.append(ordinal(row))
+            entries.append((self.ordinals[row], row))
+
+        # Ledgers are mostly in date order, so this is nearly always an append. Otherwise sort the new rows and merge
+        # them in, a single linear pass however far out of order they are
+        ordinals = [ordinal for ordinal, row in entries]
+        if ordinals != sorted(ordinals) or (self.dates and ordinals and ordinals[0] < self.dates[-1]):
+            entries = sorted(chain(zip(self.dates, self.date_rows), entries)) # Timsort merges the two sorted runs
+            self.dates, self.date_rows = array("q"), array("q")
+
+        self.dates.extend(ordinal for ordinal, row in entries)
+        self.date_rows.extend(row for ordinal, row in entries)
+
+        self.indexed_rows = len(ledger)
+
+    def query(self, ticker: str="", long_short: str="", start: datetime.date=None, end: datetime.date=None, status: str="") -> array | None:
+        """Return the rows matching every given criterion in ascending order, or None if no criterion is given.
+
+        Parameters:
+        ticker: Ticker prefix, case insensitive, so results narrow as it is typed.
+        long_short: "Long" or "Short".
+        start, end: Open date range, both included.
+        status: "open" for fills without closed shares, "closed" for the others.
+        """
+        ticker, long_short, status = ticker.strip().upper(), long_short.strip(), status.strip().lower()
+        if not (ticker or long_short or start or end or status):
+            return None
+
+        self.update()
+        ledger = self.ledger
+
+        # Candidates from the most selective index, the other criteria are then checked one pass at a time
+        candidates, indexed = None, None
+        if ticker:
+            lists = [rows for name, rows in self.rows_of_ticker.items() if name.startswith(ticker)]
+            candidates, indexed = (lists[0] if len(lists) == 1 else array("q", sorted(chain(*lists)))), "ticker"
+
+        if long_short:
+            rows = self.rows_of_side.get(long_short, array("q"))
+            if candidates is None or len(rows) < len(candidates):
+                candidates, indexed = rows, "long_short"
+
+        if start or end:
+            first = bisect.bisect_left(self.dates, start.toordinal()) if start else bisect.bisect_right(self.dates, NO_DATE)
+            last = bisect.bisect_right(self.dates, end.toordinal()) if end else len(self.dates)
+            if candidates is None or last - first < len(candidates):
+                candidates, indexed = sorted(self.date_rows[first:last]), "dates"
+
+        rows = range(len(ledger)) if candidates is None else candidates
+
+        if ticker and indexed != "ticker": # Match the distinct tickers once, then compare codes
+            codes = {code for code, name in enumerate(ledger.ticker.values) if name.upper().startswith(ticker)}
+            tickers = ledger.ticker.codes
+            rows = [row for row in rows if tickers[row] in codes]
+
+        if (start or end) and indexed != "dates":
+            ordinals = self.ordinals
+            first_ordinal = start.toordinal() if start else NO_DATE + 1
+            last_ordinal = end.toordinal() if end else datetime.date.max.toordinal()
+            rows = [row for row in rows if first_ordinal <= ordinals[row] <= last_ordinal]
+
+        if long_short and indexed != "long_short":
+            code = ledger.long_short.code_of_value.get(long_short)
+            sides = ledger.long_short.codes
+            rows = [row for row in rows if sides[row] == code]
+
+        if status:
+            close_shares, closed = ledger.close_shares, status == "closed"
+            if isinstance(rows, range): # Every row, compare the whole column at C speed
+                rows = compress(rows, map(operator.gt if closed else operator.le, close_shares, repeat(0))) # MISSING is negative
+            else:
+                rows = [row for row in rows if (close_shares[row] > 0) == closed]
+
+        return rows if isinstance(rows, array) else array("q", rows)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+
+from typing import NamedTuple
+
+import exporter
+
+from broker_import import FileFollower, RowNormalizer
+from journal import write_file
+
+
+CACHE_MAX_BYTES = 512 << 20 # Entries beyond this total size are evicted, least recently used first
+HASH_BLOCK_SIZE = 1 << 20
+SNAPSHOT_SUFFIX = ".tts"
+
+
+class CacheEntry(NamedTuple):
+    """Key and contents of the cached import of a source file."""
+    path: str # Absolute path of the source file
+    size: int # Bytes of the file parsed into the cached fills
+    mtime_ns: int # Modification time of the file when it was read
+    digest: str # Hash of those bytes
+    rows: int # Fills cached
+    resume: dict | None # FileFollower state to parse lines appended to the file, None if it did not end with a line break
+    lot_method: str | None # Lot matching method of totals
+    totals: list | None # [[row, *TradeTotals]] of the trades of the fills, if they were calculated on their own
+
+
+class ImportCache:
+    """Parsed fills and calculated trade totals of imported CSV files, so reopening a file skips the work done before.
+
+    Every source file gets a binary snapshot of its fills (see exporter) and a JSON CacheEntry, named after a hash of
+    its path. A file with the size and modification time of its entry is taken as unchanged without reading it, like
+    make does. Otherwise a hash of the cached part of the file decides: if it still matches, lines were only appended,
+    and only those are parsed. Entries beyond max_bytes are evicted, least recently used first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int=CACHE_MAX_BYTES):
+        """Open the cache stored in directory, creating it if needed."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock() # Entries are saved from worker threads
+
+    def entry_paths(self, path: str) -> tuple[str, str]:
+        """Return the paths of the JSON entry and the snapshot of a source file."""
+        name = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name + ".json"), os.path.join(self.directory, name + SNAPSHOT_SUFFIX)
+
+    def load(self, path: str) -> CacheEntry | None:
+        """Return the entry of a source file, None if it has none."""
+        entry_path, _ = self.entry_paths(path)
+
+        try:
+            with open(entry_path, encoding="utf-8") as file:
+                entry = CacheEntry(**json.load(file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+        return entry if entry.path == os.path.abspath(path) else None
+
+    def lookup(self, path: str) -> tuple[CacheEntry | None, dict | None]:
+        """Return the entry of a source file and its cached fill columns (see Ledger.snapshot_columns) if they still
+        match the start of the file, else (None, None)."""
+        stat = os.stat(path)
+        entry = self.load(path)
+        if entry is None:
+            return None, None
+
+        unchanged = (entry.size, entry.mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+        if not unchanged:
+            if entry.size > stat.st_size or entry.size < stat.st_size and not entry.resume or file_digest(path, entry.size) != entry.digest:
+                return None, None
+
+        entry_path, snapshot_path = self.entry_paths(path)
+        try:
+            columns = exporter.read_snapshot(snapshot_path)
+        except (OSError, ValueError):
+            return None, None
+        if len(columns["open_date"]) != entry.rows:
+            return None, None
+
+        os.utime(entry_path) # Recently used
+        return entry, columns
+
+    def read_fills(self, path: str, stats: dict, cached: CacheEntry=None):
+        """Yield the fills of a broker CSV file as {column_name: value} dicts, after those of cached, an entry from
+        lookup(). stats receives entry, the CacheEntry to save() once the import completes."""
+        stat = os.stat(path)
+        follower = FileFollower(path)
+
+        if cached is not None:
+            if cached.size == stat.st_size:
+                stats["entry"] = cached._replace(mtime_ns=stat.st_mtime_ns)
+                return
+
+            follower.offset, follower.inode, follower.seam = cached.size, stat.st_ino, bytes.fromhex(cached.resume["seam"])
+            follower.normalizer = RowNormalizer(cached.resume["header"], cached.resume["schema"])
+            follower.normalizer.previous = cached.resume["previous"]
+
+        rows = cached.rows if cached is not None else 0
+        while True: # Up to the last line break
+            offset = follower.offset
+            fills = follower.read()
+            if follower.restarted:
+                raise ValueError(f"File changed while it was read: {path}")
+            rows += len(fills)
+            yield from fills
+            if follower.offset == offset:
+                break
+
+        resume = None
+        if follower.normalizer is not None:
+            resume = {"seam": follower.seam.hex(), "header": follower.normalizer.header, "schema": follower.normalizer.schema,
+                      "previous": follower.normalizer.previous}
+
+        fills = follower.read(final=True)
+        if follower.offset != offset: # The file does not end with a line break, its last line may still change
+            resume = None
+            rows += len(fills)
+            yield from fills
+
+        stats["entry"] = CacheEntry(os.path.abspath(path), follower.offset, stat.st_mtime_ns, file_digest(path, follower.offset), rows, resume, None, None)
+
+    def save(self, entry: CacheEntry, columns: dict=None):
+        """Save an entry from read_fills with the fill columns of the file, or without them if they did not change
+        since lookup(), then evict entries beyond max_bytes."""
+        entry_path, snapshot_path = self.entry_paths(entry.path)
+
+        with self.lock:
+            if columns is not None:
+                if os.path.exists(entry_path):
+                    os.remove(entry_path) # So a snapshot is never paired with the entry of another one
+                exporter.write_snapshot(columns, snapshot_path + ".tmp")
+                os.replace(snapshot_path + ".tmp", snapshot_path)
+
+            write_file(entry_path, [json.dumps(entry._asdict(), separators=(",", ":"))])
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = [] # (last use, entry path, snapshot path, bytes)
+        for file in os.scandir(self.directory):
+            if file.name.endswith(".json"):
+                snapshot_path = file.path[:-len(".json")] + SNAPSHOT_SUFFIX
+                size = file.stat().st_size + (os.path.getsize(snapshot_path) if os.path.exists(snapshot_path) else 0)
+                entries.append((file.stat().st_mtime_ns, file.path, snapshot_path, size))
+
+        total = sum(size for *_, size in entries)
+        for _, entry_path, snapshot_path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (entry_path, snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+
+def file_digest(path: str, size: int) -> str:
+    """Return a hash of the first size bytes of a file."""
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, "rb") as file:
+        while size > 0:
+            block = file.read(min(size, HASH_BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            size -= len(block)
+
+    return digest.hexdigest()
@@ -0,0 +1,219 @@
+import builtins
+import contextlib
+import functools
+import json
+import sys
+import time
+
+from typing import Callable
+
+
+class Metrics:
+    """Per-stage hot path measurements: wall time, rows processed, Tcl commands executed and peak Python memory.
+
+    Tcl commands are counted with Tcl's `info cmdcount`, which covers every Tk call made by the stage. Peak memory
+    is only traced while memory tracing is on, since tracemalloc slows everything down.
+    """
+
+    def __init__(self, tk_app=None):
+        """Create empty metrics. tk_app is the Tcl interpreter (widget.tk) used to count Tcl commands."""
+        self.tk_app = tk_app
+        self.stages = {} # {stage: {statistic: value}}
+        self.running = {} # {stage: (start time, start Tcl command count)}
+        self.profiler = None # cProfile.Profile, created when first needed
+        self.profiling = False
+        self.on_stop = None # Called with the stage name whenever a stage stops
+
+    def trace_memory(self, enabled: bool):
+        """Start or stop tracing peak memory."""
+        import tracemalloc
+
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def profile(self, enabled: bool):
+        """Start or stop recording a cProfile profile of everything the application does."""
+        if self.profiler is None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+        if enabled and not self.profiling:
+            self.profiler.enable()
+        elif not enabled and self.profiling:
+            self.profiler.disable()
+        self.profiling = enabled
+
+    def tcl_command_count(self) -> int:
+        """Return the number of Tcl commands executed so far, 0 without an interpreter."""
+        return int(self.tk_app.call("info", "cmdcount")) if self.tk_app is not None else 0
+
+    def start(self, stage: str):
+        """Start measuring a stage. Stages can outlive the call that started them, like an import running in batches."""
+        # Nested stages keep measuring the peak of the outer one
+        tracemalloc = sys.modules.get("tracemalloc") # Only imported once memory tracing was turned on
+        if tracemalloc and tracemalloc.is_tracing() and not self.running:
+            tracemalloc.reset_peak()
+
+        self.running[stage] = (time.perf_counter(), self.tcl_command_count())
+
+    def stop(self, stage: str, rows: int=0) -> dict | None:
+        """Stop measuring a stage that processed `rows` rows and return its statistics."""
+        if stage not in self.running:
+            return None
+
+        start_time, start_commands = self.running.pop(stage)
+        seconds = time.perf_counter() - start_time
+        commands = self.tcl_command_count() - start_commands
+        tracemalloc = sys.modules.get("tracemalloc")
+        peak_memory = tracemalloc.get_traced_memory()[1] if tracemalloc and tracemalloc.is_tracing() else None
+
+        statistics = self.stages.setdefault(stage, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "total_rows": 0, "total_tcl_commands": 0, "max_peak_memory": None})
+        statistics["calls"] += 1
+        statistics["total_seconds"] += seconds
+        statistics["max_seconds"] = max(statistics["max_seconds"], seconds)
+        statistics["total_rows"] += rows
+        statistics["total_tcl_commands"] += commands
+        statistics["last"] = {"seconds": seconds, "rows": rows, "tcl_commands": commands, "peak_memory": peak_memory}
+
+        if peak_memory is not None:
+            statistics["max_peak_memory"] = max(statistics["max_peak_memory"] or 0, peak_memory)
+
+        if self.on_stop:
+            self.on_stop(stage)
+
+        return statistics
+
+    def wrap(self, stage: str, function: Callable, rows: Callable[..., int]=None) -> Callable:
+        """Return function measured as a stage. rows is called with the same arguments to count the rows processed."""
+
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            self.start(stage)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop(stage, rows(*args, **kwargs) if rows else 0)
+
+        return measured
+
+    def summary(self, stage: str) -> str:
+        """Return the last measurement of a stage as one line of text."""
+        statistics = self.stages.get(stage)
+        if not statistics:
+            return ""
+
+        last = statistics["last"]
+        text = f"{stage}: {last['seconds'] * 1000:.1f} ms"
+        if last["rows"]:
+            text += f", {last['rows']} rows ({last['rows'] / max(last['seconds'], 1e-9):,.0f} rows/s)"
+        text += f", {last['tcl_commands']:,} Tcl commands"
+        if last["peak_memory"] is not None:
+            text += f", peak {last['peak_memory'] / 2**20:.1f} MiB"
+
+        return text
+
+    def dump_json(self, path: str):
+        """Write every stage's statistics to a JSON file."""
+        with open(path, "w") as file:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": self.stages}, file, indent=2)
+
+    def dump_profile(self, path: str):
+        """Write the recorded cProfile profile, readable with pstats or snakeviz."""
+        self.profile(self.profiling) # Creates the profiler if profiling was never turned on
+        self.profiler.dump_stats(path) # Also disables the profiler
+
+        if self.profiling:
+            self.profiler.enable()
+
+
+class StartupProfile:
+    """Time to first paint, broken down into module imports and UI components.
+
+    Imports are timed by wrapping builtins.__import__, so the profile must be created before the modules it should
+    time are imported. Every import statement loading a new top-level module is one entry, including the modules it
+    imports in turn. A disabled profile records nothing and costs nothing.
+    """
+
+    def __init__(self, enabled: bool=True):
+        """Start the profile, timing imports from now on if enabled."""
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.entries = [] # (kind, name, seconds) in completion order
+        self.marks = {} # {event: seconds since start}
+        self.import_depth = 0
+        self.original_import = None
+
+        if enabled:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """builtins.__import__ replacement recording the time of imports that load a new module."""
+        if self.import_depth or level or name in sys.modules:
+            self.import_depth += 1
+            try:
+                return self.original_import(name, globals, locals, fromlist, level)
+            finally:
+                self.import_depth -= 1
+
+        start = time.perf_counter()
+        self.import_depth += 1
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            self.import_depth -= 1
+            self.entries.append(("import", name, time.perf_counter() - start))
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        """Context manager timing the construction of a component."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.entries.append(("build", name, time.perf_counter() - start))
+
+    def mark(self, event: str):
+        """Record the time an event happened, like the first paint."""
+        if self.enabled:
+            self.marks[event] = time.perf_counter() - self.start
+
+    def stop(self):
+        """Stop timing imports."""
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def report(self, file=None):
+        """Stop the profile and print every entry, slowest first, followed by the marks."""
+        if not self.enabled:
+            return
+
+        self.stop()
+        file = file or sys.stderr
+
+        print("Startup profile", file=file)
+        for kind, name, seconds in sorted(self.entries, key=lambda entry: -entry[2]):
+            print(f"  {kind:6} {name:40} {seconds * 1000:8.1f} ms", file=file)
+        for event, seconds in self.marks.items():
+            print(f"  {event:47} {seconds * 1000:8.1f} ms after start", file=file)
+
+
+def instrumented(stage: str, rows: Callable[..., int]=None):
+    """Decorator measuring a method as a stage of self.metrics. rows is called with the method arguments after it ran."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def measured(self, *args, **kwargs):
+            self.metrics.start(stage)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.metrics.stop(stage, rows(self, *args, **kwargs) if rows else 0)
+
+        return measured
+
+    return decorator
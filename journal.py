@@ -0,0 +1,207 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from typing import Iterable
+
+import exporter
+
+from ledger import FILL_COLUMNS
+
+
+class Journal:
+    """Append-only change journal for autosaving a ledger.
+
+    Every add or edit becomes one JSON line appended by a background writer thread, so callers never wait for the disk.
+    Changes are fsynced at most `debounce` seconds after the first unsynced one. Once the journal is long enough, it
+    is compacted into a snapshot of every fill. Both files start with a generation number, and a journal is only
+    replayed on top of the snapshot of the same generation, so a crash in the middle of a compaction loses nothing.
+
+    Results computed from the snapshot can be saved with it, and are only handed back while no change was journaled
+    since, so reopening the last ledger does not have to recalculate it.
+    """
+
+    def __init__(self, directory: str, debounce: float=1.0, compact_records: int=5000):
+        """Open the journal stored in directory, creating it if needed.
+
+        Parameters:
+        directory: Folder holding the snapshot and journal files.
+        debounce: Maximum seconds between a change and its fsync.
+        compact_records: Number of journaled changes after which needs_compaction() returns True.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.snapshot_path = os.path.join(directory, "snapshot.jsonl")
+        self.journal_path = os.path.join(directory, "journal.jsonl")
+        self.results_path = os.path.join(directory, "results.json")
+        self.debounce = debounce
+        self.compact_records = compact_records
+
+        self.generation = read_generation(self.snapshot_path)
+        self.records = 0 # Changes journaled since the last compaction
+
+        if not os.path.exists(self.journal_path) or read_generation(self.journal_path) != self.generation:
+            write_file(self.journal_path, [header(self.generation)])
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def load(self) -> list[dict]:
+        """Return the saved fills as {column_name: value} dicts: the snapshot with the journal replayed on top."""
+        rows = []
+
+        for record in read_records(self.snapshot_path):
+            rows.append(dict(zip(FILL_COLUMNS, record)))
+
+        if read_generation(self.journal_path) == self.generation:
+            for record in read_records(self.journal_path):
+                if "add" in record:
+                    rows.append(record["add"])
+                elif "set" in record:
+                    row, column, value = record["set"]
+                    if row < len(rows):
+                        rows[row][column] = value
+                self.records += 1
+
+        return rows
+
+    def load_results(self) -> dict | None:
+        """Return the results saved by the last compaction, or None if changes were journaled since. Call after load()."""
+        if self.records:
+            return None
+
+        try:
+            with open(self.results_path, encoding="utf-8") as file:
+                results = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        return results if isinstance(results, dict) and results.get("generation") == self.generation else None
+
+    def append_fill(self, row: dict):
+        """Journal a fill appended to the ledger."""
+        self.write({"add": {column: str(row.get(column) or "") for column in FILL_COLUMNS}})
+
+    def set_cell(self, row: int, column: str, value):
+        """Journal an edited cell. row is the ledger row index."""
+        if column in FILL_COLUMNS:
+            self.write({"set": [row, column, str(value)]})
+
+    def write(self, record: dict):
+        """Queue a record for the writer thread."""
+        self.records += 1
+        self.queue.put(("record", json.dumps(record, separators=(",", ":")) + "\n"))
+
+    def needs_compaction(self) -> bool:
+        """Return True once enough changes were journaled to make replaying slower than reading a snapshot."""
+        return self.records >= self.compact_records
+
+    def compact(self, columns: dict, results: dict=None):
+        """Replace snapshot and journal with a snapshot of the whole ledger.
+
+        columns: Fill columns as returned by Ledger.snapshot_columns, formatted into rows by the writer thread.
+        results: JSON serializable results computed from columns, returned by load_results() until the next change.
+        """
+        self.records = 0
+        self.queue.put(("snapshot", (columns, results)))
+
+    def close(self):
+        """Write every queued change to disk and stop the writer thread."""
+        self.queue.put(("close", None))
+        self.writer.join()
+
+    def write_loop(self):
+        """Writer thread: append queued records and fsync them in batches."""
+        file = open(self.journal_path, "a", encoding="utf-8")
+        sync_deadline = None # Time by which the unsynced records must be fsynced
+
+        while True:
+            try:
+                timeout = None if sync_deadline is None else max(0.0, sync_deadline - time.monotonic())
+                command, payload = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                command, payload = "sync", None
+
+            try:
+                if command == "record":
+                    file.write(payload)
+                    if sync_deadline is None:
+                        sync_deadline = time.monotonic() + self.debounce
+                    continue
+
+                if command == "snapshot":
+                    columns, results = payload
+                    file.close()
+                    self.generation += 1
+                    write_file(self.snapshot_path, snapshot_lines(self.generation, columns))
+                    write_file(self.journal_path, [header(self.generation)])
+
+                    # Results of an older generation are never used, so a crash before this line is harmless
+                    if results is not None:
+                        write_file(self.results_path, [json.dumps({**results, "generation": self.generation}, separators=(",", ":"))])
+                    file = open(self.journal_path, "a", encoding="utf-8")
+                    sync_deadline = None
+                    continue
+
+                # "sync" or "close"
+                file.flush()
+                os.fsync(file.fileno())
+                sync_deadline = None
+
+                if command == "close":
+                    file.close()
+                    return
+
+            except OSError:
+                import traceback # Only needed on errors, it is slow to import
+                traceback.print_exc()
+
+
+def header(generation: int) -> str:
+    """Return the first line of a snapshot or journal file."""
+    return json.dumps({"generation": generation}) + "\n"
+
+
+def snapshot_lines(generation: int, columns: dict):
+    """Yield the lines of a snapshot of fill columns, one JSON list of display strings per fill."""
+    yield header(generation)
+    for row in exporter.iter_rows(columns):
+        yield json.dumps(list(row.values()), separators=(",", ":")) + "\n"
+
+
+def read_generation(path: str) -> int:
+    """Return the generation of a snapshot or journal file, 0 if it does not exist or is unreadable."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.loads(file.readline())["generation"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def read_records(path: str):
+    """Yield the records after the header of a snapshot or journal file. A torn last line from a crash is skipped."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            file.readline()
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+    except OSError:
+        return
+
+
+def write_file(path: str, lines: Iterable[str]):
+    """Atomically replace a file with lines, durable once this returns."""
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, path)
@@ -0,0 +1,148 @@
+import csv
+import mmap
+import os
+import struct
+
+from array import array
+
+from broker_import import next_record_end
+
+
+INDEX_MAGIC = b"TTIDX1\n"
+INDEX_SUFFIX = ".idx"
+
+
+class LazyCsvReader:
+    """Memory-mapped CSV file. A line-offset index is built in one pass, and rows are only decoded when accessed.
+
+    The index is cached next to the file (path + ".idx") and reused while the file size and modification time match,
+    so reopening a file is instant. Quoted fields may contain line breaks.
+    """
+
+    def __init__(self, path: str, use_cache: bool=True):
+        """Open path and load or build its row index.
+
+        Parameters:
+        path: CSV file with a header row.
+        use_cache: Read and write the cached index next to the file.
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+
+        # mmap cannot map an empty file
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+
+        self.offsets = self.load_index() if use_cache else None
+        if self.offsets is None:
+            self.offsets = self.build_index()
+            if use_cache:
+                self.save_index()
+
+        self.fieldnames = next(csv.reader([self.line(0)]), []) if len(self.offsets) > 1 else []
+
+    def close(self):
+        """Unmap and close the file."""
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __len__(self) -> int:
+        """Return the number of data rows, excluding the header."""
+        return max(0, len(self.offsets) - 2)
+
+    def __getitem__(self, index: int) -> dict:
+        """Decode data row index as {fieldname: value}."""
+        return dict(zip(self.fieldnames, self.values(index)))
+
+    def values(self, index: int) -> list[str]:
+        """Decode data row index as a list of values."""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        return next(csv.reader([self.line(index + 1)]), [])
+
+    def line(self, record: int) -> str:
+        """Return the raw text of a record, the header being record 0."""
+        return self.map[self.offsets[record]:self.offsets[record + 1]].decode("utf-8-sig" if record == 0 else "utf-8").rstrip("\r\n")
+
+    def iter_rows(self, start: int=0, stop: int=None):
+        """Yield data rows start..stop as {fieldname: value} dicts, decoding them one by one."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield self[index]
+
+    def filter_rows(self, **criteria) -> array:
+        """Return the indexes of the data rows whose columns equal every {fieldname: value} of criteria.
+
+        Rows are first matched on their raw bytes, so only rows containing every value get decoded.
+        """
+        needles = [str(value).encode() for value in criteria.values()]
+        matches = array("q")
+
+        for index in range(len(self)):
+            raw = self.map[self.offsets[index + 1]:self.offsets[index + 2]]
+            if all(needle in raw for needle in needles):
+                row = self[index]
+                if all(row.get(column) == str(value) for column, value in criteria.items()):
+                    matches.append(index)
+
+        return matches
+
+    def build_index(self) -> array:
+        """Scan the file once and return the byte offset of every record, plus the end of the file."""
+        offsets = array("q", [0])
+        size = len(self.map)
+
+        while offsets[-1] < size:
+            end = next_record_end(self.map, offsets[-1])
+            offsets.append(size if end == -1 else end) # The last record may lack a line break
+
+        return offsets
+
+    def index_path(self) -> str:
+        """Return the path of the cached index."""
+        return self.path + INDEX_SUFFIX
+
+    def load_index(self) -> array | None:
+        """Return the cached index if it was built for the current version of the file."""
+        try:
+            with open(self.index_path(), "rb") as file:
+                if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                if struct.unpack("<qq", file.read(16)) != self.signature:
+                    return None
+
+                offsets = array("q")
+                offsets.frombytes(file.read())
+                return offsets
+        except (OSError, struct.error, ValueError):
+            return None
+
+    def save_index(self):
+        """Cache the index next to the file. Read-only folders are ignored."""
+        try:
+            with open(self.index_path(), "wb") as file:
+                file.write(INDEX_MAGIC)
+                file.write(struct.pack("<qq", *self.signature))
+                self.offsets.tofile(file)
+        except OSError:
+            pass
+
+
+class CsvRowStore:
+    """Row store for a virtual EditTreeview over a LazyCsvReader, optionally limited to some row indexes."""
+
+    def __init__(self, reader: LazyCsvReader, columns: tuple[str, ...], indexes: array=None):
+        """Create a row store with values ordered like columns. indexes selects rows, as returned by filter_rows."""
+        self.reader = reader
+        self.columns = columns
+        self.indexes = indexes
+
+    def __len__(self) -> int:
+        return len(self.reader) if self.indexes is None else len(self.indexes)
+
+    def __getitem__(self, index: int) -> tuple[str, ...]:
+        row = self.reader[index if self.indexes is None else self.indexes[index]]
+        return tuple(row.get(column, "") for column in self.columns)
@@ -0,0 +1,758 @@
+import datetime
+
+from array import array
+from collections.abc import Mapping
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import NamedTuple
+
+
+FILL_COLUMNS = ("open_date", "ticker", "long_short", "open_shares", "open_price", "cost", "close_date", "close_shares", "close_price", "proceeds")
+RESULT_COLUMNS = ("total_cost", "cost_basis", "profit_loss", "net_percentage")
+TEXT_COLUMNS = ("open_date", "ticker", "long_short", "close_date")
+NUMERIC_COLUMNS = ("open_shares", "open_price", "cost", "close_shares", "close_price", "proceeds")
+SHARE_COLUMNS = ("open_shares", "close_shares")
+KEY_COLUMNS = ("open_date", "ticker", "long_short")
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%y", "%m/%d/%Y") # ISO from the date picker, US formats from broker exports
+MISSING = -2**63 # Empty numeric cell, the smallest int64 so it never collides with a real value
+NO_DATE = -1 # Ordinal of date cells that are not a date
+
+
+class TradeTotals(NamedTuple):
+    """Calculated values for one trade group. Money is in cents and the net percentage in hundredths of a percent."""
+    total_cost: int
+    cost_basis: int
+    profit_loss: int
+    net_percentage: int
+
+
+class Ledger:
+    """Tk-free trade ledger. Fills are held in typed column arrays and grouped into trades by (open_date, ticker, long_short).
+
+    Trade groups are arrays too: the rows of a group are chained through next_rows in ascending order, and the key
+    codes, anchor and totals of every group are parallel arrays indexed by group id. No Python object is kept per row
+    or per group, apart from one group_of_key entry.
+    """
+
+    def __init__(self):
+        """Create an empty ledger."""
+        # Lot matching method backing the profit/loss columns ("fifo", "lifo" or "specific"), None to sum each trade
+        self.lot_method = None
+        self.clear()
+
+    def clear(self):
+        """Remove every fill from the ledger."""
+        self.iids = RowIds(self)
+        self.fill_ids = array("q") # Id of every row in a TradeStore, -1 if not stored
+
+        # Text columns as int32 codes of their distinct values, dates with the ordinal of every distinct value
+        self.open_date = InternedColumn(dates=True)
+        self.ticker = InternedColumn()
+        self.long_short = InternedColumn()
+        self.close_date = InternedColumn(dates=True)
+
+        # Numeric columns as int64: shares as whole shares, money as cents. MISSING marks an empty cell
+        self.open_shares = array("q")
+        self.open_price = array("q")
+        self.cost = array("q")
+        self.close_shares = array("q")
+        self.close_price = array("q")
+        self.proceeds = array("q")
+
+        # Trade group of every row, and the next row of its group, -1 after the last one
+        self.group_ids = array("i")
+        self.next_rows = array("q")
+
+        # First and last row of every group, -1 while it has none, and the codes of its (open_date, ticker, long_short)
+        self.group_first = array("q")
+        self.group_last = array("q")
+        self.key_codes = (array("i"), array("i"), array("i"))
+        self.group_of_key = {} # {key codes packed into one int: group}
+        self.group_keys = GroupKeys(self)
+        self.group_rows = GroupRows(self)
+
+        # Displayed anchor row of every group as of the latest calculation, -1 if it has none, and groups awaiting recalculation
+        self.anchors = array("q")
+        self.dirty_groups = set()
+
+        # Latest calculated totals, {anchor row: TradeTotals} over one array per TradeTotals field
+        self.totals = AnchorTotals(self)
+
+        # Lot matching of the latest calculation, if lot_method is set
+        self.lot_report = None
+
+    def __len__(self) -> int:
+        return len(self.group_ids)
+
+    def append(self, row: dict) -> int:
+        """Append a fill given as {column_name: value} and return its row index, which is also its iid as text."""
+        index = len(self.group_ids)
+
+        for column in TEXT_COLUMNS:
+            getattr(self, column).append(str(row.get(column) or ""))
+
+        for column in NUMERIC_COLUMNS:
+            getattr(self, column).append(parse_number(row.get(column), column in SHARE_COLUMNS))
+
+        group = self.group_of_row(index)
+        self.group_ids.append(group)
+        self.next_rows.append(-1)
+        self.chain_row(index, group)
+        self.dirty_groups.add(group)
+
+        self.fill_ids.append(row.get("fill_id") or -1)
+
+        return index
+
+    def extend(self, columns: dict):
+        """Append fills given as {column_name: sequence}, as returned by snapshot_columns, in one pass per column."""
+        start = len(self.group_ids)
+
+        for column in TEXT_COLUMNS:
+            getattr(self, column).extend(columns[column])
+
+        for column in NUMERIC_COLUMNS:
+            getattr(self, column).extend(columns[column])
+
+        end = len(self.open_date)
+        group_ids = array("i")
+        group_of_key, group_first, group_last, next_rows = self.group_of_key, self.group_first, self.group_last, self.next_rows
+        next_rows.extend(array("q", [-1]) * (end - start))
+
+        codes = zip(self.open_date.codes[start:], self.ticker.codes[start:], self.long_short.codes[start:])
+        for index, (open_date, ticker, long_short) in enumerate(codes, start):
+            group = group_of_key.get(open_date << 64 | ticker << 32 | long_short) # Key of group_of_codes
+            if group is None:
+                group = self.group_of_codes(open_date, ticker, long_short)
+            group_ids.append(group)
+
+            # Rows come in ascending order, each one goes last in its group
+            if group_last[group] < 0:
+                group_first[group] = index
+            else:
+                next_rows[group_last[group]] = index
+            group_last[group] = index
+
+        self.group_ids.extend(group_ids)
+        self.dirty_groups.update(group_ids)
+        self.fill_ids.extend(array("q", [-1]) * (end - start))
+
+    def row_of_iid(self, iid: str) -> int | None:
+        """Return the row of a Treeview item id, None if it is not the iid of a row."""
+        row = int(iid) if iid.isdecimal() else -1
+        return row if 0 <= row < len(self) else None
+
+    def snapshot_columns(self) -> dict:
+        """Return a copy of every fill column, safe to read from another thread while the ledger keeps changing."""
+        return {column: getattr(self, column)[:] for column in FILL_COLUMNS}
+
+    def group_of_row(self, row: int) -> int:
+        """Return the id of the trade group of a row's key columns, creating the group if it does not exist yet."""
+        return self.group_of_codes(self.open_date.codes[row], self.ticker.codes[row], self.long_short.codes[row])
+
+    def group_of_codes(self, open_date: int, ticker: int, long_short: int) -> int:
+        """Return the id of the trade group with the given key column codes, creating it if it does not exist yet."""
+        key = open_date << 64 | ticker << 32 | long_short # Codes are non-negative int32
+        group = self.group_of_key.get(key)
+
+        if group is None:
+            group = self.group_of_key[key] = len(self.group_first)
+            for key_codes, code in zip(self.key_codes, (open_date, ticker, long_short)):
+                key_codes.append(code)
+            self.group_first.append(-1)
+            self.group_last.append(-1)
+            self.anchors.append(-1)
+            self.totals.append_group()
+
+        return group
+
+    def chain_row(self, row: int, group: int):
+        """Link a row, whose next_rows entry is -1, into the row chain of a group, keeping the chain in ascending order."""
+        previous = self.group_last[group]
+        if previous < row: # Appended rows go last
+            self.group_last[group] = row
+        else:
+            previous = -1
+            following = self.group_first[group]
+            while following < row:
+                previous, following = following, self.next_rows[following]
+            self.next_rows[row] = following
+
+        if previous < 0:
+            self.group_first[group] = row
+        else:
+            self.next_rows[previous] = row
+
+    def unchain_row(self, row: int, group: int):
+        """Unlink a row from the row chain of a group."""
+        previous = -1
+        current = self.group_first[group]
+        while current != row:
+            previous, current = current, self.next_rows[current]
+
+        following = self.next_rows[row]
+        if previous < 0:
+            self.group_first[group] = following
+        else:
+            self.next_rows[previous] = following
+        if following < 0:
+            self.group_last[group] = previous
+        self.next_rows[row] = -1
+
+    def iter_group(self, group: int):
+        """Yield the rows of a trade group in ascending order."""
+        row, next_rows = self.group_first[group], self.next_rows
+        while row >= 0:
+            yield row
+            row = next_rows[row]
+
+    def calculate(self) -> dict[int, TradeTotals]:
+        """Compute totals for every trade group in a single group-by pass.
+
+        Returns {anchor_row: TradeTotals}. The anchor is the last row appended to a group, which is the
+        row displayed on top of the trade since the Treeview lists newer fills first.
+        """
+        sums = [TradeSums() for _ in range(len(self.group_first))]
+
+        for group, *values in zip(self.group_ids, self.cost, self.open_shares, self.proceeds):
+            sums[group].add_totals(*values)
+
+        self.anchors[:] = self.group_last
+        self.dirty_groups.clear()
+        self.totals.set_groups([group_sums.totals() for group_sums in sums]) # Groups without rows are never read
+
+        if self.lot_method:
+            self.apply_lot_matching()
+
+        return dict(self.totals.items())
+
+    def restore_totals(self, totals: dict[int, TradeTotals], rows: int=None) -> bool:
+        """Adopt {anchor_row: TradeTotals} saved from an earlier calculate() of the same fills, instead of calculating.
+
+        rows: The totals were calculated when the ledger had only its first rows fills. Trades with later fills are
+        left dirty for recalculate_dirty().
+
+        Returns False, changing nothing, if the anchors do not match the trades of the ledger.
+        """
+        rows = len(self) if rows is None else rows
+        anchors = array("q", self.group_last)
+        dirty_groups = set()
+        for group, last in enumerate(self.group_last):
+            if last >= rows:
+                dirty_groups.add(group)
+                anchors[group] = -1
+                for row in self.iter_group(group):
+                    if row >= rows:
+                        break
+                    anchors[group] = row
+
+        if {anchor for anchor in anchors if anchor >= 0} != set(totals):
+            return False
+
+        self.anchors[:] = anchors
+        for row, row_totals in totals.items():
+            self.totals.set_group(self.group_ids[row], row_totals)
+        self.dirty_groups.clear()
+        self.dirty_groups.update(dirty_groups)
+
+        return True
+
+    def apply_lot_matching(self):
+        """Replace the profit/loss and net percentage of every trade with the realized results of lot matching.
+
+        A trade realizes the profit/loss of the closes on its rows, and its net percentage is relative to the cost of
+        the lots those closes consumed.
+        """
+        from lots import match_lots # lots imports this module
+
+        self.lot_report = match_lots(self, self.lot_method)
+        profit_loss, matched_cost = self.lot_report.realized_by_row(len(self))
+
+        group_count = len(self.group_first)
+        group_profit_loss = [0] * group_count
+        group_matched_cost = [0] * group_count
+        for group, row_profit_loss, row_matched_cost in zip(self.group_ids, profit_loss, matched_cost):
+            group_profit_loss[group] += row_profit_loss
+            group_matched_cost[group] += row_matched_cost
+
+        for group, anchor in enumerate(self.anchors):
+            if anchor >= 0:
+                realized, cost = group_profit_loss[group], group_matched_cost[group]
+                self.totals.profit_loss[group] = realized
+                self.totals.net_percentage[group] = divide_rounded(realized * 100 * 100, cost) if cost else 0
+
+    def update(self, row: int, column: str, value):
+        """Change one cell and mark the trade groups it affects as dirty. Key columns move the row to another group."""
+        if column in TEXT_COLUMNS:
+            getattr(self, column)[row] = str(value or "")
+        elif column in NUMERIC_COLUMNS:
+            getattr(self, column)[row] = parse_number(value, column in SHARE_COLUMNS)
+        else:
+            return # Calculated or unknown column, nothing to update
+
+        old_group = self.group_ids[row]
+        self.dirty_groups.add(old_group)
+
+        if column in KEY_COLUMNS:
+            new_group = self.group_of_row(row)
+
+            if new_group != old_group:
+                self.unchain_row(row, old_group)
+                self.chain_row(row, new_group)
+                self.group_ids[row] = new_group
+                self.dirty_groups.add(new_group)
+
+    def recalculate_dirty(self) -> dict[int, TradeTotals | None]:
+        """Recompute only the dirty trade groups, in O(group size) each.
+
+        Returns {row: TradeTotals} for the anchors of the recalculated groups, and {row: None} for rows
+        that were anchors before and no longer are, so their calculated cells can be cleared.
+
+        With lot matching, an edit can change the matches of any later close, so every trade is recalculated.
+        """
+        if self.lot_method:
+            if not self.dirty_groups:
+                return {}
+
+            previous_anchors = set(self.totals)
+            totals = self.calculate()
+            changed = {row: None for row in previous_anchors if row not in totals}
+            changed.update(totals)
+            return changed
+
+        changed = {}
+
+        for group in self.dirty_groups:
+            previous_anchor = self.anchors[group]
+            if previous_anchor >= 0:
+                changed[previous_anchor] = None
+                self.anchors[group] = -1
+
+        for group in self.dirty_groups:
+            anchor = self.group_last[group]
+            if anchor >= 0:
+                self.anchors[group] = anchor
+                changed[anchor] = self.group_totals(group)
+                self.totals.set_group(group, changed[anchor])
+
+        self.dirty_groups.clear()
+
+        return changed
+
+    def group_totals(self, group: int) -> TradeTotals:
+        """Compute the totals of a single trade group."""
+        sums = TradeSums()
+        for row in self.iter_group(group):
+            sums.add_totals(self.cost[row], self.open_shares[row], self.proceeds[row])
+
+        return sums.totals()
+
+    def group_sums(self, group: int) -> "TradeSums":
+        """Return the running sums of every fill of a trade group."""
+        sums = TradeSums()
+        for row in self.iter_group(group):
+            sums.add(self.open_shares[row], self.open_price[row], self.cost[row], self.close_shares[row], self.close_price[row], self.proceeds[row])
+
+        return sums
+
+    def row_tuple(self, row: int, columns) -> tuple[str, ...]:
+        """Return the display strings of a row ordered like columns. Trade totals are only filled in on anchors, unknown
+        columns are empty."""
+        totals = self.totals.get(row) if any(column in RESULT_COLUMNS for column in columns) else None
+
+        return tuple(getattr(self, column)[row] if column in TEXT_COLUMNS
+                     else format_number(getattr(self, column)[row], column in SHARE_COLUMNS) if column in NUMERIC_COLUMNS
+                     else format_number(getattr(totals, column)) if totals is not None and column in RESULT_COLUMNS
+                     else "" for column in columns)
+
+    def row_values(self, row: int) -> dict[str, str]:
+        """Return the display strings of a row as {column_name: value}, including its trade totals if it is an anchor."""
+        columns = FILL_COLUMNS + RESULT_COLUMNS if row in self.totals else FILL_COLUMNS
+        return dict(zip(columns, self.row_tuple(row, columns)))
+
+
+class LedgerRowStore:
+    """Row store for a virtual EditTreeview showing a ledger the way an import does: newest fills first, with an
+    empty row below each run of fills sharing an open date."""
+
+    def __init__(self, ledger: Ledger, columns: tuple[str, ...]):
+        """Create a row store over ledger with values ordered like columns."""
+        self.ledger = ledger
+        self.columns = columns
+        self.filter_rows = None # Rows shown while a filter is applied, without separators
+        self.invalidate()
+
+    def set_filter(self, rows):
+        """Show only rows, a sequence of ledger rows in ascending order, or every row if rows is None."""
+        self.filter_rows = rows
+        self.invalidate()
+
+    def invalidate(self):
+        """Rebuild the display order on next access, after dates were edited or the ledger was cleared."""
+        self.order = array("q") # Ledger rows in append order, -1 for an empty separator row
+        self.indexed_rows = 0
+        self.temp_date = None # Code of the open date of the last row
+
+    def update_order(self):
+        """Extend the display order with rows appended to the ledger since the last access."""
+        if self.indexed_rows > len(self.ledger): # Cleared, rows of a filter applied before are gone
+            self.filter_rows = None
+            self.invalidate()
+
+        if self.filter_rows is not None:
+            if not self.indexed_rows:
+                self.order = array("q", self.filter_rows)
+                self.indexed_rows = len(self.ledger)
+            return
+
+        open_dates = self.ledger.open_date.codes
+        for row in range(self.indexed_rows, len(self.ledger)):
+            # Add empty row to separate different dates
+            if open_dates[row] != self.temp_date:
+                self.order.append(-1)
+                self.temp_date = open_dates[row]
+            self.order.append(row)
+
+        self.indexed_rows = len(self.ledger)
+
+    def __len__(self) -> int:
+        self.update_order()
+        return len(self.order)
+
+    def position(self, index: int) -> int:
+        """Convert a display index (0 is the top row) to a position in the append order."""
+        return len(self.order) - 1 - index
+
+    def iid(self, index: int) -> str:
+        """Return the item iid of a display index. Fills use their ledger iid, separators a stable generated one."""
+        position = self.position(index)
+        row = self.order[position]
+        return self.ledger.iids[row] if row >= 0 else f"separator{position}"
+
+    def __getitem__(self, index: int) -> tuple[str, ...]:
+        row = self.order[self.position(index)]
+        if row < 0:
+            return ()
+
+        return self.ledger.row_tuple(row, self.columns)
+
+
+class InternedColumn:
+    """Text column stored as int32 codes into a table of its distinct values, for tickers, sides and dates.
+
+    Reads like the list of strings it replaces, but a row costs 4 bytes instead of a pointer and a string. Date
+    columns also hold the ordinal of every distinct value, NO_DATE if it is not a date, parsed on first use.
+    """
+    __slots__ = ("codes", "values", "code_of_value", "ordinals")
+
+    def __init__(self, dates: bool=False):
+        """Create an empty column, with ordinals if dates is True."""
+        self.codes = array("i")
+        self.values = [] # Distinct value of every code
+        self.code_of_value = {}
+        self.ordinals = array("q") if dates else None
+
+    def code(self, value: str) -> int:
+        """Return the code of value, adding it to the table if it is new."""
+        code = self.code_of_value.get(value)
+        if code is None:
+            code = self.code_of_value[value] = len(self.values)
+            self.values.append(value)
+            if self.ordinals is not None:
+                self.ordinals.append(MISSING)
+        return code
+
+    def ordinal(self, row: int) -> int:
+        """Return the date ordinal of a row of a date column."""
+        code = self.codes[row]
+        ordinal = self.ordinals[code]
+        if ordinal == MISSING:
+            date = parse_date(self.values[code])
+            ordinal = self.ordinals[code] = date.toordinal() if date else NO_DATE
+        return ordinal
+
+    def append(self, value: str):
+        """Append a row."""
+        code = self.code_of_value.get(value)
+        self.codes.append(self.code(value) if code is None else code)
+
+    def extend(self, values):
+        """Append rows, adding their new distinct values first so the codes are looked up at C speed."""
+        values = values if isinstance(values, list) else list(values)
+        for value in dict.fromkeys(values):
+            if value not in self.code_of_value:
+                self.code(value)
+        self.codes.extend(map(self.code_of_value.__getitem__, values))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(map(self.values.__getitem__, self.codes[index]))
+        return self.values[self.codes[index]]
+
+    def __setitem__(self, row: int, value: str):
+        self.codes[row] = self.code(value)
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+
+class RowIds:
+    """Treeview item ids of the rows of a ledger, which are the row numbers as text. Reads like a list of strings."""
+    __slots__ = ("ledger",)
+
+    def __init__(self, ledger: Ledger):
+        self.ledger = ledger
+
+    def __len__(self) -> int:
+        return len(self.ledger)
+
+    def __getitem__(self, row: int) -> str:
+        return str(range(len(self.ledger))[row])
+
+    def __iter__(self):
+        return map(str, range(len(self.ledger)))
+
+
+class GroupKeys:
+    """(open_date, ticker, long_short) key of every trade group of a ledger, decoded from its key codes. Reads like a
+    list of tuples."""
+    __slots__ = ("ledger",)
+
+    def __init__(self, ledger: Ledger):
+        self.ledger = ledger
+
+    def __len__(self) -> int:
+        return len(self.ledger.group_first)
+
+    def __getitem__(self, group: int) -> tuple[str, str, str]:
+        ledger = self.ledger
+        return tuple(column.values[codes[group]] for column, codes in zip((ledger.open_date, ledger.ticker, ledger.long_short), ledger.key_codes))
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+class GroupRows:
+    """Rows of every trade group of a ledger in ascending order, walked from its row chain. Reads like a list of lists."""
+    __slots__ = ("ledger",)
+
+    def __init__(self, ledger: Ledger):
+        self.ledger = ledger
+
+    def __len__(self) -> int:
+        return len(self.ledger.group_first)
+
+    def __getitem__(self, group: int) -> list[int]:
+        return list(self.ledger.iter_group(group))
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+
+class AnchorTotals(Mapping):
+    """Calculated totals of a ledger as {anchor row: TradeTotals}, stored as one int64 array per field indexed by group.
+
+    A row has totals while it is the anchor of its group in Ledger.anchors.
+    """
+    __slots__ = ("ledger",) + RESULT_COLUMNS
+
+    def __init__(self, ledger: Ledger):
+        self.ledger = ledger
+        for column in RESULT_COLUMNS:
+            setattr(self, column, array("q"))
+
+    def append_group(self):
+        """Add the fields of a new group."""
+        for column in RESULT_COLUMNS:
+            getattr(self, column).append(0)
+
+    def set_group(self, group: int, totals: TradeTotals):
+        """Store the totals of a group, whose anchor is set in Ledger.anchors."""
+        for column, value in zip(RESULT_COLUMNS, totals):
+            getattr(self, column)[group] = value
+
+    def set_groups(self, totals: list[TradeTotals]):
+        """Store the totals of every group at once."""
+        for column, values in zip(RESULT_COLUMNS, zip(*totals)):
+            setattr(self, column, array("q", values))
+
+    def __len__(self) -> int:
+        return len(self.ledger.anchors) - self.ledger.anchors.count(-1)
+
+    def __contains__(self, row) -> bool:
+        ledger = self.ledger
+        return isinstance(row, int) and 0 <= row < len(ledger) and ledger.anchors[ledger.group_ids[row]] == row
+
+    def __getitem__(self, row: int) -> TradeTotals:
+        if row not in self:
+            raise KeyError(row)
+
+        group = self.ledger.group_ids[row]
+        return TradeTotals(self.total_cost[group], self.cost_basis[group], self.profit_loss[group], self.net_percentage[group])
+
+    def __iter__(self):
+        return (anchor for anchor in self.ledger.anchors if anchor >= 0)
+
+    def items(self):
+        """Return (anchor row, TradeTotals) pairs in group order, read straight from the arrays."""
+        return [(anchor, TradeTotals(*values)) for anchor, *values in zip(self.ledger.anchors, self.total_cost, self.cost_basis, self.profit_loss, self.net_percentage)
+                if anchor >= 0]
+
+
+class TradeSums:
+    """Running sums of the fills of one trade group, from which its totals and statistics are calculated.
+
+    Ledger, Rollups and the batch CLI all accumulate trades through this class, so they calculate alike. Values are
+    column values: whole shares, cents, MISSING for empty cells.
+    """
+
+    __slots__ = ("fills", "cost", "shares", "proceeds", "volume", "fees", "closed")
+
+    def __init__(self):
+        """Create the sums of a trade without fills."""
+        self.fills = self.cost = self.shares = self.proceeds = self.volume = self.fees = 0
+        self.closed = False # A fill closed shares
+
+    def add_totals(self, cost: int, open_shares: int, proceeds: int):
+        """Add the columns of a fill that its trade totals depend on."""
+        self.fills += 1
+        if cost != MISSING:
+            self.cost += cost
+        if open_shares != MISSING:
+            self.shares += open_shares
+        if proceeds != MISSING:
+            self.proceeds += proceeds
+
+    def add(self, open_shares: int, open_price: int, cost: int, close_shares: int, close_price: int, proceeds: int):
+        """Add every numeric column of a fill, for totals and statistics."""
+        self.add_totals(cost, open_shares, proceeds)
+
+        if open_shares != MISSING:
+            self.volume += open_shares
+            if open_price != MISSING and cost != MISSING:
+                self.fees += cost - open_shares * open_price
+
+        if close_shares != MISSING and close_shares > 0:
+            self.closed = True
+            self.volume += close_shares
+            if close_price != MISSING and proceeds != MISSING:
+                self.fees += close_shares * close_price - proceeds
+
+    def totals(self) -> TradeTotals:
+        """Return the totals of the trade, summing every fill."""
+        return calculate_totals(self.cost, self.shares, self.proceeds)
+
+    def statistics(self, profit_loss: int) -> dict:
+        """Return the {statistic: value} the trade contributes to rollups (see rollups.STATISTICS), given its
+        profit/loss, which lot matching may have changed from totals()."""
+        return {
+            "trades": int(self.closed),
+            "wins": int(self.closed and profit_loss > 0),
+            "profit_loss": profit_loss,
+            "volume": self.volume,
+            "fees": self.fees,
+        }
+
+
+def calculate_totals(total_cost: int, total_shares: int, total_net_proceeds: int) -> TradeTotals:
+    """Calculate total cost, cost basis, profit/loss and net percentage of a trade with exact integer arithmetic.
+
+    Money is in cents, and cost basis and net percentage are rounded half away from zero.
+    """
+    cost_basis = divide_rounded(total_cost, total_shares) if total_shares else 0
+    profit_loss = total_net_proceeds - total_cost
+    net_percentage = divide_rounded(profit_loss * 100 * 100, total_cost) if total_cost else 0 # Hundredths of a percent
+
+    return TradeTotals(total_cost, cost_basis, profit_loss, net_percentage)
+
+
+def divide_rounded(numerator: int, denominator: int) -> int:
+    """Divide integers, rounding half away from zero."""
+    quotient, remainder = divmod(abs(numerator), abs(denominator))
+    if 2 * remainder >= abs(denominator):
+        quotient += 1
+
+    return quotient if (numerator < 0) == (denominator < 0) else -quotient
+
+
+def parse_number(value, integer: bool=False) -> int:
+    """Convert a cell value to whole shares if integer is True, otherwise to cents. Empty cells become MISSING.
+
+    Decimal strings are converted digit by digit, so "0.29" is exactly 29 cents. Cents are rounded half away from
+    zero, and shares must be whole numbers. Raises ValueError on anything else.
+    """
+    if value is None or value == "":
+        return MISSING
+
+    if isinstance(value, int):
+        return value if integer else value * 100
+
+    text = str(value).strip()
+    sign = -1 if text.startswith("-") else 1
+    whole, _, fraction = text.lstrip("+-").partition(".")
+
+    # Fast path for plain decimals like 760.32
+    if (whole or fraction) and (not whole or whole.isascii() and whole.isdigit()) and (not fraction or fraction.isascii() and fraction.isdigit()):
+        if integer:
+            if fraction.strip("0"):
+                raise ValueError(f"Shares must be whole numbers: {value!r}")
+            return sign * int(whole or "0")
+
+        cents = int(whole or "0") * 100 + int(fraction[:2].ljust(2, "0"))
+        if fraction[2:3] >= "5":
+            cents += 1
+        return sign * cents
+
+    # Exponents, floats and other forms Decimal understands
+    try:
+        number = Decimal(text) if not isinstance(value, float) else Decimal(repr(value))
+    except InvalidOperation:
+        raise ValueError(f"Not a number: {value!r}") from None
+
+    if not number.is_finite():
+        raise ValueError(f"Not a number: {value!r}")
+
+    if integer:
+        if number != number.to_integral_value():
+            raise ValueError(f"Shares must be whole numbers: {value!r}")
+        return int(number)
+
+    return int((number * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def parse_date(value) -> datetime.date | None:
+    """Convert a date cell in any of DATE_FORMATS to a date. Return None if it is empty or not a date."""
+    if isinstance(value, datetime.date):
+        return value
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(value), date_format).date()
+        except ValueError:
+            pass
+
+    return None
+
+
+def normalize_date(value) -> str:
+    """Convert a date cell to ISO format (YYYY-MM-DD). Text that is not a date is kept as is."""
+    date = parse_date(value)
+    return date.isoformat() if date else str(value or "")
+
+
+def format_number(value: int, integer: bool=False) -> str:
+    """Convert a column value to its display string: whole shares if integer is True, otherwise cents as 0.00.
+
+    MISSING becomes an empty cell.
+    """
+    if value == MISSING:
+        return ""
+
+    if integer:
+        return str(value)
+
+    sign = "-" if value < 0 else ""
+    whole, cents = divmod(abs(value), 100)
+    return f"{sign}{whole}.{cents:02d}"
@@ -0,0 +1,168 @@
+from array import array
+from collections import deque
+from typing import NamedTuple
+
+from ledger import MISSING, NO_DATE, Ledger, divide_rounded
+
+
+LOT_METHODS = ("fifo", "lifo", "specific")
+
+
+class OpenLot(NamedTuple):
+    """Shares of an opening fill that are still open, with the part of its cost they carry."""
+    row: int
+    shares: int
+    cost: int
+
+
+class LotReport:
+    """Result of matching closes to opens. Matches are held in int64 columns so millions of them stay compact."""
+
+    def __init__(self):
+        """Create an empty report."""
+        self.open_rows = array("q")
+        self.close_rows = array("q")
+        self.shares = array("q")
+        self.costs = array("q")
+        self.proceeds = array("q")
+        self.open_lots = [] # OpenLot of every lot with shares left, in position then matching order
+        self.unmatched = [] # (close_row, shares) of closes without enough open shares before them
+
+    def __len__(self) -> int:
+        return len(self.shares)
+
+    def realized_by_row(self, rows: int) -> tuple[array, array]:
+        """Return the realized profit/loss and the matched cost of every closing row, for a ledger of `rows` rows."""
+        profit_loss = array("q", [0]) * rows
+        matched_cost = array("q", [0]) * rows
+
+        for close_row, cost, proceeds in zip(self.close_rows, self.costs, self.proceeds):
+            profit_loss[close_row] += proceeds - cost
+            matched_cost[close_row] += cost
+
+        return profit_loss, matched_cost
+
+
+def match_lots(ledger: Ledger, method: str="fifo") -> LotReport:
+    """Match the closing fills of a ledger to its opening fills, per ticker and long/short position.
+
+    Every row can open shares (open_shares, cost) and close shares (close_shares, proceeds). Fills are replayed by
+    date, opens before closes on the same day, and each close consumes open lots:
+
+    fifo: Oldest lots first.
+    lifo: Newest lots first.
+    specific: Lots of the closing row's own trade (same open date) first, then the oldest lots.
+
+    Partially closed lots keep their remaining shares and cost, so closes can span rows and days. Cost and proceeds
+    are split between lots in proportion to shares, with the last part taking the remainder so no cent is lost.
+    Profit/loss is proceeds minus cost, like the trade totals.
+
+    Every fill is queued and dequeued once, so matching runs in linear time after sorting the fills by date, which
+    is itself close to linear since ledgers are mostly in date order already.
+    """
+    if method not in LOT_METHODS:
+        raise ValueError(f"Unknown lot matching method: {method!r}")
+
+    report = LotReport()
+    open_ordinal, close_ordinal = ledger.open_date.ordinal, ledger.close_date.ordinal
+
+    # (date ordinal, 0 for opens and 1 for closes, row)
+    events = []
+    for row, (open_shares, close_shares) in enumerate(zip(ledger.open_shares, ledger.close_shares)):
+        if open_shares != MISSING and open_shares > 0:
+            events.append((open_ordinal(row), 0, row))
+        if close_shares != MISSING and close_shares > 0:
+            closed = close_ordinal(row)
+            events.append((open_ordinal(row) if closed == NO_DATE else closed, 1, row))
+    events.sort()
+
+    # {(ticker, long_short): deque of [row, shares left, cost left]}, or {(ticker, long_short): {open_date: deque}}
+    # plus a deque of open dates in opening order for the specific method
+    positions = {}
+    open_order = {}
+    specific = method == "specific"
+    newest_first = method == "lifo"
+
+    for _, closing, row in events:
+        key = (ledger.ticker[row], ledger.long_short[row])
+
+        if not closing:
+            shares = ledger.open_shares[row]
+            cost = ledger.cost[row]
+            if cost == MISSING:
+                price = ledger.open_price[row]
+                cost = 0 if price == MISSING else price * shares
+
+            if specific:
+                lots_by_date = positions.setdefault(key, {})
+                lots = lots_by_date.get(ledger.open_date[row])
+                if not lots:
+                    lots = lots_by_date[ledger.open_date[row]] = deque()
+                    open_order.setdefault(key, deque()).append(ledger.open_date[row])
+                lots.append([row, shares, cost])
+            else:
+                positions.setdefault(key, deque()).append([row, shares, cost])
+            continue
+
+        shares = ledger.close_shares[row]
+        proceeds = ledger.proceeds[row]
+        if proceeds == MISSING:
+            price = ledger.close_price[row]
+            proceeds = 0 if price == MISSING else price * shares
+
+        if specific:
+            lots_by_date = positions.get(key, {})
+            shares, proceeds = consume(report, lots_by_date.get(ledger.open_date[row], ()), False, row, shares, proceeds)
+
+            order = open_order.get(key, ())
+            while shares and order:
+                lots = lots_by_date.get(order[0])
+                if not lots:
+                    order.popleft()
+                    continue
+                shares, proceeds = consume(report, lots, False, row, shares, proceeds)
+        else:
+            shares, proceeds = consume(report, positions.get(key, ()), newest_first, row, shares, proceeds)
+
+        if shares:
+            report.unmatched.append((row, shares))
+
+    for key, lots in positions.items():
+        for lot_queue in (lots.values() if specific else (lots,)):
+            report.open_lots.extend(OpenLot(*lot) for lot in lot_queue)
+
+    return report
+
+
+def consume(report: LotReport, lots: deque, newest_first: bool, row: int, shares: int, proceeds: int) -> tuple[int, int]:
+    """Close `shares` shares of a closing row from lots, recording every match in report.
+
+    Returns the shares and proceeds left over when lots run out.
+    """
+    while shares and lots:
+        lot = lots[-1] if newest_first else lots[0]
+        lot_row, lot_shares, lot_cost = lot
+        taken = min(shares, lot_shares)
+
+        cost = lot_cost if taken == lot_shares else divide_rounded(lot_cost * taken, lot_shares)
+        matched_proceeds = proceeds if taken == shares else divide_rounded(proceeds * taken, shares)
+
+        report.open_rows.append(lot_row)
+        report.close_rows.append(row)
+        report.shares.append(taken)
+        report.costs.append(cost)
+        report.proceeds.append(matched_proceeds)
+
+        shares -= taken
+        proceeds -= matched_proceeds
+
+        if taken == lot_shares:
+            if newest_first:
+                lots.pop()
+            else:
+                lots.popleft()
+        else:
+            lot[1] = lot_shares - taken
+            lot[2] = lot_cost - cost
+
+    return shares, proceeds
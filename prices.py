@@ -0,0 +1,236 @@
+import bisect
+import csv
+import datetime
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+from collections import OrderedDict
+from typing import NamedTuple
+
+from ledger import MISSING, Ledger, parse_date, parse_number
+
+
+PRICE_MAGIC = b"TTPRICE1"
+PRICE_SUFFIX = ".prices"
+PRICE_COLUMNS = ("date", "open", "high", "low", "close") # Date ordinals, then prices in cents, MISSING if unknown
+HEADER = struct.Struct("<8sQ1s7x") # Magic, rows, byte order of the columns ("l" or "b")
+CACHE_SIZE = 64 # Tickers kept mapped
+
+
+class TickerPrices:
+    """Memory-mapped daily prices of one ticker. Every column is a zero-copy int64 view into the file."""
+
+    def __init__(self, path: str):
+        """Map the price file at path."""
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, rows, byteorder = HEADER.unpack_from(self.map)
+        if magic != PRICE_MAGIC:
+            self.close()
+            raise ValueError(f"Not a price file: {path}")
+
+        self.views = [memoryview(self.map)] # Released before unmapping, which fails while views exist
+        self.columns = {}
+        for number, column in enumerate(PRICE_COLUMNS):
+            start = HEADER.size + number * rows * 8
+            values = self.views[0][start:start + rows * 8].cast("q")
+            self.views.append(values)
+            if byteorder != sys.byteorder[:1].encode(): # Written on a machine of the other byte order, copy and swap
+                values = array("q", values)
+                values.byteswap()
+            self.columns[column] = values
+
+    def close(self):
+        """Release the views, unmap and close the file."""
+        for view in reversed(getattr(self, "views", [])):
+            view.release()
+        self.views, self.columns = [], {}
+        self.map.close()
+        self.file.close()
+
+    def __len__(self) -> int:
+        return len(self.columns["date"])
+
+    def close_on(self, day: int) -> int | None:
+        """Return the last known close on or before the day ordinal, None if there is none."""
+        closes = self.columns["close"]
+        index = bisect.bisect_right(self.columns["date"], day) - 1
+        while index >= 0 and closes[index] == MISSING:
+            index -= 1
+        return closes[index] if index >= 0 else None
+
+    def rows(self) -> dict[int, tuple[int, ...]]:
+        """Return {date ordinal: (open, high, low, close)} of every day."""
+        return dict(zip(self.columns["date"], zip(*(self.columns[column] for column in PRICE_COLUMNS[1:]))))
+
+
+class PriceStore:
+    """Daily prices of tickers stored in a directory, one columnar file per ticker ({TICKER}.prices), read through
+    memory maps. The files of the most recently used tickers stay mapped. Everything is local, nothing is downloaded.
+
+    File layout: HEADER, then every column of PRICE_COLUMNS as int64 values in date order.
+    """
+
+    def __init__(self, directory: str, cache_size: int=CACHE_SIZE):
+        """Open the price store in directory, creating it if needed."""
+        self.directory = directory
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # {ticker: TickerPrices or None}, least recently used first
+        os.makedirs(directory, exist_ok=True)
+
+    def close(self):
+        """Unmap every cached ticker."""
+        for prices in self.cache.values():
+            if prices is not None:
+                prices.close()
+        self.cache.clear()
+
+    def path(self, ticker: str) -> str:
+        """Return the path of the price file of a ticker."""
+        return os.path.join(self.directory, ticker.upper() + PRICE_SUFFIX)
+
+    def ticker_prices(self, ticker: str) -> TickerPrices | None:
+        """Return the prices of a ticker, None if the store has none."""
+        ticker = ticker.upper()
+        if ticker in self.cache:
+            self.cache.move_to_end(ticker)
+            return self.cache[ticker]
+
+        path = self.path(ticker)
+        prices = TickerPrices(path) if os.path.exists(path) and os.path.getsize(path) > HEADER.size else None
+
+        self.cache[ticker] = prices
+        if len(self.cache) > self.cache_size:
+            _, evicted = self.cache.popitem(last=False)
+            if evicted is not None:
+                evicted.close()
+
+        return prices
+
+    def evict(self, ticker: str):
+        """Unmap a ticker, before its file is replaced."""
+        prices = self.cache.pop(ticker.upper(), None)
+        if prices is not None:
+            prices.close()
+
+    def closes(self, requests) -> list[int | None]:
+        """Return the close on or before the day of every (ticker, day ordinal) request, None where there is none.
+
+        Requests are grouped by ticker, so each price file is looked up once per batch.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+
+        positions = {}
+        for position, (ticker, day) in enumerate(requests):
+            positions.setdefault(ticker.upper(), []).append(position)
+
+        for ticker, ticker_positions in positions.items():
+            prices = self.ticker_prices(ticker)
+            if prices is not None:
+                for position in ticker_positions:
+                    results[position] = prices.close_on(requests[position][1])
+
+        return results
+
+    def import_csv(self, path: str, ticker: str=None) -> int:
+        """Merge the daily prices of an OHLC or close-only CSV file into the store and return the rows read.
+
+        The file needs Date and Close columns, Open, High and Low are optional. Tickers come from a Ticker or Symbol
+        column, otherwise from ticker, otherwise from the file name (SQQQ.csv).
+        """
+        with open(path, "r", newline="", encoding="utf-8-sig") as file:
+            reader = csv.reader(file)
+            header = [name.strip().lower() for name in next(reader, [])]
+            if "date" not in header or "close" not in header:
+                raise ValueError(f"Price files need Date and Close columns: {path}")
+
+            position = {name: header.index(name) for name in header}
+            ticker_position = position.get("ticker", position.get("symbol"))
+            default_ticker = (ticker or os.path.splitext(os.path.basename(path))[0]).upper()
+
+            prices = {} # {ticker: {date ordinal: (open, high, low, close)}}
+            count = 0
+            for record in reader:
+                if len(record) <= position["close"]:
+                    continue
+                date = parse_date(record[position["date"]].strip())
+                if date is None:
+                    continue
+
+                values = tuple(parse_price(record[position[column]]) if column in position and position[column] < len(record) else MISSING
+                               for column in PRICE_COLUMNS[1:])
+                record_ticker = record[ticker_position].strip().upper() if ticker_position is not None else default_ticker
+                prices.setdefault(record_ticker, {})[date.toordinal()] = values
+                count += 1
+
+        for record_ticker, days in prices.items():
+            existing = self.ticker_prices(record_ticker)
+            if existing is not None:
+                days = {**existing.rows(), **days}
+            self.write(record_ticker, days)
+
+        return count
+
+    def write(self, ticker: str, days: dict[int, tuple[int, ...]]):
+        """Replace the price file of a ticker with {date ordinal: (open, high, low, close)}."""
+        self.evict(ticker)
+
+        ordered = sorted(days.items())
+        columns = [array("q", (day for day, values in ordered))]
+        columns += [array("q", (values[number] for day, values in ordered)) for number in range(len(PRICE_COLUMNS) - 1)]
+
+        path = self.path(ticker)
+        with open(path + ".tmp", "wb") as file:
+            file.write(HEADER.pack(PRICE_MAGIC, len(ordered), sys.byteorder[:1].encode()))
+            for values in columns:
+                values.tofile(file)
+        os.replace(path + ".tmp", path)
+
+
+def parse_price(text: str) -> int:
+    """Convert a price cell to cents, MISSING if it is empty or not a number (some exports write null)."""
+    try:
+        return parse_number(text.strip())
+    except ValueError:
+        return MISSING
+
+
+class Valuation(NamedTuple):
+    """Unrealized profit/loss of the open lots of a ledger at the last close on or before a day. Money is in cents."""
+    unrealized: int # Over the lots with a price
+    by_ticker: dict # {ticker: unrealized profit/loss}
+    lots: int # Open lots
+    unpriced: list # Tickers of open lots without a price
+
+
+def mark_to_market(ledger: Ledger, store: PriceStore, day: datetime.date=None) -> Valuation:
+    """Value the open lots of a ledger at the last close on or before day (default today), in one batched lookup.
+
+    Lots are those of the ledger's lot matching method, FIFO if it has none. Like the realized profit/loss of the
+    ledger, a lot's unrealized profit/loss is what closing it would bring in, shares * close, minus its cost left.
+    """
+    from lots import match_lots # lots imports ledger, keep this module light to import
+
+    report = ledger.lot_report if ledger.lot_method and ledger.lot_report is not None else match_lots(ledger, ledger.lot_method or "fifo")
+    day = (day or datetime.date.today()).toordinal()
+
+    lots = report.open_lots
+    tickers = [ledger.ticker[lot.row] for lot in lots]
+    closes = store.closes((ticker, day) for ticker in tickers)
+
+    unrealized, by_ticker, unpriced = 0, {}, []
+    for lot, ticker, close in zip(lots, tickers, closes):
+        if close is None:
+            if ticker not in unpriced:
+                unpriced.append(ticker)
+            continue
+        value = lot.shares * close - lot.cost
+        unrealized += value
+        by_ticker[ticker] = by_ticker.get(ticker, 0) + value
+
+    return Valuation(unrealized, by_ticker, len(lots), unpriced)
@@ -0,0 +1,191 @@
+import datetime
+
+from array import array
+from typing import NamedTuple
+
+from ledger import Ledger, parse_date
+
+
+STATISTICS = ("trades", "wins", "profit_loss", "volume", "fees")
+
+
+class RollupSummary(NamedTuple):
+    """Totals of the trades of a date range. Money is in cents."""
+    trades: int # Closed trades
+    wins: int # Closed trades with a profit
+    profit_loss: int
+    volume: int # Shares opened and closed
+    fees: int # Cost above shares * price on opens, plus proceeds below shares * price on closes
+
+    @property
+    def win_rate(self) -> float:
+        """Return the share of closed trades with a profit, 0.0 without closed trades."""
+        return self.wins / self.trades if self.trades else 0.0
+
+
+class DayFenwick:
+    """Fenwick trees of every statistic over consecutive days, for O(log n) point updates and date-range sums.
+
+    The covered days grow by doubling when a day outside them is added, which rebuilds the trees in linear time.
+    """
+
+    def __init__(self):
+        """Create trees covering no days."""
+        self.first_day = 0 # Ordinal of the day at index 0
+        self.size = 0
+        self.values = {statistic: array("q") for statistic in STATISTICS} # Plain value of every day, for rebuilds
+        self.trees = {statistic: array("q") for statistic in STATISTICS}
+
+    def cover(self, day: int):
+        """Grow the covered days to include day."""
+        if self.size and self.first_day <= day < self.first_day + self.size:
+            return
+
+        if not self.size:
+            first_day, last_day = day, day
+        else:
+            first_day, last_day = min(self.first_day, day), max(self.first_day + self.size - 1, day)
+
+        size = max(self.size * 2, last_day - first_day + 1, 64)
+        if day < self.first_day: # Grow towards the past, leaving room for more
+            first_day = last_day - size + 1
+
+        for statistic in STATISTICS:
+            values = array("q", [0]) * size
+            old = self.values[statistic]
+            offset = self.first_day - first_day
+            values[offset:offset + len(old)] = old
+            self.values[statistic] = values
+            self.trees[statistic] = build_tree(values)
+
+        self.first_day, self.size = first_day, size
+
+    def add(self, day: int, deltas: dict):
+        """Add {statistic: delta} to a day."""
+        self.cover(day)
+        index = day - self.first_day
+
+        for statistic, delta in deltas.items():
+            if delta:
+                self.values[statistic][index] += delta
+                tree = self.trees[statistic]
+                position = index + 1
+                while position <= self.size:
+                    tree[position - 1] += delta
+                    position += position & -position
+
+    def prefix(self, statistic: str, day: int) -> int:
+        """Return the sum of a statistic over every covered day up to and including day."""
+        position = min(day - self.first_day + 1, self.size)
+        tree = self.trees[statistic]
+        total = 0
+
+        while position > 0:
+            total += tree[position - 1]
+            position -= position & -position
+
+        return total
+
+    def range_sum(self, statistic: str, first_day: int, last_day: int) -> int:
+        """Return the sum of a statistic from first_day to last_day, both included."""
+        if not self.size or last_day < first_day:
+            return 0
+
+        return self.prefix(statistic, last_day) - self.prefix(statistic, first_day - 1)
+
+
+class Rollups:
+    """Per-day and per-ticker trade statistics of a ledger, kept up to date as trades are recalculated.
+
+    Every trade group contributes its statistics to the day it was opened, both overall and for its ticker, so any
+    date range of any ticker sums in O(log n).
+    """
+
+    def __init__(self):
+        """Create empty rollups."""
+        self.clear()
+
+    def clear(self):
+        """Forget every trade."""
+        self.overall = DayFenwick()
+        self.by_ticker = {} # {ticker: DayFenwick}
+        self.contributions = {} # {group: {statistic: value}} as last added
+        self.anchor_groups = {} # {anchor row: group} of the trades last added
+        self.last_day = None # Ordinal of the newest trade day
+
+    def rebuild(self, ledger: Ledger):
+        """Recompute every trade of a freshly calculated ledger."""
+        self.clear()
+        self.update(ledger, ledger.totals)
+
+    def update(self, ledger: Ledger, changed: dict) -> set[int]:
+        """Apply recalculated trades, given like Ledger.recalculate_dirty returns them: {row: totals or None}.
+
+        Returns the groups whose contribution was recomputed.
+        """
+        groups = set()
+        for row in changed:
+            groups.add(self.anchor_groups.pop(row, None))
+            if row < len(ledger):
+                groups.add(ledger.group_ids[row])
+        groups.discard(None)
+
+        for group in groups:
+            open_date, ticker, _ = ledger.group_keys[group]
+            date = parse_date(open_date)
+            if date is None:
+                continue # Not a date, no day to file the trade under
+            day = date.toordinal()
+
+            contribution = self.group_statistics(ledger, group)
+            previous = self.contributions.get(group, {})
+            deltas = {statistic: contribution.get(statistic, 0) - previous.get(statistic, 0) for statistic in STATISTICS}
+
+            self.overall.add(day, deltas)
+            self.by_ticker.setdefault(ticker, DayFenwick()).add(day, deltas)
+
+            if contribution:
+                self.contributions[group] = contribution
+                self.anchor_groups[ledger.anchors[group]] = group
+                self.last_day = day if self.last_day is None else max(self.last_day, day)
+            else:
+                self.contributions.pop(group, None)
+
+        return groups
+
+    @staticmethod
+    def group_statistics(ledger: Ledger, group: int) -> dict:
+        """Return {statistic: value} of a trade group, or {} if it has no rows or totals."""
+        totals = ledger.totals.get(ledger.anchors[group])
+        if totals is None:
+            return {}
+
+        return ledger.group_sums(group).statistics(totals.profit_loss)
+
+    def summary(self, start: datetime.date=None, end: datetime.date=None, ticker: str=None) -> RollupSummary:
+        """Return the totals of trades opened from start to end, both included, of one ticker or of every ticker."""
+        tree = self.overall if ticker is None else self.by_ticker.get(ticker)
+        if tree is None or not tree.size:
+            return RollupSummary(0, 0, 0, 0, 0)
+
+        first_day = start.toordinal() if start else tree.first_day
+        last_day = end.toordinal() if end else tree.first_day + tree.size - 1
+
+        return RollupSummary(*(tree.range_sum(statistic, first_day, last_day) for statistic in STATISTICS))
+
+    def tickers(self) -> list[str]:
+        """Return every ticker with trades, sorted."""
+        return sorted(self.by_ticker)
+
+
+def build_tree(values: array) -> array:
+    """Return the Fenwick tree of values, built in linear time."""
+    tree = array("q", values)
+    size = len(tree)
+
+    for position in range(1, size + 1):
+        parent = position + (position & -position)
+        if parent <= size:
+            tree[parent - 1] += tree[position - 1]
+
+    return tree
@@ -0,0 +1,87 @@
+from ledger import MISSING, NO_DATE, RESULT_COLUMNS, TEXT_COLUMNS, Ledger
+
+
+NUMERIC_VALIDATIONS = ("integer", "price", "signed_price")
+DATE_COLUMNS = ("open_date", "close_date")
+
+
+class SortKeys:
+    """Sort keys of ledger columns, computed once per column and cached until rows change.
+
+    Columns validated as numbers sort by the ledger's integer values, so no cell string is parsed again. Date columns
+    sort by date, other text columns case insensitively, and calculated columns by the totals of anchor rows. Empty
+    cells have a None key and always sort last.
+    """
+
+    def __init__(self, ledger: Ledger, column_validation: dict[str, str]=None):
+        """Create a cache of sort keys over ledger. column_validation maps columns to validation types, see EditTreeview."""
+        self.ledger = ledger
+        self.column_validation = column_validation or {}
+        self.invalidate()
+
+    def invalidate(self, columns: tuple[str, ...]=None):
+        """Forget the keys of columns, or of every column if columns is None."""
+        if columns is None:
+            self.keys = {} # {column: [key of every row]}
+        else:
+            for column in columns:
+                self.keys.pop(column, None)
+
+    def invalidate_rows(self, rows):
+        """Recompute the cached keys of edited or recalculated rows."""
+        for column, keys in self.keys.items():
+            for row in rows:
+                if row < len(keys):
+                    keys[row] = self.key(column, row)
+
+    def column_keys(self, column: str) -> list:
+        """Return the key of every row for a column, extending the cache with rows appended since it was built."""
+        keys = self.keys.setdefault(column, [])
+
+        if len(keys) > len(self.ledger):
+            keys.clear()
+        if len(keys) < len(self.ledger):
+            keys.extend(self.key(column, row) for row in range(len(keys), len(self.ledger)))
+
+        return keys
+
+    def key(self, column: str, row: int):
+        """Compute the sort key of one cell."""
+        ledger = self.ledger
+
+        if column in RESULT_COLUMNS:
+            totals = ledger.totals.get(row)
+            return None if totals is None else getattr(totals, column)
+
+        if column in TEXT_COLUMNS:
+            if column in DATE_COLUMNS:
+                ordinal = getattr(ledger, column).ordinal(row)
+                return None if ordinal == NO_DATE else ordinal
+            text = getattr(ledger, column)[row]
+            if not text:
+                return None
+            if self.column_validation.get(column) in NUMERIC_VALIDATIONS:
+                try:
+                    return float(text)
+                except ValueError:
+                    return None
+            return text.casefold()
+
+        value = getattr(ledger, column)[row]
+        return None if value == MISSING else value
+
+    def sort(self, rows, order: list[tuple[str, bool]]) -> list[int]:
+        """Return rows sorted by order, a list of (column, descending) from the primary key to the last one.
+
+        Uses one stable sort per key from the last to the primary one, with empty cells last in either direction.
+        """
+        rows = list(rows)
+
+        for column, descending in reversed(order):
+            keys = self.column_keys(column)
+            present = [row for row in rows if keys[row] is not None]
+            missing = [row for row in rows if keys[row] is None]
+            present.sort(key=keys.__getitem__, reverse=descending)
+            rows = present + missing
+
+        return rows
@@ -0,0 +1,58 @@
+import csv
+import datetime
+import random
+
+import pytest
+
+from ledger import FILL_COLUMNS, Ledger
+
+
+TICKERS = ("SQQQ", "TQQQ", "AAPL", "MSFT")
+
+
+def random_fills(count: int, seed: int=0) -> list[dict]:
+    """Return count fills as {column_name: text} dicts over a few tickers and days, about half of them closed."""
+    generator = random.Random(seed)
+    first_day = datetime.date(2024, 9, 2)
+    fills = []
+
+    for _ in range(count):
+        open_date = first_day + datetime.timedelta(days=generator.randrange(40))
+        shares = generator.randrange(1, 200)
+        price = generator.randrange(100, 50000) # Cents
+        fill = dict.fromkeys(FILL_COLUMNS, "")
+        fill.update(open_date=open_date.strftime("%m/%d/%y"), ticker=generator.choice(TICKERS), long_short=generator.choice(("Long", "Short")),
+                    open_shares=str(shares), open_price=f"{price / 100:.2f}", cost=f"{(shares * price + generator.randrange(0, 100)) / 100:.2f}")
+
+        if generator.random() < 0.5:
+            close_date = open_date + datetime.timedelta(days=generator.randrange(3))
+            close_price = price + generator.randrange(-500, 500)
+            fill.update(close_date=close_date.strftime("%m/%d/%y"), close_shares=str(shares), close_price=f"{close_price / 100:.2f}",
+                        proceeds=f"{shares * close_price / 100:.2f}")
+
+        fills.append(fill)
+
+    return fills
+
+
+def write_fills(path, fills: list[dict]):
+    """Write fills as a CSV file in the application's own layout."""
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=FILL_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(fills)
+
+
+def ledger_of(fills: list[dict], lot_method: str=None) -> Ledger:
+    """Return a freshly calculated ledger of fills."""
+    ledger = Ledger()
+    ledger.lot_method = lot_method
+    for fill in fills:
+        ledger.append(fill)
+    ledger.calculate()
+    return ledger
+
+
+@pytest.fixture
+def fills() -> list[dict]:
+    return random_fills(400)
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import ledger_of
+
+import batch
+
+from ledger import parse_date
+from rollups import Rollups
+
+
+@pytest.mark.parametrize("lot_method", [None, "fifo", "lifo", "specific"])
+def test_stream_matches_ledger_and_rollups(fills, lot_method):
+    ledger = ledger_of(fills, lot_method)
+    rollups = Rollups()
+    rollups.rebuild(ledger)
+
+    stream = batch.TradeStream(lot_method=lot_method)
+    trades = {key: (count, totals) for key, count, totals in stream.trades(fills)}
+
+    assert trades == {ledger.group_keys[group]: (len(ledger.group_rows[group]), ledger.totals[anchor]) for group, anchor in enumerate(ledger.anchors)}
+
+    summaries = stream.summaries()
+    assert summaries.pop(batch.ALL_TICKERS) == rollups.summary()
+    assert summaries == {ticker: rollups.summary(ticker=ticker) for ticker in rollups.tickers()}
+
+
+def test_sorted_stream_matches_unsorted(fills):
+    ordered = sorted(fills, key=lambda fill: parse_date(fill["open_date"]))
+
+    sorted_stream, stream = batch.TradeStream(sorted_input=True), batch.TradeStream()
+    assert sorted(sorted_stream.trades(ordered)) == sorted(stream.trades(ordered))
+    assert sorted_stream.summaries() == stream.summaries()
+
+    with pytest.raises(ValueError):
+        list(batch.TradeStream(sorted_input=True).trades(fills))
@@ -0,0 +1,18 @@
+import datetime
+
+import benchmark
+import broker_import
+
+from ledger import parse_date
+
+
+def test_generated_ledger_is_in_date_order_within_its_years(tmp_path):
+    path = str(tmp_path / "ledger.csv")
+    benchmark.generate_ledger(path, 5000)
+
+    fills = list(broker_import.read_fills(path))
+    days = [parse_date(fill["open_date"]) for fill in fills]
+
+    assert len(fills) == 5000
+    assert days == sorted(days)
+    assert days[-1] - days[0] <= datetime.timedelta(days=round(benchmark.TRADING_YEARS * 365.25))
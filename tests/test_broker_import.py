@@ -0,0 +1,107 @@
+import pytest
+
+from conftest import random_fills, write_fills
+
+import broker_import
+
+
+def follow_all(follower, max_bytes: int) -> list[dict]:
+    """Read every fill of a follower in chunks of max_bytes, the last line even without a line break."""
+    fills = []
+    while True:
+        offset = follower.offset
+        fills += follower.read(max_bytes=max_bytes)
+        if follower.offset == offset:
+            return fills + follower.read(max_bytes=max_bytes, final=True)
+
+
+@pytest.mark.parametrize("max_bytes", [200, 1000, broker_import.FOLLOW_READ_BYTES])
+def test_follower_chunks_match_full_read(tmp_path, fills, max_bytes):
+    path = tmp_path / "fills.csv"
+    write_fills(path, fills)
+
+    assert follow_all(broker_import.FileFollower(str(path)), max_bytes) == list(broker_import.read_fills(str(path)))
+
+
+@pytest.mark.parametrize("max_bytes", [150, 333, 1000])
+def test_follower_keeps_quoted_line_breaks_together(tmp_path, max_bytes):
+    path = tmp_path / "notes.csv"
+    lines = [",".join(broker_import.FILL_COLUMNS) + ",notes"]
+    lines += [f'09/06/24,T{number},Long,10,1.00,10.00,,,,,"note {number}\nline two ""quoted""\nline three"' for number in range(30)]
+    path.write_text("\n".join(lines) + "\n")
+
+    fills = follow_all(broker_import.FileFollower(str(path)), max_bytes)
+
+    assert fills == list(broker_import.read_fills(str(path)))
+    assert [fill["ticker"] for fill in fills] == [f"T{number}" for number in range(30)]
+
+
+def test_follower_reads_appended_lines_once(tmp_path, fills):
+    path = tmp_path / "growing.csv"
+    write_fills(path, fills[:100])
+    text = path.read_text()
+    write_fills(path, fills)
+    appended = path.read_text()[len(text):]
+
+    path.write_text(text + appended[:len(appended) // 2]) # The broker is writing a line
+    follower = broker_import.FileFollower(str(path))
+    first = follower.read()
+    assert not follower.restarted
+
+    path.write_text(text + appended)
+    second = follower.read()
+
+    assert not follower.restarted
+    assert first + second == list(broker_import.read_fills(str(path)))
+
+
+def test_follower_restarts_on_rewritten_file(tmp_path, fills):
+    path = tmp_path / "rewritten.csv"
+    write_fills(path, fills[:50])
+    follower = broker_import.FileFollower(str(path))
+    follower.read()
+
+    write_fills(path, fills[10:40])
+    assert follower.pending()
+    rewritten = follower.read()
+
+    assert follower.restarted
+    assert rewritten == list(broker_import.read_fills(str(path)))
+
+
+def test_unknown_layout_is_rejected(tmp_path):
+    path = tmp_path / "prices.csv"
+    path.write_text("a,b,c\n1,2,3\n")
+
+    with pytest.raises(ValueError):
+        list(broker_import.read_fills(str(path)))
+    with pytest.raises(ValueError):
+        follow_all(broker_import.FileFollower(str(path)), 1000)
+
+
+def test_fill_hash_ignores_formatting():
+    fill = {"open_date": "01/07/15", "ticker": "SQQQ", "long_short": "Long", "open_shares": "10", "open_price": "95.3", "cost": "953",
+            "close_date": "", "close_shares": "", "close_price": "", "proceeds": ""}
+    reformatted = dict(fill, open_date="2015-01-07", open_price="95.30", cost="953.00")
+
+    assert broker_import.fill_hash(fill) == broker_import.fill_hash(reformatted)
+    assert broker_import.fill_hash(fill) != broker_import.fill_hash(dict(fill, ticker="TQQQ"))
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_parallel_read_skips_fills_of_earlier_files(tmp_path, processes):
+    fills = random_fills(60)
+    first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+    write_fills(first, fills[:40] + [fills[5]]) # A broker can report two identical fills
+    reformatted = [dict(fill, open_price=fill["open_price"] + "0", open_date=broker_import.normalize_date(fill["open_date"])) for fill in fills[20:40]]
+    write_fills(second, reformatted + fills[40:])
+
+    stats = {}
+    merged = list(broker_import.read_fills_parallel([str(first), str(second)], processes=processes, stats=stats))
+
+    assert stats == {"files": 2, "fills": 61, "duplicates": 20}
+    assert len(merged) == 61
+    assert sorted(broker_import.fill_hash(fill) for fill in merged) == sorted(broker_import.fill_hash(fill) for fill in fills + [fills[5]])
+
+    days = [broker_import.parse_date(fill["open_date"]) for fill in merged]
+    assert days == sorted(days)
@@ -0,0 +1,46 @@
+from conftest import ledger_of
+
+from equity import EquityCurve
+from rollups import Rollups
+
+
+def curve_of(ledger) -> tuple[EquityCurve, Rollups]:
+    rollups = Rollups()
+    rollups.rebuild(ledger)
+    curve = EquityCurve()
+    curve.rebuild(ledger, rollups)
+    return curve, rollups
+
+
+def test_incremental_updates_match_rebuild(fills):
+    ledger = ledger_of(fills[:250])
+    curve, rollups = curve_of(ledger)
+
+    for batch in (fills[250:320], fills[320:]):
+        for fill in batch:
+            ledger.append(fill)
+        ledger.update(len(ledger) - 1, "open_date", "08/20/24") # Inserted at the start of the curve
+        ledger.update(10, "proceeds", "1.00")
+        ledger.update(12, "close_shares", "") # No longer closed, leaves the curve
+        curve.update(ledger, rollups, rollups.update(ledger, ledger.recalculate_dirty()))
+
+    rebuilt, _ = curve_of(ledger) # Same group ids, so trades of a day keep their order
+
+    assert curve.keys == rebuilt.keys
+    assert curve.equity == rebuilt.equity
+    assert curve.drawdowns == rebuilt.drawdowns
+    assert curve.max_drawdown == rebuilt.max_drawdown
+
+
+def test_curve_follows_closed_trades(fills):
+    ledger = ledger_of(fills)
+    curve, rollups = curve_of(ledger)
+
+    assert len(curve) == rollups.summary().trades
+    assert curve.equity[-1] == sum(contribution["profit_loss"] for contribution in rollups.contributions.values() if contribution["trades"])
+
+    peak, max_drawdown = 0, 0
+    for equity in curve.equity:
+        peak = max(peak, equity)
+        max_drawdown = max(max_drawdown, peak - equity)
+    assert curve.max_drawdown == max_drawdown
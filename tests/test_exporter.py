@@ -0,0 +1,26 @@
+from conftest import ledger_of
+
+import exporter
+
+from ledger import Ledger
+
+
+def test_snapshot_round_trip(tmp_path, fills):
+    columns = ledger_of(fills).snapshot_columns()
+    path = str(tmp_path / "fills.tts")
+
+    exporter.write_snapshot(columns, path)
+
+    assert exporter.is_snapshot(path)
+    assert exporter.read_snapshot(path) == columns
+
+
+def test_extend_matches_append(fills):
+    appended = ledger_of(fills)
+
+    extended = Ledger()
+    extended.extend(appended.snapshot_columns())
+    extended.calculate()
+
+    assert extended.totals == appended.totals
+    assert list(extended.group_keys) == list(appended.group_keys)
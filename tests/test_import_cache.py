@@ -0,0 +1,102 @@
+import os
+
+from conftest import write_fills
+
+import broker_import
+
+from import_cache import ImportCache
+from ledger import Ledger
+
+
+def import_file(cache: ImportCache, path) -> tuple[Ledger, list[dict]]:
+    """Import a file through the cache like the GUI does. Returns the ledger and the fills that had to be parsed."""
+    entry, columns = cache.lookup(str(path))
+    ledger = Ledger()
+    if columns is not None:
+        ledger.extend(columns)
+
+    stats = {}
+    parsed = list(cache.read_fills(str(path), stats, entry))
+    for fill in parsed:
+        ledger.append(fill)
+
+    cache.save(stats["entry"], ledger.snapshot_columns() if parsed or entry is None else None)
+    return ledger, parsed
+
+
+def fresh_columns(path) -> dict:
+    ledger = Ledger()
+    for fill in broker_import.read_fills(str(path)):
+        ledger.append(fill)
+    return ledger.snapshot_columns()
+
+
+def test_unchanged_file_is_not_parsed_again(tmp_path, fills):
+    cache, path = ImportCache(str(tmp_path / "cache")), tmp_path / "fills.csv"
+    write_fills(path, fills)
+
+    _, parsed = import_file(cache, path)
+    assert len(parsed) == len(fills)
+
+    os.utime(path, ns=(0, 10**18)) # Touched, same bytes
+    for _ in range(2):
+        ledger, parsed = import_file(cache, path)
+        assert parsed == []
+        assert ledger.snapshot_columns() == fresh_columns(path)
+
+
+def test_appended_lines_are_the_only_ones_parsed(tmp_path, fills):
+    cache, path = ImportCache(str(tmp_path / "cache")), tmp_path / "fills.csv"
+    write_fills(path, fills[:300])
+    import_file(cache, path)
+
+    write_fills(path, fills)
+    ledger, parsed = import_file(cache, path)
+
+    assert len(parsed) == 100
+    assert ledger.snapshot_columns() == fresh_columns(path)
+
+
+def test_changed_file_is_parsed_again(tmp_path, fills):
+    cache, path = ImportCache(str(tmp_path / "cache")), tmp_path / "fills.csv"
+    write_fills(path, fills[:300])
+    import_file(cache, path)
+
+    fills[0]["ticker"] = "EDIT"
+    write_fills(path, fills)
+    ledger, parsed = import_file(cache, path)
+
+    assert len(parsed) == len(fills)
+    assert ledger.snapshot_columns() == fresh_columns(path)
+
+
+def test_last_line_without_line_break_is_parsed_again(tmp_path, fills):
+    cache, path = ImportCache(str(tmp_path / "cache")), tmp_path / "fills.csv"
+    write_fills(path, fills[:100])
+    path.write_bytes(path.read_bytes().rstrip(b"\r\n"))
+    import_file(cache, path)
+
+    with open(path, "a", newline="") as file:
+        file.write("5\r\n") # The last line was still being written
+    ledger, parsed = import_file(cache, path)
+
+    assert len(parsed) == 100
+    assert ledger.snapshot_columns() == fresh_columns(path)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, fills):
+    paths = [tmp_path / f"{name}.csv" for name in ("a", "b", "c")]
+    for number, path in enumerate(paths):
+        write_fills(path, fills[number * 100:number * 100 + 100])
+
+    cache = ImportCache(str(tmp_path / "cache"))
+    for path in paths:
+        import_file(cache, path)
+    entry_bytes = sum(file.stat().st_size for file in os.scandir(cache.directory)) // len(paths)
+
+    cache.max_bytes = 2 * entry_bytes + entry_bytes // 2
+    os.utime(cache.entry_paths(str(paths[0]))[0], ns=(0, 1)) # Oldest use
+    cache.evict()
+
+    assert cache.lookup(str(paths[0])) == (None, None)
+    assert all(cache.lookup(str(path))[0] is not None for path in paths[1:])
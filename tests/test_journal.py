@@ -0,0 +1,32 @@
+from conftest import ledger_of
+
+from journal import Journal
+from ledger import FILL_COLUMNS
+
+
+def fill_rows(ledger) -> list[dict]:
+    return [{column: ledger.row_values(row)[column] for column in FILL_COLUMNS} for row in range(len(ledger))]
+
+
+def test_compaction_round_trip(tmp_path, fills):
+    ledger = ledger_of(fills[:300])
+    journal = Journal(str(tmp_path))
+    journal.compact(ledger.snapshot_columns(), {"totals": 1})
+    journal.append_fill(fills[300])
+    journal.set_cell(2, "ticker", "NEWT")
+    journal.close()
+
+    ledger.append(fills[300])
+    ledger.update(2, "ticker", "NEWT")
+    reopened = Journal(str(tmp_path))
+
+    assert reopened.load() == fill_rows(ledger)
+    assert reopened.load_results() is None # Changes were journaled after the results
+
+    reopened.compact(ledger.snapshot_columns(), {"totals": 2})
+    reopened.close()
+    compacted = Journal(str(tmp_path))
+
+    assert compacted.load() == fill_rows(ledger)
+    assert compacted.load_results() == {"totals": 2, "generation": 2}
+    compacted.close()
@@ -0,0 +1,22 @@
+import csv
+
+from lazy_csv import LazyCsvReader
+
+
+def test_rows_match_csv_reader(tmp_path):
+    path = tmp_path / "notes.csv"
+    lines = ["ticker,shares,notes"]
+    lines += [f'T{number},{number},"note {number}\nline two ""quoted""\nline three"' if number % 3 else f"T{number},{number}," for number in range(30)]
+    path.write_text("\n".join(lines)) # No line break after the last record
+
+    with open(path, newline="") as file:
+        expected = list(csv.DictReader(file))
+
+    for use_cache in (True, True, False): # Builds, then loads the cached index
+        reader = LazyCsvReader(str(path), use_cache=use_cache)
+        try:
+            assert reader.fieldnames == ["ticker", "shares", "notes"]
+            assert list(reader.iter_rows()) == expected
+            assert list(reader.filter_rows(ticker="T4")) == [4]
+        finally:
+            reader.close()
@@ -0,0 +1,76 @@
+from conftest import ledger_of
+
+from ledger import MISSING, TradeSums, TradeTotals, format_number, parse_number
+
+
+def test_calculate_totals_of_a_trade():
+    ledger = ledger_of([
+        {"open_date": "09/03/24", "ticker": "SQQQ", "long_short": "Long", "open_shares": "88", "open_price": "8.64", "cost": "760.32",
+         "close_date": "09/03/24", "close_shares": "88", "close_price": "8.71", "proceeds": "766.48"},
+        {"open_date": "09/03/24", "ticker": "SQQQ", "long_short": "Long", "open_shares": "12", "open_price": "8.70", "cost": "104.40"},
+        {"open_date": "09/03/24", "ticker": "SQQQ", "long_short": "Short", "open_shares": "5", "open_price": "9.00", "cost": "45.00"},
+    ])
+
+    assert ledger.totals == {
+        1: TradeTotals(total_cost=86472, cost_basis=865, profit_loss=-9824, net_percentage=-1136), # Anchored on its last fill
+        2: TradeTotals(total_cost=4500, cost_basis=900, profit_loss=-4500, net_percentage=-10000),
+    }
+
+
+def test_calculate_matches_group_totals(fills):
+    ledger = ledger_of(fills)
+
+    assert len(ledger.totals) == len(ledger.group_keys)
+    for group, anchor in enumerate(ledger.anchors):
+        assert anchor == ledger.group_rows[group][-1]
+        assert ledger.totals[anchor] == ledger.group_totals(group)
+
+
+def test_numbers_are_exact_cents():
+    assert parse_number("2.675") == 268
+    assert parse_number("-0.005") == -1
+    assert parse_number("1e2") == 10000
+    assert parse_number("") == MISSING
+    assert format_number(parse_number("0.29") * 3) == "0.87"
+    assert format_number(-5) == "-0.05"
+
+
+def test_group_sums_match_totals(fills):
+    ledger = ledger_of(fills)
+
+    for group, anchor in enumerate(ledger.anchors):
+        sums = ledger.group_sums(group)
+        assert sums.totals() == ledger.totals[anchor]
+        assert sums.fills == len(ledger.group_rows[group])
+
+
+def test_trade_sums_skip_missing_cells():
+    sums = TradeSums()
+    sums.add(10, 100, 1005, MISSING, MISSING, MISSING)
+    sums.add(MISSING, MISSING, MISSING, 10, 110, 1095)
+
+    assert (sums.cost, sums.shares, sums.proceeds, sums.volume, sums.fees, sums.closed) == (1005, 10, 1095, 20, 10, True)
+
+
+def test_group_rows_follow_moved_rows(fills):
+    ledger = ledger_of(fills)
+    for row, column, value in ((5, "ticker", "NEWT"), (300, "ticker", "NEWT"), (40, "ticker", "NEWT"), (300, "open_date", fills[0]["open_date"]),
+                               (0, "long_short", "Short"), (5, "ticker", fills[5]["ticker"])):
+        ledger.update(row, column, value)
+
+    expected = [[] for _ in ledger.group_keys]
+    for row, group in enumerate(ledger.group_ids):
+        expected[group].append(row)
+        assert ledger.group_keys[group] == (ledger.open_date[row], ledger.ticker[row], ledger.long_short[row])
+
+    assert list(ledger.group_rows) == expected
+    assert [rows[-1] if rows else -1 for rows in expected] == list(ledger.group_last)
+
+
+def test_row_tuple_matches_row_values(fills):
+    ledger = ledger_of(fills)
+    columns = ("proceeds", "profit_loss", "ticker", "notes", "open_date", "total_cost")
+
+    for row in range(len(ledger)):
+        values = ledger.row_values(row)
+        assert ledger.row_tuple(row, columns) == tuple(values.get(column, "") for column in columns)
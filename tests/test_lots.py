@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import ledger_of
+
+from ledger import Ledger
+from lots import OpenLot, match_lots
+
+
+def position_ledger() -> Ledger:
+    """Two opens of 10 shares at 1.00 and 2.00, then a close of 15 shares at 3.00 entered with the second open's date."""
+    fills = [
+        {"open_date": "09/02/24", "ticker": "SQQQ", "long_short": "Long", "open_shares": "10", "open_price": "1.00", "cost": "10.00"},
+        {"open_date": "09/03/24", "ticker": "SQQQ", "long_short": "Long", "open_shares": "10", "open_price": "2.00", "cost": "20.00"},
+        {"open_date": "09/03/24", "ticker": "SQQQ", "long_short": "Long", "close_date": "09/05/24", "close_shares": "15", "close_price": "3.00", "proceeds": "45.00"},
+    ]
+    return ledger_of(fills)
+
+
+@pytest.mark.parametrize("method, matched_cost, open_lots", [
+    ("fifo", 2000, [OpenLot(1, 5, 1000)]),
+    ("lifo", 2500, [OpenLot(0, 5, 500)]),
+    ("specific", 2500, [OpenLot(0, 5, 500)]), # The close's own trade, opened 09/03, first
+])
+def test_match_lots(method, matched_cost, open_lots):
+    report = match_lots(position_ledger(), method)
+    profit_loss, cost = report.realized_by_row(3)
+
+    assert (profit_loss[2], cost[2]) == (4500 - matched_cost, matched_cost)
+    assert report.open_lots == open_lots
+    assert sum(report.shares) == 15
+    assert not report.unmatched
+
+
+def test_unmatched_closes_are_reported():
+    ledger = ledger_of([{"open_date": "09/02/24", "ticker": "TQQQ", "long_short": "Short", "close_date": "09/02/24", "close_shares": "4", "proceeds": "8.00"}])
+    assert match_lots(ledger, "fifo").unmatched == [(0, 4)]
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        match_lots(Ledger(), "average")
+
+
+@pytest.mark.parametrize("method", ["fifo", "lifo", "specific"])
+def test_lot_totals_follow_edits(fills, method):
+    ledger = ledger_of(fills[:300], method)
+
+    for fill in fills[300:]:
+        ledger.append(fill)
+    ledger.update(3, "close_shares", "")
+    ledger.update(8, "open_date", "09/30/24")
+    ledger.recalculate_dirty()
+
+    fresh = ledger_of([ledger.row_values(row) for row in range(len(ledger))], method)
+    assert ledger.totals == fresh.totals
+
+    # Every realized cent lands on exactly one trade
+    profit_loss, _ = ledger.lot_report.realized_by_row(len(ledger))
+    assert sum(totals.profit_loss for totals in ledger.totals.values()) == sum(profit_loss)
+
+
+def test_lot_method_survives_clear():
+    ledger = position_ledger()
+    ledger.lot_method = "lifo"
+    ledger.clear()
+
+    assert ledger.lot_method == "lifo"
+    assert ledger.lot_report is None
@@ -0,0 +1,48 @@
+from conftest import ledger_of, random_fills
+
+from ledger import Ledger
+
+
+def test_recalculate_dirty_matches_full_calculation(fills):
+    ledger = ledger_of(fills[:300])
+
+    for fill in fills[300:]:
+        ledger.append(fill)
+    ledger.update(5, "cost", "123.45")
+    ledger.update(7, "proceeds", "")
+    ledger.update(9, "ticker", "NEWT") # Moves the row to another trade
+    ledger.update(11, "open_date", fills[12]["open_date"])
+    ledger.recalculate_dirty()
+
+    fresh = Ledger()
+    for row in range(len(ledger)):
+        fresh.append(ledger.row_values(row))
+    assert ledger.totals == fresh.calculate()
+
+
+def test_recalculate_dirty_reports_former_anchors():
+    fills = random_fills(3)
+    for fill, ticker in zip(fills, ("AAA", "AAA", "BBB")):
+        fill.update(open_date="09/03/24", ticker=ticker, long_short="Long")
+    ledger = ledger_of(fills)
+    assert set(ledger.totals) == {1, 2}
+
+    ledger.update(1, "ticker", "BBB") # Row 1 joins the trade anchored by row 2
+    changed = ledger.recalculate_dirty()
+
+    assert changed[1] is None
+    assert changed[0] == ledger.group_totals(ledger.group_ids[0])
+    assert changed[2] == ledger.group_totals(ledger.group_ids[2])
+    assert set(ledger.totals) == {0, 2}
+
+
+def test_restore_totals_leaves_later_fills_dirty(fills):
+    saved = ledger_of(fills[:200]).totals
+
+    ledger = Ledger()
+    for fill in fills:
+        ledger.append(fill)
+    assert ledger.restore_totals(saved, rows=200)
+    ledger.recalculate_dirty()
+
+    assert ledger.totals == ledger_of(fills).totals
@@ -0,0 +1,70 @@
+import datetime
+import random
+
+from conftest import ledger_of
+
+from ledger import parse_date
+from rollups import STATISTICS, DayFenwick, Rollups, RollupSummary
+
+
+def brute_summary(rollups: Rollups, ledger, start=None, end=None, ticker=None) -> RollupSummary:
+    """Sum the contribution of every trade opened in the range by scanning them all."""
+    totals = dict.fromkeys(STATISTICS, 0)
+    for group, contribution in rollups.contributions.items():
+        open_date, group_ticker, _ = ledger.group_keys[group]
+        day = parse_date(open_date)
+        if (start and day < start) or (end and day > end) or (ticker and group_ticker != ticker):
+            continue
+        for statistic in STATISTICS:
+            totals[statistic] += contribution[statistic]
+    return RollupSummary(**totals)
+
+
+def test_incremental_updates_match_rebuild(fills):
+    ledger = ledger_of(fills[:250])
+    rollups = Rollups()
+    rollups.rebuild(ledger)
+
+    for fill in fills[250:]:
+        ledger.append(fill)
+    ledger.update(2, "ticker", "NEWT")
+    ledger.update(4, "close_shares", "")
+    ledger.update(6, "open_date", "08/15/24") # Before every other day, the trees grow towards the past
+    rollups.update(ledger, ledger.recalculate_dirty())
+
+    rebuilt = Rollups()
+    rebuilt.rebuild(ledger_of([ledger.row_values(row) for row in range(len(ledger))]))
+
+    assert rollups.summary() == rebuilt.summary()
+    for ticker in set(rollups.tickers()) | set(rebuilt.tickers()): # Tickers whose trades all moved keep empty trees
+        assert rollups.summary(ticker=ticker) == rebuilt.summary(ticker=ticker)
+
+
+def test_summary_ranges_match_a_scan(fills):
+    ledger = ledger_of(fills)
+    rollups = Rollups()
+    rollups.rebuild(ledger)
+
+    first_day = datetime.date(2024, 9, 2)
+    for offset in range(0, 45, 7):
+        start, end = first_day + datetime.timedelta(days=offset), first_day + datetime.timedelta(days=offset + 9)
+        assert rollups.summary(start, end) == brute_summary(rollups, ledger, start, end)
+        assert rollups.summary(start, end, "SQQQ") == brute_summary(rollups, ledger, start, end, "SQQQ")
+
+
+def test_day_fenwick_range_sums():
+    generator = random.Random(3)
+    tree = DayFenwick()
+    values = {}
+
+    for _ in range(500): # Days spread both ways from the first, so the covered range keeps growing
+        day = 739000 + generator.randrange(-300, 300)
+        delta = generator.randrange(-1000, 1000)
+        tree.add(day, {"profit_loss": delta})
+        values[day] = values.get(day, 0) + delta
+
+    for _ in range(100):
+        first_day = 739000 + generator.randrange(-350, 350)
+        last_day = first_day + generator.randrange(0, 200)
+        expected = sum(value for day, value in values.items() if first_day <= day <= last_day)
+        assert tree.range_sum("profit_loss", first_day, last_day) == expected
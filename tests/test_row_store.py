@@ -0,0 +1,17 @@
+from conftest import ledger_of, random_fills
+
+from ledger import LedgerRowStore
+
+
+def test_row_store_drops_filter_when_ledger_is_cleared():
+    ledger = ledger_of(random_fills(50))
+    store = LedgerRowStore(ledger, ("open_date", "ticker"))
+    store.set_filter(list(range(40, 50)))
+    assert len(store) == 10
+
+    ledger.clear()
+    for fill in random_fills(5, seed=1):
+        ledger.append(fill)
+
+    assert [store[index] for index in range(len(store)) if store[index]] == [
+        (fill["open_date"], fill["ticker"]) for fill in reversed(random_fills(5, seed=1))]
@@ -0,0 +1,124 @@
+import sqlite3
+
+from ledger import FILL_COLUMNS, MISSING, NUMERIC_COLUMNS, SHARE_COLUMNS, format_number, normalize_date, parse_number
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    fill_id INTEGER PRIMARY KEY,
+    open_date TEXT NOT NULL DEFAULT '',
+    ticker TEXT NOT NULL DEFAULT '',
+    long_short TEXT NOT NULL DEFAULT '',
+    open_shares INTEGER,
+    open_price INTEGER,
+    cost INTEGER,
+    close_date TEXT NOT NULL DEFAULT '',
+    close_shares INTEGER,
+    close_price INTEGER,
+    proceeds INTEGER
+);
+CREATE INDEX IF NOT EXISTS fills_trade ON fills (open_date, ticker, long_short);
+CREATE INDEX IF NOT EXISTS fills_ticker ON fills (ticker, open_date);
+CREATE INDEX IF NOT EXISTS fills_close_date ON fills (close_date);
+"""
+
+DATE_COLUMNS = ("open_date", "close_date")
+
+
+class TradeStore:
+    """SQLite storage for fills. Dates are stored as ISO text (YYYY-MM-DD) so date ranges are index range scans, shares
+    as integers and money as integer cents, like the ledger."""
+
+    def __init__(self, path: str):
+        """Open or create the store at path."""
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, only the last commits can be lost on power failure
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def upsert(self, row: dict, fill_id: int=None) -> int:
+        """Insert a fill, or replace it if fill_id exists, in its own transaction. Return the fill id."""
+        columns = ("fill_id",) + FILL_COLUMNS
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(f"{column}=excluded.{column}" for column in FILL_COLUMNS)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO fills ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT(fill_id) DO UPDATE SET {updates}",
+                (fill_id,) + self.to_record(row))
+
+        return fill_id if fill_id is not None else cursor.lastrowid
+
+    def insert_many(self, rows: list[dict]) -> list[int]:
+        """Insert fills in a single transaction and return their fill ids."""
+        with self.connection:
+            next_id = self.connection.execute("SELECT COALESCE(MAX(fill_id), 0) + 1 FROM fills").fetchone()[0]
+            fill_ids = list(range(next_id, next_id + len(rows)))
+
+            self.connection.executemany(
+                f"INSERT INTO fills (fill_id, {', '.join(FILL_COLUMNS)}) VALUES ({', '.join('?' for _ in range(len(FILL_COLUMNS) + 1))})",
+                ((fill_id,) + self.to_record(row) for fill_id, row in zip(fill_ids, rows)))
+
+        return fill_ids
+
+    def load(self, start_date: str=None, end_date: str=None, ticker: str=None, closed_start: str=None, closed_end: str=None):
+        """Yield fills as {column_name: display string} dicts including their fill_id, oldest first.
+
+        start_date/end_date filter on open_date and closed_start/closed_end on close_date, both inclusive.
+        Every filter is answered from an index.
+        """
+        conditions, parameters = [], []
+
+        for column, operator, value in (("open_date", ">=", start_date), ("open_date", "<=", end_date),
+                                         ("close_date", ">=", closed_start), ("close_date", "<=", closed_end)):
+            if value:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(normalize_date(value))
+
+        if closed_start or closed_end:
+            conditions.append("close_date != ''")
+
+        if ticker:
+            conditions.append("ticker = ?")
+            parameters.append(ticker)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.connection.execute(f"SELECT fill_id, {', '.join(FILL_COLUMNS)} FROM fills {where} ORDER BY fill_id", parameters)
+
+        for record in cursor:
+            yield self.from_record(record)
+
+    @staticmethod
+    def to_record(row: dict) -> tuple:
+        """Convert a {column_name: value} fill to a database record. Empty cells become NULL."""
+        record = []
+
+        for column in FILL_COLUMNS:
+            value = row.get(column)
+            if column in DATE_COLUMNS:
+                record.append(normalize_date(value))
+            elif column in NUMERIC_COLUMNS:
+                number = parse_number(value, column in SHARE_COLUMNS)
+                record.append(None if number == MISSING else number)
+            else:
+                record.append(str(value or ""))
+
+        return tuple(record)
+
+    @staticmethod
+    def from_record(record: tuple) -> dict:
+        """Convert a database record to a {column_name: display string} fill including its fill_id."""
+        row = {"fill_id": record[0]}
+
+        for column, value in zip(FILL_COLUMNS, record[1:]):
+            if column in NUMERIC_COLUMNS:
+                row[column] = "" if value is None else format_number(int(value), column in SHARE_COLUMNS)
+            else:
+                row[column] = value
+
+        return row
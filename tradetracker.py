@@ -1,54 +1,196 @@
-import traceback
+import sys
+import time
 
-import csv
+from instrumentation import StartupProfile
+
+# Created before the other imports, so --startup-profile can time them
+startup_profile = StartupProfile(enabled=__name__ == "__main__" and "--startup-profile" in sys.argv)
+
+GUI_FLAGS = ("--virtual", "--startup-profile")
+
+if __name__ == "__main__" and any(argument not in GUI_FLAGS for argument in sys.argv[1:]):
+    # Ledger paths, batch options or --help on the command line: run headless, without importing Tk. See batch.py
+    import batch
+    sys.exit(batch.main())
+
+import bisect
+import datetime
 import os.path
+import queue
+import threading
 import tkinter as tk
 
+from array import array
+from decimal import Decimal
 from tkinter import ttk
 from tkinter import filedialog
-from tkcalendar import DateEntry
+
+# Modules only needed once a file is opened, imported on first use to keep them off the startup path:
+# broker_import, exporter, lazy_csv, trade_store (csv, sqlite3, mmap), tkcalendar (babel locale data), traceback
 from edit_treeview import EditTreeview
+from equity import EquityCurve, downsample
+from fill_index import FillIndex
+from instrumentation import Metrics, instrumented
+from journal import Journal
+from ledger import RESULT_COLUMNS, Ledger, LedgerRowStore, TradeTotals, format_number, parse_date, parse_number
+from rollups import Rollups
+from sort_keys import SortKeys
+from trading_calc import DEFAULT_RISK_PERCENTAGE, get_max_shares_batch
 from validated_entry import ValidatedEntry
 
 
+IMPORT_BATCH_SIZE = 1000 # Rows inserted into the Treeview per Tk event loop iteration
+AUTOSAVE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".tradetracker", "autosave")
+AUTOSAVE_INTERVAL_MS = 60_000 # How often the autosave journal is checked for compaction
+FOLLOW_INTERVAL_MS = 1000 # How often a followed file is checked for appended fills
+EQUITY_CHART_HEIGHT = 160 # Pixels
+PRICES_DIRECTORY = os.path.join(os.path.expanduser("~"), ".tradetracker", "prices")
+IMPORT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".tradetracker", "cache")
+
+
 class TradeTracker(tk.Tk):
     """Application for tracking trades. Can import and export transactions in a CSV file."""
-    def __init__(self, name: str):
-        """Constructor for TradeTracker. Instsantiate various widgets for the user interface."""
+    def __init__(self, name: str, virtual: bool=False):
+        """Constructor for TradeTracker. Instsantiate various widgets for the user interface.
+
+        Parameters:
+        name: Window title.
+        virtual: Display the ledger in a virtual Treeview that only holds the rows in view, for very large ledgers.
+        """
         super().__init__()
 
         self.title(name)
+        self.virtual = virtual
+        self.metrics = Metrics(self.tk)
+        self.metrics.on_stop = self.show_metrics
+        self.metrics_overlay = tk.BooleanVar(value=False)
+        self.metrics_profiling = tk.BooleanVar(value=False)
+        self.lot_method = tk.StringVar(value="") # Lot matching behind the profit/loss columns, "" to sum each trade
+        self.ledger = Ledger()
+        self.rollups = Rollups()
+        self.equity = EquityCurve()
+        self.equity_drawn = None # (curve version, width, height) of the chart on the canvas
+        self.fill_index = FillIndex(self.ledger)
+        self.visible_rows = None # Ledger rows attached to the Treeview while a filter is applied
+        self.separator_keys = {} # {separator iid: display order key}, see display_key
+        self.sort_order = [] # (column, descending) of every sort key, primary first
+        self.sort_rank = None # Position of every ledger row in the sorted Treeview, None if unsorted
+        self.import_cancel_event = None
+        self.follower = None # FileFollower of the file whose appended fills are added, if one is followed
+        self.follow_job = None # after() id of the next poll of the followed file
+        self.follow_deferred = False # Fills of the followed file were added but not yet saved and arranged, while catching up
+        self.store = None # TradeStore written through on add and edit, if a database is open
+        self.price_store = None # PriceStore of local daily prices, opened on first use
+        self.import_cache = None # ImportCache of the fills and trade totals of imported CSV files, opened on first import
+        self.separator_date = "" # Open date of the newest row, to add empty rows between dates
         self.main_frame = ttk.Frame(master=self, name="main_frame")
 
         self.build_ui(master=self.main_frame)
 
         self.main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
+        self.journal = Journal(AUTOSAVE_DIRECTORY)
+        self.after_idle(self.finish_startup)
+        self.after(AUTOSAVE_INTERVAL_MS, self.autosave)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def finish_startup(self):
+        """Paint the window, then build what is not visible yet and reopen the last ledger."""
+        self.update_idletasks()
+        startup_profile.mark("first paint")
+
+        with startup_profile.measure("build_menus"):
+            self.build_menus()
+        with startup_profile.measure("build_date_entry"):
+            self.build_date_entry()
+        with startup_profile.measure("restore_autosave"):
+            self.restore_autosave()
+
+        startup_profile.mark("ready")
+        startup_profile.report()
+
     def build_ui(self, master):
         """Create the graphical user interface on a master widget."""
         buttons_frame = ttk.Frame(master=master)
         order_entry_frame = ttk.LabelFrame(master=master, name="order_entry_frame", text="Order Entry")
-        treeview_frame = ttk.Frame(master=master)
+        filter_frame = ttk.Frame(master=master)
+        grid_frame = ttk.Frame(master=master)
+        treeview_frame = ttk.Frame(master=grid_frame)
+        summary_frame = ttk.LabelFrame(master=grid_frame, text="Summary")
         status_frame = ttk.Frame(master=master)
 
-        self.build_buttons(master=buttons_frame)
-        self.build_order_entry(master=order_entry_frame)
-        self.build_treeview(master=treeview_frame)
-        self.build_status_label(master=status_frame)
+        for build, frame in ((self.build_buttons, buttons_frame), (self.build_order_entry, order_entry_frame), (self.build_filter_bar, filter_frame),
+                             (self.build_treeview, treeview_frame), (self.build_summary, summary_frame), (self.build_status_label, status_frame)):
+            with startup_profile.measure(build.__name__):
+                build(master=frame)
 
         buttons_frame.pack(anchor="w", pady=(0,20))
         order_entry_frame.pack(anchor="w", pady=(0,20))
-        treeview_frame.pack(pady=(0,20))
+        filter_frame.pack(anchor="w", pady=(0,10))
+        treeview_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        summary_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(20, 0))
+        grid_frame.pack(pady=(0,20), fill=tk.BOTH, expand=True)
         status_frame.pack()
 
     def build_buttons(self, master):
         """Create buttons for the interface."""
+        open_btn = ttk.Button(master=master, command=self.open_store_file, text="Open")
+        open_btn.pack(padx=(0, 10), side=tk.LEFT)
+
         import_btn = ttk.Button(master=master, command=self.import_csv_file, text="Import")
         import_btn.pack(side=tk.LEFT)
 
+        self.import_many_btn = ttk.Menubutton(master=master, text="Import Many")
+        self.import_many_btn.pack(padx=(10, 0), side=tk.LEFT)
+
         export_btn = ttk.Button(master=master, command=self.export_csv_file, text="Export")
         export_btn.pack(padx=(10, 0), side=tk.LEFT)
 
+        self.cancel_btn = ttk.Button(master=master, command=self.cancel_import, text="Cancel", state="disabled")
+        self.cancel_btn.pack(padx=(10, 0), side=tk.LEFT)
+
+        browse_btn = ttk.Button(master=master, command=self.browse_csv_file, text="Browse")
+        browse_btn.pack(padx=(10, 0), side=tk.LEFT)
+
+        # Menus are only seen once opened, they are filled in by build_menus after the first paint
+        self.lots_btn = ttk.Menubutton(master=master, text="P/L")
+        self.lots_btn.pack(padx=(10, 0), side=tk.LEFT)
+
+        self.diagnostics_btn = ttk.Menubutton(master=master, text="Diagnostics")
+        self.diagnostics_btn.pack(padx=(10, 0), side=tk.LEFT)
+
+    def build_menus(self):
+        """Create the menus of the menu buttons."""
+        lots_menu = tk.Menu(master=self.lots_btn, tearoff=False)
+        for label, method in (("Per trade", ""), ("FIFO lots", "fifo"), ("LIFO lots", "lifo"), ("Specific lots", "specific")):
+            lots_menu.add_radiobutton(label=label, value=method, variable=self.lot_method, command=self.change_lot_method)
+        lots_menu.add_separator()
+        lots_menu.add_command(label="Import Prices...", command=self.import_prices)
+        lots_menu.add_command(label="Mark to Market", command=self.mark_to_market)
+        self.lots_btn.config(menu=lots_menu)
+
+        import_menu = tk.Menu(master=self.import_many_btn, tearoff=False)
+        import_menu.add_command(label="Files...", command=self.import_csv_files)
+        import_menu.add_command(label="Folder...", command=self.import_csv_folder)
+        import_menu.add_separator()
+        import_menu.add_command(label="Follow File...", command=self.follow_csv_file)
+        import_menu.add_command(label="Stop Following", command=self.stop_following)
+        self.import_many_btn.config(menu=import_menu)
+
+        diagnostics_menu = tk.Menu(master=self.diagnostics_btn, tearoff=False)
+        diagnostics_menu.add_checkbutton(label="Show metrics", variable=self.metrics_overlay, command=lambda: self.metrics.trace_memory(self.metrics_overlay.get()))
+        diagnostics_menu.add_checkbutton(label="Record profile", variable=self.metrics_profiling, command=lambda: self.metrics.profile(self.metrics_profiling.get()))
+        diagnostics_menu.add_command(label="Dump metrics...", command=self.dump_metrics)
+        self.diagnostics_btn.config(menu=diagnostics_menu)
+
+    def build_date_entry(self):
+        """Create the date picker of the order entry form. tkcalendar loads babel locale data, so it is imported here
+        instead of at startup."""
+        from tkcalendar import DateEntry
+
+        entry_inner_frame = self.nametowidget(".main_frame.order_entry_frame.entry_inner_frame")
+        DateEntry(master=entry_inner_frame, width=12).grid(row=1, column=0, padx=1)
+
     def build_order_entry(self, master):
         """Create order entry form."""
 
@@ -58,7 +200,8 @@ class TradeTracker(tk.Tk):
             try:
                 shares = shares_intvar.get()
                 price = price_doublevar.get()
-                cost = shares * price if shares >=0 and price >= 0 else 0
+                # Multiply the typed decimal, not its binary float, so 3 x 1.005 is 3.015 and rounds to 3.02
+                cost = parse_number(shares * Decimal(repr(price))) if shares >=0 and price >= 0 else 0
             except tk.TclError:
                 cost_entry_widget.config(state="normal")
                 cost_entry_widget.delete(0, tk.END)
@@ -67,9 +210,22 @@ class TradeTracker(tk.Tk):
             else:
                 cost_entry_widget.config(state="normal")
                 cost_entry_widget.delete(0, tk.END)
-                cost_entry_widget.insert(0, f"{cost:.2f}")
+                cost_entry_widget.insert(0, format_number(cost))
                 cost_entry_widget.config(state="readonly")
 
+        def update_shares_entry(var, index, mode):
+            """Fill Shares with the largest position the risk settings allow at the current price and stop."""
+            try:
+                price = price_doublevar.get()
+                stop = stop_doublevar.get()
+                account_size = account_doublevar.get()
+                risk_percentage = risk_doublevar.get()
+            except tk.TclError:
+                return # Incomplete entry, keep the current size
+
+            if price > 0 and stop > 0 and account_size > 0:
+                shares_intvar.set(get_max_shares_batch([price], [stop], [account_size], risk_percentage)[0])
+
         def check_entries(var, index, mode):
             """Enable 'Add' button if all fields are filled."""
             try:
@@ -91,12 +247,15 @@ class TradeTracker(tk.Tk):
         entry_inner_frame = ttk.Frame(master=master, name="entry_inner_frame")
 
         # Entry labels and variables
-        entry_labels = ("Date", "Ticker", "Long/Short", "Shares", "Price", "Cost")
+        entry_labels = ("Date", "Ticker", "Long/Short", "Shares", "Price", "Stop", "Cost")
 
         ticker_var = tk.StringVar()
         long_short_var =  tk.StringVar()
         shares_intvar = tk.IntVar()
         price_doublevar = tk.DoubleVar()
+        stop_doublevar = tk.DoubleVar()
+        account_doublevar = tk.DoubleVar()
+        risk_doublevar = tk.DoubleVar(value=DEFAULT_RISK_PERCENTAGE)
 
         # Traces to check entries and update cost
         ticker_var.trace_add("write", check_entries)
@@ -107,9 +266,13 @@ class TradeTracker(tk.Tk):
         shares_intvar.trace_add("write", update_cost_entry)
         price_doublevar.trace_add("write", update_cost_entry)
 
+        # Position sizing follows price, stop and the risk settings
+        for var in (price_doublevar, stop_doublevar, account_doublevar, risk_doublevar):
+            var.trace_add("write", update_shares_entry)
+
         # Special cases for non-standard entry widgets
         special_cases = {
-            "Date": lambda frame, col, label_text: DateEntry(master=frame, name=label_text, width=12).grid(row=1, column=col, padx=1),
+            "Date": lambda frame, col, label_text: None, # Created by build_date_entry after the first paint
             "Long/Short": lambda frame, col, label_text: ttk.Combobox(frame, values=["Long", "Short"], textvariable=long_short_var, name=label_text, width=12).grid(row=1, column=col, padx=1),
             "Cost": lambda frame, col, label_text: ttk.Entry(master=frame, name=label_text, state="readonly", width=12).grid(row=1, column=col, padx=1),
         }
@@ -124,15 +287,52 @@ class TradeTracker(tk.Tk):
                 ValidatedEntry(master=entry_inner_frame, validation_type="integer", textvariable=shares_intvar, name=self.lowercase_ignore_special(label_text), width=12).grid(row=1, column=col, padx=1)
             elif label_text == "Price": # Float only Entry widget
                 ValidatedEntry(master=entry_inner_frame, validation_type="price", textvariable=price_doublevar, name=self.lowercase_ignore_special(label_text), width=12).grid(row=1, column=col, padx=1)
+            elif label_text == "Stop": # Float only Entry widget
+                ValidatedEntry(master=entry_inner_frame, validation_type="price", textvariable=stop_doublevar, name=self.lowercase_ignore_special(label_text), width=12).grid(row=1, column=col, padx=1)
             elif label_text == "Ticker": # String only Entrry widget
                 ValidatedEntry(master=entry_inner_frame, validation_type="alpha", textvariable=ticker_var, name=self.lowercase_ignore_special(label_text), width=12).grid(row=1, column=col, padx=1)
 
         entry_inner_frame.pack(padx=10, pady=10, side=tk.LEFT)
 
+        # Risk settings used to size positions
+        risk_frame = ttk.Frame(master=master, name="risk_frame")
+        ttk.Label(master=risk_frame, text="Account").grid(row=0, column=0, pady=(0,10))
+        ValidatedEntry(master=risk_frame, validation_type="price", textvariable=account_doublevar, name="account", width=12).grid(row=1, column=0, padx=1)
+        ttk.Label(master=risk_frame, text="Risk %").grid(row=0, column=1, pady=(0,10))
+        ValidatedEntry(master=risk_frame, validation_type="price", textvariable=risk_doublevar, name="risk", width=6).grid(row=1, column=1, padx=1)
+        risk_frame.pack(padx=10, pady=10, side=tk.LEFT)
+
         # 'Add' button
         add_button = ttk.Button(master=entry_inner_frame, text="Add", state="disabled", command=self.add_entry)
         add_button.grid(row=1, column=len(entry_labels), padx=(10,0))
 
+    def build_filter_bar(self, master):
+        """Create the filter bar. The grid is filtered as the criteria are typed."""
+        self.filter_vars = {name: tk.StringVar() for name in ("ticker", "long_short", "start", "end", "status")}
+
+        ttk.Label(master=master, text="Filter").pack(side=tk.LEFT)
+
+        ttk.Label(master=master, text="Ticker").pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Entry(master=master, textvariable=self.filter_vars["ticker"], width=10).pack(padx=(5, 0), side=tk.LEFT)
+
+        ttk.Label(master=master, text="Long/Short").pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Combobox(master=master, values=["", "Long", "Short"], textvariable=self.filter_vars["long_short"], state="readonly", width=8).pack(padx=(5, 0), side=tk.LEFT)
+
+        ttk.Label(master=master, text="From").pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Entry(master=master, textvariable=self.filter_vars["start"], width=10).pack(padx=(5, 0), side=tk.LEFT)
+
+        ttk.Label(master=master, text="To").pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Entry(master=master, textvariable=self.filter_vars["end"], width=10).pack(padx=(5, 0), side=tk.LEFT)
+
+        ttk.Label(master=master, text="Status").pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Combobox(master=master, values=["", "Open", "Closed"], textvariable=self.filter_vars["status"], state="readonly", width=8).pack(padx=(5, 0), side=tk.LEFT)
+
+        ttk.Button(master=master, text="Clear", command=lambda: [var.set("") for var in self.filter_vars.values()]).pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Button(master=master, text="Load from Database", command=self.query_store).pack(padx=(10, 0), side=tk.LEFT)
+
+        for var in self.filter_vars.values():
+            var.trace_add("write", lambda var, index, mode: self.apply_filter())
+
     def build_treeview(self, master):
         """Create the custom treeview widget."""
         column_names = {
@@ -164,54 +364,431 @@ class TradeTracker(tk.Tk):
             "proceeds": "price",
             "profit_loss": "signed_price"}
 
-        self.treeview = EditTreeview(master=master, columns=list(column_names.keys()), column_validation=column_validation, callback=self.update_treeview_callback, show="headings")
+        if self.virtual:
+            scrollbar = ttk.Scrollbar(master=master, orient=tk.VERTICAL)
+            self.row_store = LedgerRowStore(self.ledger, tuple(column_names.keys()))
+            self.treeview = EditTreeview(master=master, columns=list(column_names.keys()), column_validation=column_validation, callback=self.update_treeview_callback, row_store=self.row_store, yscrollcommand=scrollbar.set, show="headings")
+            scrollbar.config(command=self.treeview.yview)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        else:
+            self.treeview = EditTreeview(master=master, columns=list(column_names.keys()), column_validation=column_validation, callback=self.update_treeview_callback, show="headings")
 
         for col_name, col_text in column_names.items():
             self.treeview.heading(column=col_name, text=col_text)
             self.treeview.column(column=col_name, width=100)
 
+        # Click a heading to sort by it, shift-click to add it as another sort key
+        self.column_names = column_names
+        self.sort_keys = SortKeys(self.ledger, column_validation)
+        self.treeview.bind("<Button-1>", self.on_heading_click, add=True)
+        self.treeview.bind("<Shift-Button-1>", lambda event: self.on_heading_click(event, extend=True), add=True)
+
         self.treeview.pack(fill=tk.BOTH, expand=True)
 
+        # Instance attribute, so the <Return> binding made on every edit picks up the measured version
+        self.treeview.on_enter_pressed = self.metrics.wrap("on_enter_pressed", self.treeview.on_enter_pressed, rows=lambda event: 1)
+
+    def build_summary(self, master):
+        """Create the summary panel: trade statistics of recent periods and of a date range, for one or every ticker."""
+        filter_frame = ttk.Frame(master=master)
+
+        ttk.Label(master=filter_frame, text="Ticker").grid(row=0, column=0, sticky="w")
+        self.summary_ticker = ttk.Combobox(master=filter_frame, width=10, postcommand=lambda: self.summary_ticker.config(values=[""] + self.rollups.tickers()))
+        self.summary_ticker.grid(row=0, column=1, padx=(10, 0), sticky="w")
+
+        ttk.Label(master=filter_frame, text="From").grid(row=1, column=0, sticky="w")
+        self.summary_start = ttk.Entry(master=filter_frame, width=12)
+        self.summary_start.grid(row=1, column=1, padx=(10, 0), sticky="w")
+
+        ttk.Label(master=filter_frame, text="To").grid(row=2, column=0, sticky="w")
+        self.summary_end = ttk.Entry(master=filter_frame, width=12)
+        self.summary_end.grid(row=2, column=1, padx=(10, 0), sticky="w")
+
+        for widget in (self.summary_ticker, self.summary_start, self.summary_end):
+            widget.bind("<Return>", lambda event: self.refresh_summary())
+        self.summary_ticker.bind("<<ComboboxSelected>>", lambda event: self.refresh_summary())
+
+        filter_frame.pack(anchor="w", padx=10, pady=10)
+
+        columns = {"trades": "Trades", "win_rate": "Win %", "profit_loss": "P/L", "volume": "Volume", "fees": "Fees"}
+        self.summary_treeview = ttk.Treeview(master=master, columns=list(columns), height=6)
+        self.summary_treeview.heading("#0", text="Period")
+        self.summary_treeview.column("#0", width=70)
+        for column, text in columns.items():
+            self.summary_treeview.heading(column=column, text=text)
+            self.summary_treeview.column(column=column, width=70, anchor="e")
+        self.summary_treeview.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        self.equity_canvas = tk.Canvas(master=master, width=420, height=EQUITY_CHART_HEIGHT, background="white", highlightthickness=0)
+        self.equity_canvas.bind("<Configure>", lambda event: self.draw_equity())
+        self.equity_canvas.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+    def refresh_summary(self):
+        """Show the rollups of the periods ending on the newest trade day, and of the From/To range, and redraw the
+        equity chart if trades changed."""
+        ticker = self.summary_ticker.get() or None
+        last_day = self.rollups.last_day
+        periods = {}
+
+        if last_day is not None:
+            end = datetime.date.fromordinal(last_day)
+            periods = {
+                "Day": end,
+                "Week": end - datetime.timedelta(days=end.weekday()),
+                "Month": end.replace(day=1),
+                "Year": end.replace(month=1, day=1),
+                "All": None,
+            }
+
+        rows = [(name, self.rollups.summary(start, end, ticker)) for name, start in periods.items()]
+
+        start, end = parse_date(self.summary_start.get()), parse_date(self.summary_end.get())
+        if start or end:
+            rows.append(("Range", self.rollups.summary(start, end, ticker)))
+
+        self.summary_treeview.delete(*self.summary_treeview.get_children())
+        for name, summary in rows:
+            values = (summary.trades, f"{summary.win_rate * 100:.1f}", format_number(summary.profit_loss), summary.volume, format_number(summary.fees))
+            self.summary_treeview.insert(parent="", index=tk.END, text=name, values=values)
+
+        self.draw_equity()
+
+    def draw_equity(self):
+        """Draw the cumulative realized P/L of closed trades, and below it the drawdown from its peak. Long curves are
+        downsampled to the canvas width, so a redraw costs the same for any number of trades."""
+        canvas, curve = self.equity_canvas, self.equity
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if (curve.version, width, height) == self.equity_drawn:
+            return
+        self.equity_drawn = (curve.version, width, height)
+
+        canvas.delete("all")
+        if not len(curve):
+            canvas.create_text(width // 2, height // 2, text="No closed trades", fill="gray")
+            return
+
+        margin = 4
+        plot_width = max(width - 2 * margin, 2)
+        equity_bottom = round(height * 0.7) # Equity above, drawdown in the strip below
+        x_scale = plot_width / max(len(curve) - 1, 1)
+
+        def plot(values, blocks, top, bottom, top_value, bottom_value):
+            """Return flat canvas coordinates of the downsampled values, top_value at y = top and bottom_value at y = bottom."""
+            y_scale = (bottom - top) / ((top_value - bottom_value) or 1)
+            coordinates = []
+            for position, value in downsample(values, blocks, plot_width):
+                coordinates.extend((margin + position * x_scale, bottom - (value - bottom_value) * y_scale))
+            return coordinates if len(coordinates) > 2 else coordinates * 2 # A line needs two points
+
+        low = min(0, min(curve.equity_blocks.mins))
+        high = max(0, max(curve.equity_blocks.maxs))
+        zero = equity_bottom - margin - (0 - low) * (equity_bottom - 2 * margin) / ((high - low) or 1)
+        canvas.create_line(margin, zero, margin + plot_width, zero, fill="gray", dash=(2, 2))
+        canvas.create_line(*plot(curve.equity, curve.equity_blocks, margin, equity_bottom - margin, high, low), fill="#1f77b4")
+
+        max_drawdown = curve.max_drawdown
+        canvas.create_line(*plot(curve.drawdowns, curve.drawdown_blocks, equity_bottom + margin, height - margin, 0, max_drawdown), fill="#d62728")
+
+        canvas.create_text(margin, margin, anchor="nw", text=f"P/L {format_number(curve.equity[-1])}   Max drawdown {format_number(max_drawdown)}")
+
     def build_status_label(self, master):
         """Create a status label for the interface."""
         self.status_label = ttk.Label(master=master, text="")
         self.status_label.pack()
 
-    def update_treeview_callback(self):
-        """Callback function for Treeview on enter pressed."""
-        print("Enter pressed.")
+    def show_metrics(self, stage):
+        """Append the last measurement of a stage to the status label, if the metrics overlay is on."""
+        if self.metrics_overlay.get():
+            status = self.status_label.cget("text").split("  [")[0]
+            self.status_label.config(text=f"{status}  [{self.metrics.summary(stage)}]")
+
+    def dump_metrics(self):
+        """Write the collected metrics to a JSON file, or the recorded profile to a .prof file."""
+        file_path = tk.filedialog.asksaveasfilename(title="Dump Metrics", defaultextension=".json", filetypes=[("JSON Files", "*.json"), ("cProfile Files", "*.prof")])
+
+        if file_path:
+            try:
+                if file_path.endswith(".prof"):
+                    self.metrics.dump_profile(file_path)
+                else:
+                    self.metrics.dump_json(file_path)
+                self.status_label.config(text=f"Metrics saved: {file_path}")
+            except Exception as e:
+                self.status_label.config(text=f"Error: {e}")
+                print_traceback()
+
+    def update_treeview_callback(self, iid, column):
+        """Callback function for Treeview on enter pressed. Recalculate only the trade owning the edited cell."""
+        row = self.ledger.row_of_iid(iid)
+
+        if row is None: # Empty separator row or unknown item
+            return
+
+        self.ledger.update(row, column, self.treeview.set(iid, column))
+        self.journal.set_cell(row, column, self.treeview.set(iid, column))
+
+        if self.store is not None and self.ledger.fill_ids[row] >= 0:
+            self.store.upsert(self.ledger.row_values(row), fill_id=self.ledger.fill_ids[row])
+
+        if self.virtual and column == "open_date":
+            self.row_store.invalidate() # Date separators moved
+
+        if column in ("open_date", "ticker", "long_short"):
+            self.fill_index.invalidate()
+        self.sort_keys.invalidate_rows([row])
+
+        self.refresh_calculations()
+
+    def on_heading_click(self, event, extend=False):
+        """Sort by the clicked column: ascending, then descending, then unsorted. With extend, the column is added to
+        the sort keys or its direction is toggled."""
+        if self.treeview.identify_region(event.x, event.y) != "heading":
+            return
+
+        column = self.treeview.column(self.treeview.identify_column(event.x), "id")
+
+        if extend:
+            if column in dict(self.sort_order):
+                self.sort_order = [(col, not descending if col == column else descending) for col, descending in self.sort_order]
+            else:
+                self.sort_order.append((column, False))
+        elif self.sort_order[:1] == [(column, False)] and len(self.sort_order) == 1:
+            self.sort_order = [(column, True)]
+        elif self.sort_order[:1] == [(column, True)] and len(self.sort_order) == 1:
+            self.sort_order = []
+        else:
+            self.sort_order = [(column, False)]
+
+        # Arrows show the direction, numbers the key order of multi-key sorts
+        sort_columns = [col for col, descending in self.sort_order]
+        for col, text in self.column_names.items():
+            if col in sort_columns:
+                text += " \u25bc" if self.sort_order[sort_columns.index(col)][1] else " \u25b2"
+                if len(sort_columns) > 1:
+                    text += str(sort_columns.index(col) + 1)
+            self.treeview.heading(column=col, text=text)
+
+        self.apply_sort()
+
+    @instrumented("apply_sort", rows=lambda self: len(self.ledger))
+    def apply_sort(self):
+        """Order the Treeview by the sort keys with one bulk move pass. Sort keys come from the cache, so cells are not
+        parsed again."""
+        if self.virtual: # The row store is ordered together with the filter
+            self.apply_filter()
+            return
+
+        if not self.sort_order and self.sort_rank is None:
+            return
+
+        if self.sort_order:
+            order = self.sort_keys.sort(range(len(self.ledger)), self.sort_order)
+            self.sort_rank = array("q", bytes(8 * len(order)))
+            for position, row in enumerate(order):
+                self.sort_rank[row] = position
+        else:
+            self.sort_rank = None
+
+        iids = self.ledger.iids
+        if self.visible_rows is None:
+            visible = list(iids) + (list(self.separator_keys) if self.sort_rank is None else [])
+        else:
+            visible = [iids[row] for row in self.visible_rows]
+
+        # Date separators make no sense in another order, they stay detached while sorted
+        self.treeview.detach(*self.treeview.get_children())
+        for iid in sorted(visible, key=self.display_key, reverse=True):
+            self.treeview.move(iid, "", 0)
+
+    def arrange_rows(self):
+        """Apply the sort order and the filter bar to rows that were just added or loaded."""
+        if not self.virtual:
+            self.apply_sort()
+        self.apply_filter()
+
+    @instrumented("apply_filter")
+    def apply_filter(self):
+        """Show only the fills matching the filter bar. Dates that are still being typed are ignored."""
+        criteria = {name: var.get() for name, var in self.filter_vars.items()}
+        matches = self.fill_index.query(
+            ticker=criteria["ticker"],
+            long_short=criteria["long_short"],
+            start=parse_date(criteria["start"]),
+            end=parse_date(criteria["end"]),
+            status=criteria["status"])
+
+        if self.virtual:
+            rows = matches
+            if self.sort_order:
+                rows = self.sort_keys.sort(range(len(self.ledger)) if matches is None else matches, self.sort_order)[::-1]
+            self.row_store.set_filter(rows)
+            self.treeview.refresh(reload=True)
+        else:
+            self.show_rows(matches)
+
+        if matches is not None:
+            self.status_label.config(text=f"{len(matches)} of {len(self.ledger)} fills match the filter")
+
+    def display_key(self, iid) -> int:
+        """Return the display order key of a Treeview item: newer fills have smaller keys, and the separator
+        inserted with a fill sits just below it. Once sorted, the key is the sorted position, and rows added since
+        stay on top."""
+        row = self.ledger.row_of_iid(iid)
+
+        if self.sort_rank is not None:
+            return self.sort_rank[row] if row < len(self.sort_rank) else -1 - row
+
+        return -2 * row if row is not None else self.separator_keys[iid]
+
+    def detached_items(self) -> list:
+        """Return the Treeview items detached by the filter or the sort: filtered out fills, and separators while
+        filtering or sorted."""
+        detached = []
+        if self.visible_rows is not None:
+            detached = [iid for row, iid in enumerate(self.ledger.iids) if row not in self.visible_rows]
+        if self.visible_rows is not None or self.sort_rank is not None:
+            detached += self.separator_keys
+        return detached
+
+    def show_rows(self, rows):
+        """Attach only the Treeview items of rows, or every item if rows is None, detaching and reattaching only
+        the items whose visibility changes."""
+        old, new = self.visible_rows, None if rows is None else set(rows)
+        if old is None and new is None:
+            return
+
+        iids = self.ledger.iids
+        separators = list(self.separator_keys) if self.sort_rank is None else [] # Already hidden while sorted
+        if old is None: # Filter applied, separators are hidden while filtering
+            hide = [iid for row, iid in enumerate(iids) if row not in new] + separators
+            show = []
+        elif new is None: # Filter cleared
+            hide = []
+            show = [iid for row, iid in enumerate(iids) if row not in old] + separators
+        else:
+            hide = [iids[row] for row in old - new]
+            show = [iids[row] for row in new - old]
+
+        if hide:
+            self.treeview.detach(*hide)
+
+        if len(show) <= 1000:
+            # Reattach each item at its final index. Going from top to bottom, every item above it is already attached
+            if new is None:
+                final_keys = sorted(map(self.display_key, self.treeview.get_children() + tuple(show)))
+            else:
+                final_keys = sorted(self.display_key(iids[row]) for row in new)
+            for key, iid in sorted((self.display_key(iid), iid) for iid in show):
+                self.treeview.move(iid, "", bisect.bisect_left(final_keys, key))
+        else:
+            # Many items: reattach the whole result bottom up at index 0, each move staying O(1) in Tk
+            visible = list(iids) + separators if new is None else [iids[row] for row in new]
+            self.treeview.detach(*self.treeview.get_children())
+            for iid in sorted(visible, key=self.display_key, reverse=True):
+                self.treeview.move(iid, "", 0)
+
+        self.visible_rows = new
 
     def lowercase_ignore_special(self, text):
         """Find all alphabetic characters and convert only them to lowercase"""
         return ''.join(char.lower() if char.isalpha() else char for char in text)
 
     def write_csv_file(self, path):
-        """Write treeview data  to CSV file."""
-        header = ("open_date","ticker", "long_short", "open_shares", "open_price", "cost", "close_date", "close_shares", "close_price", "proceeds")
+        """Write ledger data to a CSV file, or to a binary snapshot for a .tts path, on a background thread."""
+        import exporter
+
+        self.metrics.start("write_csv_file")
+        columns = self.ledger.snapshot_columns() # Copy, so the ledger can keep changing during the export
+        state = {"path": path, "rows": 0, "total": len(self.ledger), "done": False, "error": None}
 
-        with open(path, "w") as file:
-            writer = csv.DictWriter(file, fieldnames=header)
-            writer.writeheader()
+        def progress(rows, total):
+            """Worker thread: record progress for poll_export."""
+            state["rows"] = rows
 
-            iids = reversed(self.treeview.get_children())
-            for iid in iids:
-                row = self.treeview.set(iid)
-                if row:
-                    data = {k: v for k, v in row.items() if k in header}
-                    writer.writerow(data)
+        def export():
+            """Worker thread: write the file."""
+            try:
+                exporter.export_columns(columns, path, progress)
+            except Exception as e:
+                print_traceback()
+                state["error"] = e
+            state["done"] = True
+
+        threading.Thread(target=export, daemon=True).start()
+        self.after(100, self.poll_export, state)
+
+    def poll_export(self, state):
+        """Show the progress of a running export in the status label until it completes."""
+        if not state["done"]:
+            self.status_label.config(text=f"Exporting {state['path']}: {state['rows']} of {state['total']} rows")
+            self.after(100, self.poll_export, state)
+        elif state["error"]:
+            self.status_label.config(text=f"Error: {state['error']}")
+            self.metrics.stop("write_csv_file", state["rows"])
+        else:
+            self.status_label.config(text=f"File saved: {state['path']}")
+            self.metrics.stop("write_csv_file", state["total"])
 
     def autosave(self):
-        """Autosave data to a CSV file."""
-        pass
-        
+        """Autosave data. Adds and edits are journaled as they happen, this periodically compacts the journal into a snapshot."""
+        if self.journal.needs_compaction():
+            self.snapshot_ledger()
+
+        self.after(AUTOSAVE_INTERVAL_MS, self.autosave)
+
+    def snapshot_ledger(self):
+        """Replace the autosave journal with a snapshot of the whole ledger, after the data was replaced. Up to date
+        trade totals are saved with it, so the next session can reopen the ledger without recalculating it. Only the
+        columns are copied here, the journal's writer thread formats them."""
+        results = None
+        if not self.ledger.dirty_groups:
+            results = {"lot_method": self.ledger.lot_method, "totals": [[row, *totals] for row, totals in self.ledger.totals.items()]}
+
+        self.journal.compact(self.ledger.snapshot_columns(), results)
+
+    def restore_autosave(self):
+        """Display the fills saved by the autosave journal in the last session."""
+        try:
+            rows = self.journal.load()
+        except Exception as e:
+            self.status_label.config(text=f"Error: {e}")
+            print_traceback()
+            return
+
+        if rows:
+            columns = self.treeview["columns"]
+            self.insert_fills((row, tuple(row.get(col, "") for col in columns)) for row in rows)
+
+            results = self.journal.load_results()
+            cached_totals = None
+            if results and results.get("lot_method") == self.ledger.lot_method:
+                cached_totals = {row: TradeTotals(*values) for row, *values in results["totals"]}
+
+            self.perform_all_calculations(cached_totals)
+            self.arrange_rows()
+            self.status_label.config(text=f"Restored {len(rows)} fills from autosave")
+
+    def on_close(self):
+        """Flush the autosave journal and close the application."""
+        self.cancel_import()
+        self.stop_following()
+        self.journal.close()
+
+        if self.store is not None:
+            self.store.close()
+        if self.price_store is not None:
+            self.price_store.close()
+
+        self.destroy()
 
     def export_csv_file(self):
         """Export to a CSV file."""
-        file_path = tk.filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")])
+        file_path = tk.filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv"), ("Trade Snapshots", "*.tts"), ("All Files", "*.*")])
 
         if file_path:
             self.write_csv_file(file_path)
 
+    @instrumented("add_entry", rows=lambda self: 1)
     def add_entry(self):
         """Add entry values to treeview and export to current CSV file."""
         entry_inner_frame = self.nametowidget(".main_frame.order_entry_frame.entry_inner_frame")
@@ -225,95 +802,602 @@ class TradeTracker(tk.Tk):
             "cost": entry_inner_frame.nametowidget("cost").get()
         }
 
-        new_item = self.treeview.insert(parent="", index=0)
-        columns = ("open_date", "ticker", "long_short", "open_shares", "open_price", "cost")
+        if self.store is not None:
+            data["fill_id"] = self.store.upsert(data)
 
-        for col, val in data.items():
-            self.treeview.set(item=new_item, column=col, value=val)
+        if self.virtual:
+            self.ledger.append(data)
+        else:
+            new_item = self.treeview.insert(parent="", index=0, iid=str(len(self.ledger)))
+            columns = ("open_date", "ticker", "long_short", "open_shares", "open_price", "cost")
 
-    def import_csv_file(self):
-        """Import from a CSV file."""
-        file_path = tk.filedialog.askopenfilename(title="Import CSV File", filetypes=[("CSV Files", "*.csv")])
+            for col in columns:
+                self.treeview.set(item=new_item, column=col, value=data[col])
+
+            index = self.ledger.append(data)
+
+            if self.visible_rows is not None:
+                self.visible_rows.add(index)
+
+        self.journal.append_fill(data)
+        self.refresh_calculations()
+        self.apply_filter()
+
+    def open_store_file(self):
+        """Open or create a trade database and display its fills."""
+        file_path = tk.filedialog.asksaveasfilename(title="Open Trade Database", defaultextension=".db", confirmoverwrite=False, filetypes=[("SQLite Databases", "*.db"), ("All Files", "*.*")])
 
         if file_path:
-            self.treeview.delete(*self.treeview.get_children()) # Clear current data
             try:
-                with open(file_path, "r", newline="") as file:
-                    csv_reader = csv.DictReader(file)
-                    temp_date = ""
-                    for row in csv_reader:
-                        new_item = self.treeview.insert(parent="", index=0)
-                        # Add empty row to separate different dates
-                        if row["open_date"] != temp_date:
-                            new_item = self.treeview.insert(parent="", index=0)
-                            temp_date = row["open_date"]
-
-                        for col_name, value in row.items():
-                            self.treeview.set(item=new_item, column=col_name, value=value)
-
-                self.perform_all_calculations()
-                self.status_label.config(text=f"CSV file loaded: {file_path}")
-
+                self.load_store(file_path)
+                self.status_label.config(text=f"Database loaded: {file_path}")
             except Exception as e:
                 self.status_label.config(text=f"Error: {e}")
-                print(traceback.format_exc())
+                print_traceback()
+
+    def query_store(self):
+        """Reload the open trade database with only the fills of the filter bar's whole ticker and open date range, read
+        through the database indexes instead of loading every fill."""
+        if self.store is None:
+            self.status_label.config(text="Open a trade database to load from it")
+            return
+
+        criteria = {name: var.get() for name, var in self.filter_vars.items()}
+        start, end = parse_date(criteria["start"]), parse_date(criteria["end"])
+        filters = {"ticker": criteria["ticker"].strip().upper() or None, "start_date": start and start.isoformat(), "end_date": end and end.isoformat()}
+
+        try:
+            self.load_store(self.store.path, **filters)
+            self.status_label.config(text=f"{len(self.ledger)} fills loaded from {self.store.path}")
+        except Exception as e:
+            self.status_label.config(text=f"Error: {e}")
+            print_traceback()
+
+    def load_store(self, path, **filters):
+        """Open the TradeStore at path and display its fills. filters are passed to TradeStore.load as indexed queries."""
+        from trade_store import TradeStore
+
+        self.cancel_import()
+        self.stop_following()
+
+        if self.store is not None:
+            self.store.close()
+
+        self.store = TradeStore(path)
+        self.clear_grid()
+
+        columns = self.treeview["columns"]
+        self.insert_fills((row, tuple(row.get(col, "") for col in columns)) for row in self.store.load(**filters))
+        self.perform_all_calculations()
+        self.snapshot_ledger()
+        self.arrange_rows()
+
+    def clear_grid(self):
+        """Remove every fill from the Treeview and the ledger."""
+        self.treeview.delete(*self.treeview.get_children(), *self.detached_items())
+        self.visible_rows = None
+
+        self.ledger.clear()
+        self.rollups.clear()
+        self.equity.clear()
+        self.fill_index.invalidate()
+        self.sort_keys.invalidate()
+        self.sort_rank = None
+        self.separator_keys = {}
+        self.separator_date = ""
+
+        if self.virtual: # Filter and sort are applied again by arrange_rows once rows are loaded
+            self.row_store.set_filter(None)
+
+    def insert_fills(self, fills):
+        """Add (row, values) fills to the ledger and on top of the Treeview, oldest first."""
+        if self.virtual: # Rows are fetched by the Treeview when scrolled into view
+            for row, values in fills:
+                self.ledger.append(row)
+            return
+
+        for row, values in fills:
+            self.insert_item(len(self.ledger), row["open_date"], values)
+            self.ledger.append(row)
+
+    def insert_fill_columns(self, columns) -> int:
+        """Add fills given as {column_name: values}, see Ledger.snapshot_columns, to the ledger and on top of the
+        Treeview, oldest first, without parsing them again. Returns the number of fills added."""
+        import exporter
+
+        start = len(self.ledger)
+        self.ledger.extend(columns)
+        if self.virtual and self.store is None:
+            return len(self.ledger) - start
+
+        rows = list(exporter.iter_rows(columns))
+        if self.store is not None:
+            for index, fill_id in enumerate(self.store.insert_many(rows), start):
+                self.ledger.fill_ids[index] = fill_id
+
+        if not self.virtual:
+            treeview_columns = self.treeview["columns"]
+            for index, row in enumerate(rows, start):
+                self.insert_item(index, row["open_date"], tuple(row.get(column, "") for column in treeview_columns))
+
+        return len(rows)
+
+    def insert_item(self, index, open_date, values):
+        """Insert the Treeview item of ledger row index on top, after a separator if it opens another date."""
+        # Add empty row to separate different dates
+        if open_date != self.separator_date:
+            separator = self.treeview.insert(parent="", index=0)
+            self.separator_keys[separator] = 1 - 2 * index
+            self.separator_date = open_date
+
+            if self.visible_rows is not None or self.sort_rank is not None: # Separators are hidden while filtering or sorted
+                self.treeview.detach(separator)
+
+        # Fills use their ledger row as iid, separators get Tk's generated ones
+        self.treeview.insert(parent="", index=0, iid=str(index), values=values)
+
+        if self.visible_rows is not None: # Shown until the filter is applied again
+            self.visible_rows.add(index)
+
+    def browse_csv_file(self):
+        """Open a read-only window over a CSV file of any size. Rows are decoded from a memory map only when displayed."""
+        from lazy_csv import CsvRowStore, LazyCsvReader
+
+        file_path = tk.filedialog.askopenfilename(title="Browse CSV File", filetypes=[("CSV Files", "*.csv")])
+
+        if not file_path:
+            return
+
+        try:
+            reader = LazyCsvReader(file_path)
+        except Exception as e:
+            self.status_label.config(text=f"Error: {e}")
+            print_traceback()
+            return
+
+        window = tk.Toplevel(master=self)
+        window.title(os.path.basename(file_path))
+        window.bind("<Destroy>", lambda event: reader.close() if event.widget is window else None)
+
+        filter_frame = ttk.Frame(master=window)
+        grid_frame = ttk.Frame(master=window)
+
+        columns = tuple(reader.fieldnames)
+        scrollbar = ttk.Scrollbar(master=grid_frame, orient=tk.VERTICAL)
+        treeview = EditTreeview(master=grid_frame, columns=columns, row_store=CsvRowStore(reader, columns), editable=False, yscrollcommand=scrollbar.set, show="headings")
+        scrollbar.config(command=treeview.yview)
+
+        for col_name in columns:
+            treeview.heading(column=col_name, text=col_name)
+            treeview.column(column=col_name, width=100)
+
+        # Filter on one column, matched on the raw bytes of each row before decoding
+        column_combobox = ttk.Combobox(master=filter_frame, values=columns, state="readonly", width=12)
+        value_entry = ttk.Entry(master=filter_frame, width=12)
+        count_label = ttk.Label(master=filter_frame, text=f"{len(reader)} rows")
+
+        def apply_filter(event=None):
+            """Show only the rows whose selected column equals the entered value."""
+            column, value = column_combobox.get(), value_entry.get().strip()
+            indexes = reader.filter_rows(**{column: value}) if column and value else None
+
+            treeview.row_store = CsvRowStore(reader, columns, indexes)
+            treeview.first_row = 0
+            treeview.refresh(reload=True)
+            count_label.config(text=f"{len(treeview.row_store)} of {len(reader)} rows")
 
+        value_entry.bind("<Return>", apply_filter)
+
+        column_combobox.pack(side=tk.LEFT)
+        value_entry.pack(padx=(10, 0), side=tk.LEFT)
+        ttk.Button(master=filter_frame, command=apply_filter, text="Filter").pack(padx=(10, 0), side=tk.LEFT)
+        count_label.pack(padx=(10, 0), side=tk.LEFT)
 
-    def perform_all_calculations(self):
-        """Perform all calculations for Treeview."""
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        treeview.pack(fill=tk.BOTH, expand=True)
 
-        def calculate_and_set_values(iid, total_cost, total_shares, total_net_proceeds):
-            """Helper method to calculate and set total cost, cost basis, and profit/loss."""
-            total_cost = round(total_cost, 2)
-            cost_basis = round(total_cost / total_shares, 2)
-            profit_loss = round(total_net_proceeds - total_cost, 2)
-            net_percentage = round(profit_loss/total_cost*100, 2)
+        filter_frame.pack(anchor="w", padx=20, pady=(20, 10))
+        grid_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 20))
+
+    def import_csv_file(self):
+        """Import from a CSV file. The file is parsed on a worker thread and inserted into the Treeview in batches.
 
-            self.treeview.set(item=iid, column="total_cost", value=total_cost)
-            self.treeview.set(item=iid, column="cost_basis", value=cost_basis)
-            self.treeview.set(item=iid, column="profit_loss", value=profit_loss)
-            self.treeview.set(item=iid, column="net_percentage", value=net_percentage)
+        Without a database the imported file replaces the current data, otherwise its fills are appended to the database.
+        """
+        file_path = tk.filedialog.askopenfilename(title="Import CSV File", filetypes=[("CSV Files", "*.csv"), ("Trade Snapshots", "*.tts")])
 
-        iids = self.treeview.get_children()
+        if file_path:
+            self.start_import([file_path], file_path)
 
-        # Temporary variables to track ongoing trade
-        upper_row_iid = None
-        open_date_temp = ticker_temp = long_short_temp = ""
-        total_cost = total_shares = total_net_proceeds = None
+    def import_csv_files(self):
+        """Import several CSV files at once, merged by date with fills repeated across files skipped."""
+        file_paths = tk.filedialog.askopenfilenames(title="Import CSV Files", filetypes=[("CSV Files", "*.csv")])
 
-        for iid in iids:
-            row = self.treeview.set(iid)
+        if file_paths:
+            self.start_import(list(file_paths), f"{len(file_paths)} files")
 
-            # If the row is not empty
-            if row:
-                open_date, ticker, long_short = row["open_date"], row["ticker"], row["long_short"]
-                open_shares, net_cost = float(row["open_shares"]), float(row["cost"])
-                net_proceeds = float(row["proceeds"]) if row["proceeds"] else 0
+    def import_csv_folder(self):
+        """Import every CSV file of a folder, merged by date with fills repeated across files skipped."""
+        folder = tk.filedialog.askdirectory(title="Import CSV Folder")
+        if not folder:
+            return
 
-                # If continuing the same trade (multiple entries/transactions)
-                if (open_date_temp == open_date) and (ticker_temp == ticker) and (long_short_temp == long_short):
-                    total_cost += net_cost
-                    total_shares += open_shares
-                    total_net_proceeds += net_proceeds
+        file_paths = sorted(entry.path for entry in os.scandir(folder) if entry.is_file() and entry.name.lower().endswith(".csv"))
+        if file_paths:
+            self.start_import(file_paths, f"{len(file_paths)} files in {folder}")
+        else:
+            self.status_label.config(text=f"No CSV files in {folder}")
 
-                # For a new trade
-                else:
-                    # Calculate the previous trade's values if any (all trades except the very first one)
-                    if total_cost is not None:
-                        calculate_and_set_values(upper_row_iid, total_cost, total_shares, total_net_proceeds)
+    def follow_csv_file(self):
+        """Import a CSV file the broker keeps appending to, then add the fills appended to it as they are written."""
+        import broker_import
 
-                    # Update temp variables for the new trade
-                    upper_row_iid = iid
-                    open_date_temp, ticker_temp, long_short_temp = open_date, ticker, long_short
-                    total_cost, total_shares, total_net_proceeds = net_cost, open_shares, net_proceeds
+        file_path = tk.filedialog.askopenfilename(title="Follow CSV File", filetypes=[("CSV Files", "*.csv")])
 
-            # Empty row encountered; process the previous trade's calculations.
+        if file_path:
+            self.cancel_import()
+            self.stop_following()
+            if self.store is None:
+                self.clear_grid()
+
+            self.follower = broker_import.FileFollower(file_path)
+            self.poll_follower()
+
+    def poll_follower(self):
+        """Add the fills appended to the followed file since the last poll. Only the new lines are parsed and only
+        the trades they belong to are recalculated."""
+        follower = self.follower
+        self.follow_job = None
+
+        try:
+            from_top = follower.offset == 0
+            fills = follower.read() if follower.pending() else []
+        except Exception as e:
+            self.stop_following()
+            self.status_label.config(text=f"Error: {e}")
+            print_traceback()
+            return
+
+        if follower.restarted:
+            from_top = True
+            if self.store is None: # Rewritten from the top, every fill was read again
+                self.clear_grid()
+                self.refresh_summary()
+
+        if fills:
+            if self.store is not None:
+                for row, fill_id in zip(fills, self.store.insert_many(fills)):
+                    row["fill_id"] = fill_id
+
+            columns = self.treeview["columns"]
+            self.insert_fills((row, tuple(row.get(col, "") for col in columns)) for row in fills)
+            if self.virtual:
+                self.treeview.refresh()
+
+            self.refresh_calculations()
+            if follower.pending(): # Catching up with a large file, save and arrange once after its last chunk
+                self.follow_deferred = True
             else:
-                calculate_and_set_values(upper_row_iid, total_cost, total_shares, total_net_proceeds)
+                self.save_followed_fills(fills, snapshot=from_top)
+
+            self.status_label.config(text=f"Following {follower.path}: {len(fills)} new fills at {time.strftime('%H:%M:%S')}")
+        elif self.follow_deferred: # Only a partial line is left
+            self.save_followed_fills([])
+
+        # Poll again right away while a large file is being caught up with
+        self.follow_job = self.after(1 if fills else FOLLOW_INTERVAL_MS, self.poll_follower)
+
+    def save_followed_fills(self, fills, snapshot=False):
+        """Save the fills just read from the followed file to the autosave journal and arrange the grid. After a
+        catch-up over several chunks, or a read from the top, the whole ledger is snapshot in one write instead."""
+        if snapshot or self.follow_deferred:
+            self.snapshot_ledger()
+        else:
+            for row in fills:
+                self.journal.append_fill(row)
+
+        self.follow_deferred = False
+        self.arrange_rows()
+
+    def stop_following(self):
+        """Stop adding the fills appended to the followed file."""
+        if self.follow_job is not None:
+            self.after_cancel(self.follow_job)
+            self.follow_job = None
+
+        if self.follow_deferred: # Stopped while catching up
+            self.save_followed_fills([])
+
+        if self.follower is not None:
+            self.status_label.config(text=f"Stopped following {self.follower.path}")
+            self.follower = None
+
+    def start_import(self, file_paths, description):
+        """Start importing file_paths on a worker thread. description names them in the status bar."""
+        self.cancel_import() # Stop any import still running
+        self.stop_following()
+        self.metrics.start("import_csv_file")
+        if self.store is None:
+            self.clear_grid() # Clear current data
+
+        if self.import_cache is None:
+            from import_cache import ImportCache
+            self.import_cache = ImportCache(IMPORT_CACHE_DIRECTORY)
+
+        self.import_queue = queue.Queue(maxsize=10)
+        self.import_cancel_event = threading.Event()
+        self.import_state = {"path": description, "rows": 0, "start": time.perf_counter(), "stats": {}, "first_row": len(self.ledger)}
+
+        threading.Thread(target=self.read_csv_batches, args=(file_paths, self.treeview["columns"], self.import_queue, self.import_cancel_event, self.import_state["stats"]), daemon=True).start()
+
+        self.cancel_btn.config(state="normal")
+        self.after(0, self.insert_import_batches)
+
+    def read_csv_batches(self, file_paths, columns, batch_queue, cancel_event, stats):
+        """Worker thread: parse CSV files and put batches of (row, values) on the queue. Ends with None or an exception.
+        Fills found in the import cache come first, as batches of {column_name: values} columns that need no parsing.
+
+        Must not touch any widget, Tk is only safe to call from the main thread.
+        """
+
+        def put(item):
+            """Put an item on the bounded queue, giving up if the import gets cancelled."""
+            while not cancel_event.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for batch in self.read_cached_columns(file_paths, stats):
+                if not put(batch):
+                    return
+
+            batch = []
+            for row in self.read_fill_rows(file_paths, stats):
+                batch.append((row, tuple(row.get(col, "") for col in columns)))
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    if not put(batch):
+                        return
+                    batch = []
+
+            if batch and not put(batch):
+                return
+
+            put(None)
+
+        except Exception as e:
+            print_traceback()
+            put(e)
+
+    def read_cached_columns(self, file_paths, stats):
+        """Worker thread: yield the cached fill columns of a single CSV file in slices of IMPORT_BATCH_SIZE rows.
+
+        stats receives cached, the CacheEntry they come from or None, and cached_rows, see ImportCache.lookup.
+        """
+        import exporter
+
+        cached, columns = None, None
+        if len(file_paths) == 1 and not exporter.is_snapshot(file_paths[0]):
+            cached, columns = self.import_cache.lookup(file_paths[0])
+        stats.update(cached=cached, cached_rows=cached.rows if cached is not None else 0)
+
+        for start in range(0, stats["cached_rows"], IMPORT_BATCH_SIZE):
+            yield {column: values[start:start + IMPORT_BATCH_SIZE] for column, values in columns.items()}
+
+    def read_fill_rows(self, file_paths, stats):
+        """Yield the fills of a binary snapshot or of CSV files in any known broker layout as {column_name: value} dicts.
+
+        Several CSV files are parsed in parallel and merged by date, stats receives the count of duplicates skipped. A
+        single CSV file is parsed past the fills found in the import cache, stats receives the entry to save for it.
+        """
+        import broker_import
+        import exporter
+
+        if len(file_paths) > 1:
+            yield from broker_import.read_fills_parallel(file_paths, stats=stats)
+        elif exporter.is_snapshot(file_paths[0]):
+            yield from exporter.iter_rows(exporter.read_snapshot(file_paths[0]))
+        else:
+            yield from self.import_cache.read_fills(file_paths[0], stats, stats.get("cached"))
+
+    def insert_import_batches(self):
+        """Insert the batches parsed so far into the Treeview, then reschedule until the import completes."""
+        if self.import_cancel_event.is_set():
+            return
+
+        state = self.import_state
+        deadline = time.perf_counter() + 0.05 # Yield to the event loop every 50 ms
+
+        while time.perf_counter() < deadline:
+            try:
+                batch = self.import_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if batch is None:
+                stats = state["stats"]
+                status = f"CSV file loaded: {state['path']}"
+                if stats.get("duplicates"):
+                    status += f" ({stats['duplicates']} duplicate fills skipped)"
+                if stats.get("cached") is not None:
+                    parsed = state["rows"] - stats["cached_rows"]
+                    status += f" ({parsed} appended fills parsed, the rest from cache)" if parsed else " (from cache)"
+                self.finish_import(status, completed=True)
+                return
+
+            if isinstance(batch, Exception):
+                self.finish_import(f"Error: {batch}")
+                return
+
+            if isinstance(batch, dict): # Fill columns from the import cache
+                state["rows"] += self.insert_fill_columns(batch)
+                continue
+
+            if self.store is not None:
+                fill_ids = self.store.insert_many([row for row, values in batch])
+                for (row, values), fill_id in zip(batch, fill_ids):
+                    row["fill_id"] = fill_id
+
+            self.insert_fills(batch)
+            state["rows"] += len(batch)
+
+        if self.virtual:
+            self.treeview.refresh()
+
+        rows_per_second = state["rows"] / max(time.perf_counter() - state["start"], 1e-9)
+        self.status_label.config(text=f"Importing {state['path']}: {state['rows']} rows ({rows_per_second:,.0f} rows/s)")
+        self.after(1, self.insert_import_batches)
+
+    def finish_import(self, status, completed=False):
+        """Calculate the imported trades, reset the import controls and show status. A completed import of a single CSV
+        file reuses the trade totals cached with its fills, and updates the cache."""
+        self.import_cancel_event.set() # Also stops the worker thread if it is still running
+        self.cancel_btn.config(state="disabled")
+
+        stats, first_row = self.import_state["stats"], self.import_state["first_row"]
+        entry = stats.get("entry") if completed else None
+        cached = stats.get("cached") # Entry the fills were read from, see ImportCache.read_fills
+
+        cached_totals = None
+        if entry is not None and cached is not None and cached.totals is not None and cached.lot_method == self.ledger.lot_method and first_row == 0:
+            cached_totals = {row: TradeTotals(*values) for row, *values in cached.totals}
+        self.perform_all_calculations(cached_totals, stats.get("cached_rows"))
+        self.snapshot_ledger()
+        self.arrange_rows()
+
+        if entry is not None:
+            self.save_import_cache(entry, first_row, self.import_state["rows"] > stats["cached_rows"])
+
+        self.status_label.config(text=status)
+        self.metrics.stop("import_csv_file", self.import_state["rows"])
+
+    def cancel_import(self):
+        """Cancel a running import, keeping the rows inserted so far."""
+        if self.import_cancel_event is None or self.import_cancel_event.is_set():
+            return
+
+        self.finish_import(f"Import cancelled after {self.import_state['rows']} rows: {self.import_state['path']}")
+
+    def save_import_cache(self, entry, first_row, new_fills):
+        """Save the cache entry of the CSV file just imported from ledger row first_row on, on a background thread.
+
+        The trade totals are saved with it if the ledger holds nothing but the file. The fills are only written if some
+        were parsed, new_fills.
+        """
+        if first_row == 0 and not self.ledger.dirty_groups:
+            entry = entry._replace(lot_method=self.ledger.lot_method, totals=[[row, *totals] for row, totals in self.ledger.totals.items()])
+
+        columns = None
+        if new_fills:
+            columns = self.ledger.snapshot_columns() # Copy, so the ledger can keep changing while it is written
+            if first_row:
+                columns = {column: values[first_row:] for column, values in columns.items()}
+
+        threading.Thread(target=self.import_cache.save, args=(entry, columns), daemon=True).start()
+
+    @instrumented("perform_all_calculations", rows=lambda self, *args, **kwargs: len(self.ledger))
+    def perform_all_calculations(self, cached_totals=None, cached_rows=None):
+        """Perform all calculations with the ledger and display the results on each trade's top row.
+
+        cached_totals: {row: TradeTotals} saved by an earlier session, used instead of calculating if they still fit.
+        cached_rows: cached_totals are of the first cached_rows fills only, the trades of later fills are calculated.
+        """
+        if cached_totals is not None and self.ledger.restore_totals(cached_totals, cached_rows):
+            totals = dict(self.ledger.totals.items())
+            totals.update(self.ledger.recalculate_dirty())
+        else:
+            totals = self.ledger.calculate()
+        self.rollups.rebuild(self.ledger)
+        self.equity.rebuild(self.ledger, self.rollups)
+        self.sort_keys.invalidate(RESULT_COLUMNS)
+        self.display_totals(totals)
+        self.refresh_summary()
+
+    def change_lot_method(self):
+        """Recalculate every trade with the selected lot matching method and show the open lots left."""
+        self.ledger.lot_method = self.lot_method.get() or None
+        previous_anchors = set(self.ledger.totals)
+        totals = self.ledger.calculate()
+        self.display_totals({**{row: None for row in previous_anchors}, **totals})
+        self.rollups.rebuild(self.ledger)
+        self.equity.rebuild(self.ledger, self.rollups)
+        self.sort_keys.invalidate(RESULT_COLUMNS)
+        self.refresh_summary()
+
+        report = self.ledger.lot_report
+        if report is not None:
+            status = f"{len(report)} lot matches, {len(report.open_lots)} open lots"
+            if report.unmatched:
+                status += f", {len(report.unmatched)} closes without open shares"
+            self.status_label.config(text=status)
+
+    def open_price_store(self):
+        """Return the local price store, opening it on first use."""
+        if self.price_store is None:
+            from prices import PriceStore
+            self.price_store = PriceStore(PRICES_DIRECTORY)
+        return self.price_store
+
+    def import_prices(self):
+        """Add the daily prices of CSV files, one per ticker or with a Ticker column, to the local price store."""
+        file_paths = tk.filedialog.askopenfilenames(title="Import Prices", filetypes=[("CSV Files", "*.csv")])
+        if not file_paths:
+            return
+
+        try:
+            count = sum(self.open_price_store().import_csv(file_path) for file_path in file_paths)
+        except Exception as e:
+            self.status_label.config(text=f"Error: {e}")
+            return
+        self.status_label.config(text=f"Imported {count} daily prices from {len(file_paths)} files")
+
+    def mark_to_market(self):
+        """Show the unrealized profit/loss of the open lots at the latest local close."""
+        from prices import mark_to_market
+
+        valuation = mark_to_market(self.ledger, self.open_price_store())
+        status = f"Unrealized P/L {format_number(valuation.unrealized)} over {valuation.lots} open lots"
+        if valuation.by_ticker:
+            status += " (" + ", ".join(f"{ticker} {format_number(value)}" for ticker, value in sorted(valuation.by_ticker.items())) + ")"
+        if valuation.unpriced:
+            status += f", no prices for {', '.join(valuation.unpriced)}"
+        self.status_label.config(text=status)
+
+    def refresh_calculations(self):
+        """Recalculate and display only the trades marked dirty in the ledger."""
+        changed = self.ledger.recalculate_dirty()
+        groups = self.rollups.update(self.ledger, changed)
+        self.equity.update(self.ledger, self.rollups, groups)
+        self.sort_keys.invalidate_rows(changed)
+        self.display_totals(changed)
+        self.refresh_summary()
+
+    def display_totals(self, changed):
+        """Display recalculated trades given as {row: totals}. Rows with None totals get empty calculated cells."""
+        if self.virtual: # Only the rows in view are Tk items, reload them from the ledger
+            self.treeview.refresh(reload=True)
+            return
+
+        columns = self.treeview["columns"]
+
+        for row in changed:
+            # One Tcl call per trade instead of reading every row and setting each column
+            self.treeview.item(self.ledger.iids[row], values=self.ledger.row_tuple(row, columns))
+
+
+def print_traceback():
+    """Print the exception being handled. traceback is slow to import, so it is imported on the first error."""
+    import traceback
+    print(traceback.format_exc())
 
 
 if __name__ == "__main__":
 
-    app = TradeTracker("My Trade Tracker App")
+    # --startup-profile prints import and construction times per component once the last ledger is reopened
+    with startup_profile.measure("TradeTracker"):
+        app = TradeTracker("My Trade Tracker App", virtual="--virtual" in sys.argv)
 
     app.mainloop()
@@ -1,3 +1,10 @@
+from array import array
+from itertools import repeat
+
+
+DEFAULT_RISK_PERCENTAGE = 2.0 # Percentage of the account that may be lost in a day
+
+
 def get_max_risk_per_day(risk_percentage: float, account_size: float) -> float:
     """Return the maximum dollar risk per day."""
     return risk_percentage / 100 * account_size
@@ -7,17 +14,50 @@ def get_max_risk_per_trade(max_risk_per_day: float) -> float:
     return max_risk_per_day / 2
 
 def get_max_shares_per_trade(account_size: float, share_price: float, stop_price: float, max_dollar_risk_per_trade: float) -> int:
-    """Return the maximum purchasable shares allowed per trade."""
-    max_purchasable_shares = account_size / share_price
-    calculated_shares_to_buy = account_size / (share_price - stop_price)
-    return calculated_shares_to_buy if calculated_shares_to_buy < max_purchasable_shares else max_purchasable_shares
-
-
-max_risk_percentage = 2.0
-account_size = 1500
-share_price = 8.57
-stop_price = 8.50
-max_dollar_risk_per_day = get_max_risk_per_day(max_risk_percentage, account_size)
-max_dollar_risk_per_trade = get_max_risk_per_trade(max_dollar_risk_per_day)
-max_shares_per_trade = round(get_max_shares_per_trade(account_size, share_price, stop_price, max_dollar_risk_per_trade))
-print(f"Max Shares Per Trade: {max_shares_per_trade}")
+    """Return the maximum purchasable shares allowed per trade.
+
+    That is the shares whose loss at the stop price stays within max_dollar_risk_per_trade, limited to the shares the
+    account can buy. Amounts are compared in whole cents, so float error never rounds a size up or down.
+    """
+    price = round(share_price * 100)
+    if price <= 0:
+        return 0
+
+    max_purchasable_shares = round(account_size * 100) // price
+    risk_per_share = abs(price - round(stop_price * 100))
+    if risk_per_share == 0:
+        return max_purchasable_shares
+
+    return min(round(max_dollar_risk_per_trade * 100) // risk_per_share, max_purchasable_shares)
+
+def get_max_shares_batch(share_prices, stop_prices, account_sizes, risk_percentage: float=DEFAULT_RISK_PERCENTAGE) -> array:
+    """Return the maximum shares per trade of many scenarios at once, as an int64 array.
+
+    share_prices, stop_prices and account_sizes are sequences of the same length, element i describing scenario i.
+    account_sizes can also be a single number shared by every scenario.
+    """
+    if isinstance(account_sizes, (int, float)):
+        account_sizes = repeat(account_sizes)
+
+    def max_shares(share_price, stop_price, account_size):
+        max_dollar_risk_per_trade = get_max_risk_per_trade(get_max_risk_per_day(risk_percentage, account_size))
+        return get_max_shares_per_trade(account_size, share_price, stop_price, max_dollar_risk_per_trade)
+
+    return array("q", map(max_shares, share_prices, stop_prices, account_sizes))
+
+
+if __name__ == "__main__":
+
+    max_risk_percentage = 2.0
+    account_size = 1500
+    share_price = 8.57
+    stop_price = 8.50
+    max_dollar_risk_per_day = get_max_risk_per_day(max_risk_percentage, account_size)
+    max_dollar_risk_per_trade = get_max_risk_per_trade(max_dollar_risk_per_day)
+    max_shares_per_trade = get_max_shares_per_trade(account_size, share_price, stop_price, max_dollar_risk_per_trade)
+    print(f"Max Shares Per Trade: {max_shares_per_trade}")
+
+    # Risk grid: maximum shares for stops 1 to 10 cents below a range of prices
+    prices = [price / 100 for price in range(800, 900, 10) for _ in range(10)]
+    stops = [price - cents / 100 for price, cents in zip(prices, list(range(1, 11)) * 10)]
+    print(list(get_max_shares_batch(prices, stops, account_size, max_risk_percentage)))